@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+"""
+HTTP API around the dubbing pipeline, used by the Next.js frontend.
+
+Uploads are resumable and chunked (tus-style offsets): the client creates a
+job, then PATCHes the file in chunks at the offset the server reports, and
+can ask for that offset again after a dropped connection. Once the last
+chunk arrives the job runs in the background (stages go through
+`utils.pipeline.dispatch`, so PIPELINE_QUEUE moves them onto workers), its
+progress is pushed as Server-Sent Events, and the result is served with
+Range support.
+
+    POST  /api/jobs                 {"filename", "size", "source_lang", "target_lang",
+                                     "lip_sync", "voice_id", "model_id", "tts_backend"}
+    GET   /api/jobs/<id>            status, upload offset and per-stage state
+    PATCH /api/jobs/<id>/upload     next chunk; "Upload-Offset" header must match
+    POST  /api/jobs/<id>/start      rerun a failed or interrupted job
+    GET   /api/jobs/<id>/events     SSE: stage, progress, queue, done, error
+    GET   /api/jobs/<id>/result     dubbed video (Range requests supported)
+
+    python api.py --port 8000
+"""
+import argparse
+import contextlib
+import hmac
+import json
+import os
+import re
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import utils.artifact_store as artifact_store
+import utils.jobs as jobs
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+HOST = _settings.api_host
+PORT = _settings.api_port
+CORS_ORIGINS = [o.strip() for o in _settings.api_cors_origins.split(",") if o.strip()]
+# When set, requests need "Authorization: Bearer <token>" or ?token=<token>
+# (server-side clients) or a dashboard session cookie (the browser frontend)
+API_TOKEN = _settings.api_token
+CHUNK_SIZE = int(_settings.api_chunk_mb * (1 << 20))
+MAX_UPLOAD_BYTES = int(_settings.api_max_upload_mb * (1 << 20))
+JOB_WORKERS = _settings.api_job_workers
+SSE_KEEPALIVE_SECONDS = 15
+
+VIDEO_EXTENSIONS = (".mp4", ".mov")
+API_STAGES = ["extract", "transcribe", "translate", "tts", "video"]
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="api-job")
+_running = set()
+_running_lock = threading.Lock()
+_upload_locks = {}
+
+
+class JobEvents:
+    """
+    In-memory event log of one job, replayable from any event id.
+
+    Consecutive progress events of the same stage replace each other, so a
+    late subscriber gets the current state rather than every lip-sync batch.
+    The log is dropped once its job has finished and nobody is subscribed.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.seq = 0
+        self.cond = threading.Condition()
+        self.subscribers = 0
+        self.finished = False
+
+    def publish(self, event, data):
+        with self.cond:
+            self.seq += 1
+            last = self.events[-1] if self.events else None
+            if (
+                event == "progress"
+                and last is not None
+                and last[1] == "progress"
+                and last[2].get("stage") == data.get("stage")
+            ):
+                self.events.pop()
+            self.events.append((self.seq, event, data))
+            self.cond.notify_all()
+
+    def since(self, last_id, timeout):
+        """Events after `last_id`, waiting up to `timeout` seconds for one."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > last_id, timeout=timeout)
+            return [e for e in self.events if e[0] > last_id]
+
+
+_events = {}
+_events_lock = threading.Lock()
+
+
+def job_events(job_id):
+    with _events_lock:
+        return _events.setdefault(job_id, JobEvents())
+
+
+@contextlib.contextmanager
+def subscribed(job_id):
+    """The job's event log, kept alive while the caller streams it."""
+    with _events_lock:
+        events = _events.setdefault(job_id, JobEvents())
+        events.subscribers += 1
+    try:
+        yield events
+    finally:
+        with _events_lock:
+            events.subscribers -= 1
+        _prune_events(job_id, events)
+
+
+def finish_events(job_id, events):
+    """Mark a job's log complete unless it is running; it is freed once no subscriber is left."""
+    with _running_lock:
+        if job_id in _running:
+            return
+        events.finished = True
+    _prune_events(job_id, events)
+
+
+def _prune_events(job_id, events):
+    with _events_lock:
+        if events.finished and not events.subscribers and _events.get(job_id) is events:
+            del _events[job_id]
+
+
+def _upload_lock(job_id):
+    with _events_lock:
+        return _upload_locks.setdefault(job_id, threading.Lock())
+
+
+def _drop_upload_lock(job_id):
+    with _events_lock:
+        _upload_locks.pop(job_id, None)
+
+
+def _part_path(job):
+    return jobs.job_path(job, "input" + job["state"]["api"]["ext"] + ".part")
+
+
+def upload_offset(job):
+    """Bytes of the upload received so far."""
+    if jobs.stage_done(job, "upload"):
+        return job["state"]["api"]["size"]
+    path = _part_path(job)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def job_status(job):
+    api = job["state"].get("api", {})
+    with _running_lock:
+        running = job["id"] in _running
+    if api.get("result"):
+        status = "done"
+    elif running:
+        status = "running"
+    elif api.get("error"):
+        status = "failed"
+    elif not jobs.stage_done(job, "upload"):
+        status = "uploading"
+    else:
+        status = "interrupted"
+    return {
+        "job_id": job["id"],
+        "status": status,
+        "filename": job["source_name"],
+        "size": api.get("size"),
+        "offset": upload_offset(job),
+        "chunk_size": CHUNK_SIZE,
+        "stages": {s: job["stages"].get(s, {}).get("status") for s in API_STAGES},
+        "error": api.get("error"),
+        "has_result": bool(api.get("result")),
+    }
+
+
+def create_job(spec):
+    """Create a job awaiting its upload; raises ValueError on a bad request."""
+    filename = os.path.basename(str(spec.get("filename") or ""))
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in VIDEO_EXTENSIONS:
+        raise ValueError(f"Unsupported file type {ext or '(none)'}; upload MP4 or MOV.")
+    try:
+        size = int(spec["size"])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("'size' (bytes) is required.")
+    if not 0 < size <= MAX_UPLOAD_BYTES:
+        raise ValueError(f"File size must be between 1 byte and {MAX_UPLOAD_BYTES >> 20} MB.")
+    job = jobs.create_job(filename)
+    job["state"]["api"] = {
+        "ext": ext,
+        "size": size,
+        "source_lang": spec.get("source_lang") or "en",
+        "target_lang": spec.get("target_lang") or "hi",
+        "lip_sync": bool(spec.get("lip_sync", True)),
+        "voice_id": spec.get("voice_id") or "21m00Tcm4TlvDq8ikWAM",
+        "model_id": spec.get("model_id") or "eleven_multilingual_v2",
+        "tts_backend": spec.get("tts_backend"),
+    }
+    jobs.start_stage(job, "upload", size=size)
+    return job
+
+
+def append_chunk(job, offset, stream, length):
+    """
+    Append `length` bytes from `stream` at `offset`. Returns the new offset.
+    A chunk at the wrong offset raises ValueError (the client re-syncs).
+    """
+    with _upload_lock(job["id"]):
+        current = upload_offset(job)
+        if offset != current:
+            raise ValueError(f"Upload-Offset {offset} does not match server offset {current}.")
+        size = job["state"]["api"]["size"]
+        if current + length > size:
+            raise ValueError(f"Chunk overruns the declared size of {size} bytes.")
+        part = _part_path(job)
+        written = 0
+        try:
+            with open(part, "ab") as f:
+                while written < length:
+                    data = stream.read(min(1 << 20, length - written))
+                    if not data:
+                        break
+                    f.write(data)
+                    written += len(data)
+        finally:
+            if written < length:
+                # Keep only whole chunks so the client can resume cleanly
+                with open(part, "ab") as f:
+                    f.truncate(current)
+        if written < length:
+            raise ConnectionError("Upload interrupted mid-chunk.")
+        if current + length == size:
+            video = jobs.job_path(job, "input" + job["state"]["api"]["ext"])
+            os.replace(part, video)
+            jobs.complete_stage(job, "upload", artifacts={"video": video})
+    if current + length == size:
+        # Later chunks are refused as "already complete" before taking the lock
+        _drop_upload_lock(job["id"])
+    return current + length
+
+
+def start_job(job):
+    """Run the pipeline for `job` in the background (no-op if already running)."""
+    with _running_lock:
+        if job["id"] in _running:
+            return False
+        _running.add(job["id"])
+    job["state"]["api"].pop("error", None)
+    jobs.save_job(job)
+    _executor.submit(_run_job, job["id"])
+    return True
+
+
+def _run_job(job_id):
+    events = job_events(job_id)
+    events.finished = False
+    try:
+        result = run_pipeline(jobs.load_job(job_id), events.publish)
+        events.publish("done", {"job_id": job_id, "result": result})
+    except Exception as e:
+        traceback.print_exc()
+        job = jobs.load_job(job_id)
+        job["state"]["api"]["error"] = str(e)
+        jobs.save_job(job)
+        events.publish("error", {"job_id": job_id, "message": str(e)})
+    finally:
+        with _running_lock:
+            _running.discard(job_id)
+        finish_events(job_id, events)
+
+
+def run_pipeline(job, publish):
+    """
+    Dub an uploaded video, skipping stages that already finished (so a
+    restarted job resumes). `publish(event, data)` receives stage, queue and
+    progress events. Returns the result's artifact ref.
+    """
+    import utils.pipeline as pipeline
+    import utils.redub as redub
+
+    opts = job["state"]["api"]
+    video = job["stages"]["upload"]["artifacts"]["video"]
+
+    def begin(stage):
+        jobs.start_stage(job, stage)
+        publish("stage", {"stage": stage, "status": "running"})
+
+    def finish(stage, artifacts=None, **state):
+        jobs.complete_stage(job, stage, artifacts=artifacts, **state)
+        publish("stage", {"stage": stage, "status": "done"})
+
+    def on_wait(position):
+        publish("queue", {"position": position})
+
+    if not jobs.stage_done(job, "extract"):
+        begin("extract")
+        audio = pipeline.dispatch(
+            "extract", {"video": video}, work_dir=jobs.stage_dir(job, "extract")
+        )["files"]["audio"]
+        finish("extract", artifacts={"audio": audio})
+    audio = job["stages"]["extract"]["artifacts"]["audio"]
+
+    if not jobs.stage_done(job, "transcribe"):
+        begin("transcribe")
+        result = pipeline.dispatch("transcribe", {"audio": audio}, on_wait=on_wait)
+        finish("transcribe", transcript=result["data"]["text"], asr_stats=result["data"]["stats"])
+
+    if not jobs.stage_done(job, "translate"):
+        begin("translate")
+
+        def translate_batch(texts):
+            return pipeline.dispatch(
+                "translate",
+                params={
+                    "texts": texts,
+                    "source_lang": opts["source_lang"],
+                    "target_lang": opts["target_lang"],
+                },
+                on_wait=on_wait,
+            )["data"]["texts"]
+
+        segments = redub.build_segments(job["state"]["transcript"], translate_batch)
+        finish("translate", segments=segments)
+
+    if not jobs.stage_done(job, "tts"):
+        begin("tts")
+        work_dir = jobs.stage_dir(job, "tts")
+        segments = job["state"]["segments"]
+        total = len(segments)
+
+        tts_stats = {}
+
+        def synth(texts, voice_id, model_id):
+            return pipeline.synthesize_clips(
+                texts,
+                voice_id,
+                model_id,
+                backend=opts.get("tts_backend"),
+                work_dir=work_dir,
+                on_wait=on_wait,
+                stats=tts_stats,
+            )
+
+        def on_segment(seg):
+            # Checkpoint each clip so a restart only re-synthesizes the rest
+            jobs.save_job(job)
+            done = sum(1 for s in segments if s["clip"])
+            publish("progress", {"stage": "tts", "done": done, "total": total})
+
+        redub.synthesize_segments(
+            segments, synth, opts["voice_id"], opts["model_id"],
+            work_dir=work_dir, on_segment=on_segment,
+        )
+        dub_audio = redub.build_dub_audio(segments, work_dir=work_dir)
+        finish("tts", artifacts={"audio": dub_audio}, segments=segments, tts_stats=tts_stats)
+    dub_audio = job["stages"]["tts"]["artifacts"]["audio"]
+
+    if not jobs.stage_done(job, "video"):
+        begin("video")
+        work_dir = jobs.stage_dir(job, "video")
+        inputs = {"video": video, "audio": dub_audio}
+        if opts["lip_sync"]:
+            output = pipeline.dispatch(
+                "lipsync",
+                inputs,
+                work_dir=work_dir,
+                on_wait=on_wait,
+                on_progress=lambda info: publish("progress", info),
+            )["files"]["video"]
+        else:
+            output = pipeline.dispatch("mux", inputs, work_dir=work_dir)["files"]["video"]
+        finish("video", artifacts={"video": output})
+    output = job["stages"]["video"]["artifacts"]["video"]
+
+    ref = artifact_store.put(output, name=f"dubbed_{os.path.splitext(job['source_name'])[0]}.mp4")
+    opts["result"] = ref
+    jobs.save_job(job)
+    return ref
+
+
+_sessions = None
+
+
+def _session_valid(token):
+    global _sessions
+    if _sessions is None:
+        import utils.auth_sessions as auth_sessions
+
+        # Validating the dashboard's cookie only needs the shared secret
+        _sessions = auth_sessions.AuthSessions(None)
+    return _sessions.validate_session(token) is not None
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "DubbingAPI/1.0"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # -- helpers -----------------------------------------------------------
+
+    def _cors_headers(self):
+        origin = self.headers.get("Origin")
+        if not origin or (origin not in CORS_ORIGINS and "*" not in CORS_ORIGINS):
+            return {}
+        return {
+            "Access-Control-Allow-Origin": origin,
+            "Access-Control-Allow-Credentials": "true",
+            "Access-Control-Expose-Headers": "Upload-Offset, Content-Range, Accept-Ranges",
+            "Vary": "Origin",
+        }
+
+    def _cors(self):
+        for key, value in self._cors_headers().items():
+            self.send_header(key, value)
+
+    def _json(self, code, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(code)
+        self._cors()
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        if self.close_connection:
+            self.send_header("Connection", "close")
+        if "offset" in body:
+            self.send_header("Upload-Offset", str(body["offset"]))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, code, message):
+        if self.headers.get("Content-Length", "0") != "0" or "Transfer-Encoding" in self.headers:
+            # The body may be unread (e.g. a rejected chunk); on keep-alive it
+            # would be parsed as the next request, so close instead
+            self.close_connection = True
+        self._json(code, {"error": message})
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > 1 << 20:
+            raise ValueError("Request body too large.")
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            raise ValueError("Request body must be JSON.")
+
+    def _authorized(self, query):
+        if not API_TOKEN:
+            return True
+        header = self.headers.get("Authorization", "")
+        if header.startswith("Bearer ") and hmac.compare_digest(
+            header[len("Bearer "):].encode(), API_TOKEN.encode()
+        ):
+            return True
+        token = query.get("token", [""])[0]
+        if token and hmac.compare_digest(token.encode(), API_TOKEN.encode()):
+            return True
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        return "session" in cookie and _session_valid(cookie["session"].value)
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if method == "OPTIONS":
+            return self._preflight()
+        if not self._authorized(query):
+            return self._error(401, "Missing or invalid API token.")
+        m = re.fullmatch(r"/api/jobs(?:/([0-9a-f]{12})(?:/(upload|start|events|result))?)?/?", url.path)
+        if not m:
+            return self._error(404, "Not found.")
+        job_id, action = m.groups()
+        if job_id is None:
+            if method != "POST":
+                return self._error(405, "Use POST to create a job.")
+            return self._create()
+        job = jobs.load_job(job_id)
+        if job is None or "api" not in job["state"]:
+            return self._error(404, f"Unknown job {job_id}.")
+        handlers = {
+            (None, "GET"): lambda: self._json(200, job_status(job)),
+            ("upload", "PATCH"): lambda: self._upload(job),
+            ("upload", "HEAD"): lambda: self._upload_head(job),
+            ("start", "POST"): lambda: self._start(job),
+            ("events", "GET"): lambda: self._stream_events(job, query),
+            ("result", "GET"): lambda: self._result(job, body=True),
+            ("result", "HEAD"): lambda: self._result(job, body=False),
+        }
+        handler = handlers.get((action, method))
+        if handler is None:
+            return self._error(405, "Method not allowed.")
+        return handler()
+
+    # -- endpoints ---------------------------------------------------------
+
+    def _preflight(self):
+        self.send_response(204)
+        self._cors()
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD, POST, PATCH, OPTIONS")
+        self.send_header(
+            "Access-Control-Allow-Headers",
+            "Authorization, Content-Type, Upload-Offset, Range, Last-Event-ID",
+        )
+        self.send_header("Access-Control-Max-Age", "600")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _create(self):
+        try:
+            job = create_job(self._read_json())
+        except ValueError as e:
+            return self._error(400, str(e))
+        self._json(201, job_status(job))
+
+    def _upload_head(self, job):
+        self.send_response(200)
+        self._cors()
+        self.send_header("Upload-Offset", str(upload_offset(job)))
+        self.send_header("Upload-Length", str(job["state"]["api"]["size"]))
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _upload(self, job):
+        if jobs.stage_done(job, "upload"):
+            return self._error(409, "Upload already complete.")
+        try:
+            offset = int(self.headers["Upload-Offset"])
+            length = int(self.headers["Content-Length"])
+        except (KeyError, TypeError, ValueError):
+            return self._error(400, "Upload-Offset and Content-Length headers are required.")
+        if length > CHUNK_SIZE * 2:
+            return self._error(413, f"Chunks may be at most {CHUNK_SIZE * 2} bytes.")
+        try:
+            append_chunk(job, offset, self.rfile, length)
+        except (ValueError, ConnectionError) as e:
+            # 409: offsets disagree; 400: the body ended early (partial chunk discarded).
+            # Either way the client resumes from the Upload-Offset sent back.
+            self.close_connection = True
+            body = job_status(jobs.load_job(job["id"]))
+            body["error"] = str(e)
+            return self._json(409 if isinstance(e, ValueError) else 400, body)
+        job = jobs.load_job(job["id"])
+        if jobs.stage_done(job, "upload"):
+            start_job(job)
+        self._json(200, job_status(job))
+
+    def _start(self, job):
+        if not jobs.stage_done(job, "upload"):
+            return self._error(409, "Upload is not complete yet.")
+        start_job(job)
+        self._json(202, job_status(jobs.load_job(job["id"])))
+
+    def _stream_events(self, job, query):
+        last_id = self.headers.get("Last-Event-ID") or query.get("last_event_id", [0])[0]
+        try:
+            last_id = int(last_id)
+        except ValueError:
+            last_id = 0
+        self.send_response(200)
+        self._cors()
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("X-Accel-Buffering", "no")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(event, data, event_id=None):
+            lines = f"event: {event}\ndata: {json.dumps(data)}\n"
+            if event_id is not None:
+                lines = f"id: {event_id}\n" + lines
+            self.wfile.write((lines + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+        with subscribed(job["id"]) as events:
+            if last_id > events.seq:
+                last_id = 0  # the API restarted or freed the log; it starts over
+            try:
+                # Current state first, so a (re)connecting client never has to guess
+                status = job_status(jobs.load_job(job["id"]))
+                send("status", status)
+                if status["status"] in ("done", "failed"):
+                    finish_events(job["id"], events)
+                    if last_id >= events.seq:
+                        return
+                while True:
+                    pending = events.since(last_id, SSE_KEEPALIVE_SECONDS)
+                    if not pending:
+                        self.wfile.write(b": keepalive\n\n")
+                        self.wfile.flush()
+                        continue
+                    for event_id, event, data in pending:
+                        send(event, data, event_id)
+                        last_id = event_id
+                        if event in ("done", "error"):
+                            return
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def _result(self, job, body):
+        ref = job["state"]["api"].get("result")
+        if not ref:
+            return self._error(404, "No result yet.")
+        try:
+            path = artifact_store.path_for(ref)
+        except ValueError as e:
+            return self._error(410, str(e))
+        artifact_store.send_file(
+            self, path, artifact_store.metadata(ref)["name"], body, headers=self._cors_headers()
+        )
+
+    def do_OPTIONS(self):
+        self._route("OPTIONS")
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_HEAD(self):
+        self._route("HEAD")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PATCH(self):
+        self._route("PATCH")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dubbing pipeline HTTP API")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args()
+    if not API_TOKEN:
+        print("[api] API_TOKEN is not set; the API accepts unauthenticated requests")
+    server = ThreadingHTTPServer((args.host, args.port), ApiHandler)
+    server.daemon_threads = True
+    print(f"[api] serving on {args.host}:{args.port} (CORS: {', '.join(CORS_ORIGINS)})")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,12 @@
 import streamlit as st
 import os
+from utils.settings import get_settings
+
+# Load .env once, before any module reads its configuration
+get_settings()
+
 import utils.firebase_utils as firebase
-from views import dashboard
+import utils.auth_sessions as auth_sessions
 import firebase_config
 
 # Set page configuration ONCE here
@@ -36,7 +41,7 @@ def login_page():
         return
 
     # Check for missing Service Account
-    if not os.path.exists("serviceAccountKey.json"):
+    if not firebase.auth_emulator_host and not os.path.exists("serviceAccountKey.json"):
         st.warning("⚠️ **Firebase Service Account Missing!**")
         st.info("Please save your `serviceAccountKey.json` in the project root.")
         return
@@ -57,22 +62,17 @@ def login_page():
                     # 1. Generate OTP
                     otp_code = otp_service.generate_otp()
 
-                    # 2. Send via SMTP
-                    success, msg = otp_service.send_otp_email(email, otp_code)
-
-                    if success:
-                        st.session_state.otp_sent = True
-                        st.session_state.temp_email = email
-                        st.session_state.temp_otp = (
-                            otp_code  # Store securely in session
-                        )
-                        st.success(f"OTP sent to {email}!")
-                        st.rerun()
-                    else:
-                        st.error(f"Error sending OTP: {msg}")
+                    # 2. Queue for background SMTP delivery (returns immediately)
+                    st.session_state.otp_message_id = otp_service.queue_otp_email(
+                        email, otp_code
+                    )
+                    st.session_state.otp_sent = True
+                    st.session_state.temp_email = email
+                    st.session_state.temp_otp = otp_code  # Store securely in session
+                    st.rerun()
     else:
         # Step 2: OTP Verification
-        st.info(f"OTP sent to {st.session_state.temp_email}")
+        otp_delivery_notice(st.session_state.get("otp_message_id"), st.session_state.temp_email)
 
         with st.form("otp_form"):
             otp_input = st.text_input("Enter the 6-digit OTP")
@@ -84,12 +84,13 @@ def login_page():
                     email = st.session_state.temp_email
 
                     with st.spinner("Verifying with Firebase..."):
-                        # 2. Get/Create User in Firebase
+                        # 2. Get/Create User in Firebase (cached per email)
                         try:
-                            user = firebase.get_or_create_user(email)
+                            sessions = auth_sessions.get_sessions()
+                            uid = sessions.get_uid(email)
 
-                            # 3. Mint Custom Token
-                            custom_token = firebase.mint_custom_token(user.uid)
+                            # 3. Mint Custom Token (signed locally, reused while valid)
+                            custom_token = sessions.custom_token(uid)
 
                             if custom_token:
                                 st.session_state.authenticated = True
@@ -98,18 +99,19 @@ def login_page():
                                     custom_token  # Pass to JS
                                 )
 
-                                # Set Persistent Cookie (30 Days)
+                                # Set Persistent signed session cookie
                                 cookie_manager.set(
-                                    "user_email",
-                                    email,
+                                    "session",
+                                    sessions.issue_session(email, uid),
                                     expires_at=datetime.datetime.now()
-                                    + datetime.timedelta(days=30),
+                                    + datetime.timedelta(days=auth_sessions.SESSION_DAYS),
                                 )
 
                                 # Clear temp
                                 del st.session_state.otp_sent
                                 del st.session_state.temp_email
                                 del st.session_state.temp_otp
+                                st.session_state.pop("otp_message_id", None)
 
                                 st.success("Verification Successful! Logging in...")
                                 st.rerun()
@@ -127,6 +129,18 @@ def login_page():
             st.rerun()
 
 
+@st.fragment(run_every=2)
+def otp_delivery_notice(message_id, email):
+    # Polls on its own so "Sending..." turns into "sent" (or the error) without a rerun
+    delivery = otp_service.delivery_status(message_id)
+    if delivery["state"] == "failed":
+        st.error(f"Error sending OTP: {delivery['error']}")
+    elif delivery["state"] == "queued":
+        st.info(f"Sending OTP to {email}...")
+    else:
+        st.info(f"OTP sent to {email}")
+
+
 # Client-Side Auto-Login Helper
 def client_side_auth_sync():
     # If we have a custom token to consume (just logged in)
@@ -164,10 +178,13 @@ def main():
     if not st.session_state.authenticated and not st.session_state.get(
         "logging_out", False
     ):
-        cached_email = cookie_manager.get(cookie="user_email")
-        if cached_email:
+        # The cookie is HMAC-signed; it is validated locally without Firebase
+        session = auth_sessions.get_sessions().validate_session(
+            cookie_manager.get(cookie="session")
+        )
+        if session:
             st.session_state.authenticated = True
-            st.session_state.user_email = cached_email
+            st.session_state.user_email = session["email"]
 
     # Reset logout flag if it was set
     if st.session_state.get("logging_out", False):
@@ -183,16 +200,28 @@ def main():
         with st.sidebar:
             st.markdown("---")
             st.write(f"Logged in as: {st.session_state.user_email}")
+            email_stats = otp_service.email_stats()
+            if email_stats:
+                st.caption(
+                    f"OTP email: {email_stats['sent']} sent, {email_stats['failed']} failed, "
+                    f"{email_stats['queue_depth']} queued (p95 {email_stats['latency_p95']:.1f}s)"
+                )
             if st.button("Logout", type="secondary"):
                 st.session_state.authenticated = False
                 st.session_state.user_email = None
                 st.session_state.logging_out = True
-                cookie_manager.delete("user_email")
+                # Revoke server-side too, so a copy of the cookie is useless
+                auth_sessions.get_sessions().revoke_session(cookie_manager.get(cookie="session"))
+                cookie_manager.delete("session")
                 # Do NOT rerun immediately. Let the component execute the delete JS.
                 # The script will continue, show the Login Page (since auth is False), and then stop.
                 # Adding a small hint for user feedback
                 st.info("Logging out...")
 
+        # Imported on first use so the login page never pays for the
+        # dashboard's pipeline dependencies
+        from views import dashboard
+
         dashboard.show_dashboard()
 
 
@@ -1,82 +1,295 @@
 #!/usr/bin/env python3
 """
 Script to download Wav2Lip models and dependencies
+
+Installs the models listed in model_manifest.json concurrently. HTTP downloads
+resume from a `.part` file via Range requests, every file is SHA-256 checked
+before it is moved into place, and installed models are recorded in the
+model registry (models/registry.json) that the pipeline reads at startup.
+
+A model is pinned by its full `sha256` or, where the upstream file name
+carries one, a `sha256_prefix`. Required models without either are refused
+unless --trust (or --pin, which also writes their hashes into the manifest)
+accepts them on first download; optional ones are trusted with a warning.
+
+    python download_models.py                      # required models
+    python download_models.py --pin                # first install: record digests
+    python download_models.py --only wav2lip_gan whisper-small
+    python download_models.py --mirror /mnt/models.tar.gz
 """
+import argparse
+import json
 import os
+import shutil
+import sys
+import tarfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
-from pathlib import Path
+
+import utils.model_registry as registry
 
 try:
     import gdown
 except ImportError:
     gdown = None
 
+CHUNK_SIZE = 1 << 20
+HTTP_RETRIES = 5
 
 
-def download_file(url, destination):
-    """Download a file from URL to destination"""
-    print(f"Downloading {url} to {destination}")
-    response = requests.get(url, stream=True)
-    response.raise_for_status()
+class IncompleteDownload(requests.RequestException):
+    """The server closed the stream before the advertised length arrived."""
 
-    with open(destination, "wb") as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
-    print(f"Downloaded {destination}")
 
+def _expected_size(response, have):
+    """Full file size the server advertised (Content-Range, else Content-Length), or None."""
+    content_range = response.headers.get("Content-Range", "")
+    total = content_range.rpartition("/")[2]
+    if total.isdigit():
+        return int(total)
+    length = response.headers.get("Content-Length", "")
+    # A compressed body's length says nothing about the decoded file
+    if length.isdigit() and response.headers.get("Content-Encoding", "identity") == "identity":
+        return int(length) + (have if response.status_code == 206 else 0)
+    return None
 
-def main():
-    # Create directories
-    os.makedirs("wav2lip/checkpoints", exist_ok=True)
-    os.makedirs("wav2lip/face_detection/detection/sfd", exist_ok=True)
 
-    # Download face detection model
-    face_detect_path = "wav2lip/face_detection/detection/sfd/s3fd.pth"
-    if not os.path.exists(face_detect_path):
-        try:
-            download_file(
-                "https://www.adrianbulat.com/downloads/python-fan/s3fd-619a316812.pth",
-                face_detect_path,
-            )
-        except:
-            # Fallback URL
-            download_file(
-                "https://iiitaphyd-my.sharepoint.com/:u:/g/personal/prajwal_k_research_iiit_ac_in/EZsy6qWuivtDnANIG73iHjIBjMSoojcIV0NULXV-yiuiIg?e=qTasa8/download=1",
-                face_detect_path,
-            )
-
-    # Download Wav2Lip models using gdown
-    # Main Wav2Lip model (highly accurate lip-sync)
-    wav2lip_path = "wav2lip/checkpoints/wav2lip.pth"
-    if not os.path.exists(wav2lip_path):
+def download_file(url, part_path):
+    """
+    Download `url` into `part_path`, resuming whatever is already there.
+
+    The result must match the size the server advertised, so a truncated
+    stream is resumed rather than trusted (unpinned models are hashed on
+    first use, so a short file would otherwise be recorded as good).
+    """
+    for attempt in range(HTTP_RETRIES):
+        have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {"Range": f"bytes={have}-"} if have else {}
         try:
-            print("Downloading Wav2Lip model...")
-            if gdown is None:
-                raise ImportError("gdown is not installed. Install with: pip install gdown or pip install -r requirements.txt")
-            gdown.download(
-                "https://drive.google.com/uc?id=1IjFW1cLevs6Ouyu4Yht4mnR4yeuMqO7Y",
-                wav2lip_path,
-                quiet=False,
-            )
-        except Exception as e:
-            print(f"Wav2Lip model download failed: {e}")
+            with requests.get(url, stream=True, headers=headers, timeout=(10, 60)) as r:
+                if r.status_code == 416:
+                    # Only "already complete" if the server's size is what we hold
+                    if _expected_size(r, have) == have:
+                        return
+                    os.unlink(part_path)
+                    raise IncompleteDownload(f"{part_path} does not match the remote file; restarting")
+                r.raise_for_status()
+                expected = _expected_size(r, have)
+                # 206: server honoured the range; 200: it restarted from zero
+                mode = "ab" if have and r.status_code == 206 else "wb"
+                with open(part_path, mode) as f:
+                    for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+            got = os.path.getsize(part_path)
+            if expected is not None and got != expected:
+                raise IncompleteDownload(f"got {got} of {expected} bytes")
+            return
+        except requests.RequestException as e:
+            if attempt == HTTP_RETRIES - 1:
+                raise
+            wait = 2**attempt
+            print(f"  {url}: {e}; resuming in {wait}s")
+            time.sleep(wait)
+
+
+def download_gdrive(file_id, part_path):
+    if gdown is None:
+        raise ImportError("gdown is not installed. Install with: pip install gdown or pip install -r requirements.txt")
+    result = gdown.download(id=file_id, output=part_path, quiet=True, resume=True)
+    if result is None:
+        raise RuntimeError(f"Google Drive download of {file_id} failed")
+
+
+def download_hf(repo_id, part_dir):
+    from huggingface_hub import snapshot_download
+
+    snapshot_download(repo_id, local_dir=part_dir)
+    shutil.rmtree(os.path.join(part_dir, ".cache"), ignore_errors=True)
+
+
+def _member_name(member):
+    name = member.name
+    return name[2:] if name.startswith("./") else name
+
+
+def copy_from_mirror(mirror, rel_path, part_path):
+    """Copy `rel_path` (matched by relative path, then basename) out of a mirror dir or tarball."""
+    base = os.path.basename(rel_path)
+    if os.path.isdir(mirror):
+        for candidate in (os.path.join(mirror, rel_path), os.path.join(mirror, base)):
+            if os.path.exists(candidate):
+                if os.path.isdir(candidate):
+                    shutil.copytree(candidate, part_path)
+                else:
+                    shutil.copyfile(candidate, part_path)
+                return
+        raise FileNotFoundError(f"{rel_path} not found in mirror {mirror}")
 
-    # Wav2Lip + GAN model (better visual quality)
-    wav2lip_gan_path = "wav2lip/checkpoints/wav2lip_gan.pth"
-    if not os.path.exists(wav2lip_gan_path):
+    with tarfile.open(mirror) as tar:
+        members = [(m, _member_name(m)) for m in tar.getmembers() if m.isfile()]
+        for wanted in (rel_path, base):
+            if any(name == wanted for _, name in members):
+                member = next(m for m, name in members if name == wanted)
+                with tar.extractfile(member) as src, open(part_path, "wb") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                return
+            inside = [(m, name) for m, name in members if name.startswith(wanted + "/")]
+            if inside:
+                root = os.path.realpath(part_path)
+                for m, name in inside:
+                    dest = os.path.realpath(os.path.join(root, os.path.relpath(name, wanted)))
+                    # A crafted member name ("..", absolute) must not escape the model dir
+                    if os.path.commonpath([root, dest]) != root:
+                        raise ValueError(f"unsafe path in mirror {mirror}: {m.name}")
+                    os.makedirs(os.path.dirname(dest), exist_ok=True)
+                    with tar.extractfile(m) as src, open(dest, "wb") as dst:
+                        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                return
+    raise FileNotFoundError(f"{rel_path} not found in mirror {mirror}")
+
+
+def fetch(source, spec, part_path):
+    if source.startswith("mirror:"):
+        copy_from_mirror(source[len("mirror:"):], spec["path"], part_path)
+    elif source.startswith("gdrive:"):
+        download_gdrive(source[len("gdrive:"):], part_path)
+    elif source.startswith("hf:"):
+        download_hf(source[len("hf:"):], part_path)
+    else:
+        download_file(source, part_path)
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.unlink(path)
+
+
+def is_pinned(spec):
+    return bool(spec.get("sha256") or spec.get("sha256_prefix"))
+
+
+def matches_pin(spec, digest):
+    """True if `digest` satisfies the model's pinned checksum (or nothing is pinned)."""
+    if spec.get("sha256"):
+        return digest == spec["sha256"]
+    return digest.startswith(spec.get("sha256_prefix") or "")
+
+
+def install(name, spec, mirror=None, force=False):
+    """Install one model; returns (sha256, source). Raises if every source fails."""
+    dest = registry.abs_path(spec["path"])
+
+    if os.path.exists(dest) and not force:
+        entry = registry.load_registry().get(name)
+        if (
+            entry
+            and registry.abs_path(entry["path"]) == dest
+            and (entry["size"], entry["mtime"]) == registry.stat_key(dest)
+            and matches_pin(spec, entry["sha256"])
+        ):
+            return entry["sha256"], "registry"
+        digest = registry.sha256_path(dest)
+        if matches_pin(spec, digest):
+            registry.record(name, dest, digest, "existing")
+            return digest, "existing"
+        print(f"[{name}] existing file fails its checksum; reinstalling")
+
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    part_path = dest + ".part"
+    sources = ([f"mirror:{mirror}"] if mirror else []) + spec["sources"]
+    errors = []
+    for source in sources:
         try:
-            print("Downloading Wav2Lip GAN model...")
-            if gdown is None:
-                raise ImportError("gdown is not installed. Install with: pip install gdown or pip install -r requirements.txt")
-            gdown.download(
-                "https://drive.google.com/uc?id=15G3U08c8xsCkOqQxE38Z2XXDnPcOptNk",
-                wav2lip_gan_path,
-                quiet=False,
-            )
+            print(f"[{name}] fetching from {source}")
+            if source.startswith(("mirror:", "hf:")):
+                _remove(part_path)  # only plain downloads resume partial files
+            fetch(source, spec, part_path)
+            digest = registry.sha256_path(part_path)
+            if not matches_pin(spec, digest):
+                _remove(part_path)
+                expected = spec.get("sha256") or f"{spec['sha256_prefix']}..."
+                raise ValueError(f"SHA-256 mismatch: got {digest}, expected {expected}")
+            _remove(dest)
+            os.replace(part_path, dest)
+            registry.record(name, dest, digest, source)
+            return digest, source
         except Exception as e:
-            print(f"Wav2Lip GAN model download failed: {e}")
+            print(f"[{name}] {source} failed: {e}")
+            errors.append(f"{source}: {e}")
+    raise RuntimeError(f"{name}: all sources failed ({'; '.join(errors)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Install model weights listed in model_manifest.json")
+    parser.add_argument("--only", nargs="+", help="model names to install (default: all required)")
+    parser.add_argument("--all", action="store_true", help="also install optional models")
+    parser.add_argument("--mirror", help="local directory or tarball to install from first")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent downloads")
+    parser.add_argument("--force", action="store_true", help="reinstall even if present")
+    parser.add_argument(
+        "--trust", action="store_true", help="accept required models that have no pinned checksum"
+    )
+    parser.add_argument(
+        "--pin",
+        action="store_true",
+        help="like --trust, then write the first-use checksums into model_manifest.json",
+    )
+    args = parser.parse_args()
+
+    manifest = registry.load_manifest()
+    if args.only:
+        unknown = [n for n in args.only if n not in manifest]
+        if unknown:
+            parser.error(f"unknown model(s): {', '.join(unknown)}")
+        names = args.only
+    else:
+        names = [n for n, spec in manifest.items() if args.all or not spec.get("optional")]
+    unpinned = [
+        n for n in names if not manifest[n].get("optional") and not is_pinned(manifest[n])
+    ]
+    if unpinned and not (args.trust or args.pin):
+        parser.error(
+            f"no pinned SHA-256 for required model(s): {', '.join(unpinned)}. "
+            "Pin them in model_manifest.json, or pass --pin to trust this download "
+            "and record its checksums."
+        )
+
+    results, failed = {}, []
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {
+            pool.submit(install, name, manifest[name], args.mirror, args.force): name
+            for name in names
+        }
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                digest, source = fut.result()
+                results[name] = digest
+                pinned = "" if is_pinned(manifest[name]) else " (trusted on first use)"
+                print(f"[{name}] OK sha256={digest}{pinned} via {source}")
+            except Exception as e:
+                print(f"[{name}] FAILED: {e}")
+                failed.append(name)
+
+    if args.pin:
+        with open(registry.MANIFEST_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for name, digest in results.items():
+            if not data["models"][name].get("sha256"):
+                data["models"][name]["sha256"] = digest
+        with open(registry.MANIFEST_PATH, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.write("\n")
+        print(f"Pinned checksums in {registry.MANIFEST_PATH}")
 
+    if failed:
+        print(f"Failed to install: {', '.join(sorted(failed))}")
+        sys.exit(1)
     print("All models downloaded successfully!")
 
 
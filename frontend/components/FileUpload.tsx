@@ -4,6 +4,13 @@ import { useState, useRef } from 'react'
 import { motion } from 'framer-motion'
 import Chameleon from './Chameleon'
 import Processing from './Processing'
+import { MAX_UPLOAD_MB } from '@/lib/api'
+
+// Uploads are chunked and resumable, so the only limit is the API's
+const isAcceptedFile = (file: File) =>
+  (file.type === 'video/mp4' || file.name.toLowerCase().endsWith('.mp4') ||
+    file.type === 'video/quicktime' || file.name.toLowerCase().endsWith('.mov')) &&
+  file.size <= MAX_UPLOAD_MB * 1024 * 1024
 
 export default function FileUpload() {
   const [isDragging, setIsDragging] = useState(false)
@@ -24,19 +31,13 @@ export default function FileUpload() {
   const handleDrop = (e: React.DragEvent) => {
     e.preventDefault()
     setIsDragging(false)
-    const files = Array.from(e.dataTransfer.files).filter(file =>
-      file.type === 'video/mp4' || file.name.toLowerCase().endsWith('.mp4') ||
-      file.type === 'video/quicktime' || file.name.toLowerCase().endsWith('.mov')
-    )
+    const files = Array.from(e.dataTransfer.files).filter(isAcceptedFile)
     setUploadedFiles(prev => [...prev, ...files])
   }
 
   const handleFileSelect = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files) {
-      const files = Array.from(e.target.files).filter(file =>
-        file.type === 'video/mp4' || file.name.toLowerCase().endsWith('.mp4') ||
-        file.type === 'video/quicktime' || file.name.toLowerCase().endsWith('.mov')
-      )
+      const files = Array.from(e.target.files).filter(isAcceptedFile)
       setUploadedFiles(prev => [...prev, ...files])
     }
   }
@@ -170,7 +171,7 @@ export default function FileUpload() {
                   or click to browse
                 </p>
                 <p className="text-xs text-foreground-muted/70">
-                  Only MP4 or MOV files are allowed (Max 500MB)
+                  Only MP4 or MOV files are allowed (Max {MAX_UPLOAD_MB >= 1024 ? `${MAX_UPLOAD_MB / 1024}GB` : `${MAX_UPLOAD_MB}MB`})
                 </p>
               </motion.div>
             </div>
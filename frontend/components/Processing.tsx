@@ -3,6 +3,7 @@
 import { useState, useEffect } from 'react'
 import { motion, AnimatePresence } from 'framer-motion'
 import Chameleon from './Chameleon'
+import { createJob, uploadFile, subscribeJob, restartJob, resultUrl, forgetUpload } from '@/lib/api'
 
 interface ProcessingProps {
   files: File[]
@@ -15,6 +16,24 @@ interface ProcessingStage {
   completed: boolean
 }
 
+// Pipeline stages (api.py) behind each checklist entry
+const AUDIO_STAGES = [
+  { key: 'extract', name: 'Extracting the audio' },
+  { key: 'transcribe', name: 'Automatic Speech Recognition (ASR)' },
+  { key: 'translate', name: 'Text Translate' },
+  { key: 'tts', name: 'Converting to Audio' },
+]
+// Upload, then the lip-sync runner's progress stages (detect, render, mux)
+const VIDEO_STAGES = [
+  { key: 'upload', name: 'Uploading the video' },
+  { key: 'detect', name: 'Detecting faces' },
+  { key: 'render', name: 'Lip syncing the videos' },
+  { key: 'mux', name: 'Merging the dubbed audio' },
+]
+
+const initialStages = (stages: { name: string }[]): ProcessingStage[] =>
+  stages.map((stage) => ({ name: stage.name, completed: false }))
+
 export default function Processing({ files, onComplete, onBack }: ProcessingProps) {
   const [audioProgress, setAudioProgress] = useState(0)
   const [videoProgress, setVideoProgress] = useState(0)
@@ -22,103 +41,137 @@ export default function Processing({ files, onComplete, onBack }: ProcessingProp
   const [videoComplete, setVideoComplete] = useState(false)
   const [merged, setMerged] = useState(false)
   const [finalVideoUrl, setFinalVideoUrl] = useState<string | null>(null)
+  const [fileIndex, setFileIndex] = useState(0)
+  const [statusText, setStatusText] = useState<string | null>(null)
+  const [error, setError] = useState<string | null>(null)
+  const [attempt, setAttempt] = useState(0)
 
-  // Audio processing stages
-  const [audioStages, setAudioStages] = useState<ProcessingStage[]>([
-    { name: 'Automatic Speech Recognition (ASR)', completed: false },
-    { name: 'Speech to Text', completed: false },
-    { name: 'Text Translate', completed: false },
-    { name: 'Converting to Audio', completed: false },
-  ])
-
-  // Video processing stages
-  const [videoStages, setVideoStages] = useState<ProcessingStage[]>([
-    { name: 'Extracting the frames', completed: false },
-    { name: 'Analyzing the foreign texts', completed: false },
-    { name: 'Translating the texts', completed: false },
-    { name: 'Overlaying the texts', completed: false },
-    { name: 'Lip syncing the videos', completed: false },
-  ])
+  const [audioStages, setAudioStages] = useState<ProcessingStage[]>(initialStages(AUDIO_STAGES))
+  const [videoStages, setVideoStages] = useState<ProcessingStage[]>(initialStages(VIDEO_STAGES))
 
   useEffect(() => {
-    // Simulate audio processing with stages
-    const audioDuration = 3000 + Math.random() * 4000
-    
-    let currentStage = 0
-    const audioInterval = setInterval(() => {
-      setAudioProgress((prev) => {
-        const newProgress = prev + (100 / (audioDuration / 50))
-        
-        // Complete stages as progress increases
-        if (newProgress >= 25 && currentStage === 0) {
-          setAudioStages(prev => prev.map((stage, i) => i === 0 ? { ...stage, completed: true } : stage))
-          currentStage = 1
-        } else if (newProgress >= 50 && currentStage === 1) {
-          setAudioStages(prev => prev.map((stage, i) => i === 1 ? { ...stage, completed: true } : stage))
-          currentStage = 2
-        } else if (newProgress >= 75 && currentStage === 2) {
-          setAudioStages(prev => prev.map((stage, i) => i === 2 ? { ...stage, completed: true } : stage))
-          currentStage = 3
-        } else if (newProgress >= 100 && currentStage === 3) {
-          setAudioStages(prev => prev.map((stage, i) => i === 3 ? { ...stage, completed: true } : stage))
-          clearInterval(audioInterval)
-          setAudioComplete(true)
-          return 100
-        }
-        
-        return Math.min(newProgress, 100)
-      })
-    }, 50)
+    const controller = new AbortController()
+    let unsubscribe: (() => void) | null = null
+    let cancelled = false
+
+    const markAudio = (count: number) =>
+      setAudioStages((prev) => prev.map((stage, i) => (i < count ? { ...stage, completed: true } : stage)))
+    const markVideo = (count: number) =>
+      setVideoStages((prev) => prev.map((stage, i) => (i < count ? { ...stage, completed: true } : stage)))
+
+    const processFile = async (file: File) => {
+      setAudioStages(initialStages(AUDIO_STAGES))
+      setVideoStages(initialStages(VIDEO_STAGES))
+      setAudioProgress(0)
+      setVideoProgress(0)
+      setAudioComplete(false)
+      setVideoComplete(false)
+      setMerged(false)
 
-    // Simulate video processing with stages
-    const videoDuration = 4000 + Math.random() * 4000
-    let currentVideoStage = 0
-    const videoInterval = setInterval(() => {
-      setVideoProgress((prev) => {
-        const newProgress = prev + (100 / (videoDuration / 50))
-        
-        // Complete stages as progress increases
-        if (newProgress >= 20 && currentVideoStage === 0) {
-          setVideoStages(prev => prev.map((stage, i) => i === 0 ? { ...stage, completed: true } : stage))
-          currentVideoStage = 1
-        } else if (newProgress >= 40 && currentVideoStage === 1) {
-          setVideoStages(prev => prev.map((stage, i) => i === 1 ? { ...stage, completed: true } : stage))
-          currentVideoStage = 2
-        } else if (newProgress >= 60 && currentVideoStage === 2) {
-          setVideoStages(prev => prev.map((stage, i) => i === 2 ? { ...stage, completed: true } : stage))
-          currentVideoStage = 3
-        } else if (newProgress >= 80 && currentVideoStage === 3) {
-          setVideoStages(prev => prev.map((stage, i) => i === 3 ? { ...stage, completed: true } : stage))
-          currentVideoStage = 4
-        } else if (newProgress >= 100 && currentVideoStage === 4) {
-          setVideoStages(prev => prev.map((stage, i) => i === 4 ? { ...stage, completed: true } : stage))
-          clearInterval(videoInterval)
-          setVideoComplete(true)
-          return 100
-        }
-        
-        return Math.min(newProgress, 100)
+      const job = await createJob(file)
+      if (job.offset < job.size) {
+        setStatusText('Uploading...')
+        await uploadFile(
+          file,
+          job,
+          // The upload is the first quarter of the video bar
+          (sent, total) => setVideoProgress((sent / total) * 25),
+          controller.signal,
+        )
+      } else if (job.status === 'interrupted') {
+        await restartJob(job.job_id)
+      }
+      markVideo(1)
+      setVideoProgress(25)
+      setStatusText(null)
+
+      await new Promise<void>((resolve, reject) => {
+        unsubscribe = subscribeJob(job.job_id, {
+          onStatus: (status) => {
+            const done = AUDIO_STAGES.filter((stage) => status.stages[stage.key] === 'done').length
+            markAudio(done)
+            setAudioProgress((done / AUDIO_STAGES.length) * 100)
+            if (done === AUDIO_STAGES.length) setAudioComplete(true)
+            if (status.stages.video === 'done') {
+              markVideo(VIDEO_STAGES.length)
+              setVideoProgress(100)
+              setVideoComplete(true)
+            }
+            if (status.status === 'interrupted') restartJob(status.job_id).catch(reject)
+          },
+          onQueue: (position) =>
+            setStatusText(position ? `Waiting for a free worker: position ${position} in queue` : null),
+          onStage: (stage, state) => {
+            setStatusText(null)
+            const index = AUDIO_STAGES.findIndex((s) => s.key === stage)
+            if (index >= 0 && state === 'done') {
+              markAudio(index + 1)
+              setAudioProgress(((index + 1) / AUDIO_STAGES.length) * 100)
+              if (index === AUDIO_STAGES.length - 1) setAudioComplete(true)
+            }
+            if (stage === 'video' && state === 'done') {
+              markVideo(VIDEO_STAGES.length)
+              setVideoProgress(100)
+              setVideoComplete(true)
+            }
+          },
+          onProgress: (info) => {
+            setStatusText(null)
+            const fraction = info.total > 0 ? info.done / info.total : 0
+            if (info.stage === 'tts') {
+              // Per-segment synthesis fills the last audio step
+              const base = ((AUDIO_STAGES.length - 1) / AUDIO_STAGES.length) * 100
+              setAudioProgress(base + (fraction * 100) / AUDIO_STAGES.length)
+              return
+            }
+            const index = VIDEO_STAGES.findIndex((s) => s.key === info.stage)
+            if (index < 1) return
+            markVideo(index)
+            // detect 25-50%, render 50-85%, mux 85-100%
+            const span: Record<string, [number, number]> = { detect: [25, 50], render: [50, 85], mux: [85, 100] }
+            const [from, to] = span[info.stage]
+            setVideoProgress(from + fraction * (to - from))
+          },
+          onDone: () => resolve(),
+          onError: (message) => reject(new Error(message)),
+        })
       })
-    }, 50)
+      unsubscribe = null
+      forgetUpload(file)
+      markAudio(AUDIO_STAGES.length)
+      markVideo(VIDEO_STAGES.length)
+      setAudioProgress(100)
+      setVideoProgress(100)
+      setAudioComplete(true)
+      setVideoComplete(true)
+      return resultUrl(job.job_id)
+    }
 
-    return () => {
-      clearInterval(audioInterval)
-      clearInterval(videoInterval)
+    const run = async () => {
+      setError(null)
+      let url: string | null = null
+      for (let i = 0; i < files.length; i++) {
+        if (cancelled) return
+        setFileIndex(i)
+        url = await processFile(files[i])
+      }
+      if (cancelled || !url) return
+      setMerged(true)
+      setFinalVideoUrl(url)
+      onComplete(url)
     }
-  }, [])
 
-  useEffect(() => {
-    // When both are complete, merge them
-    if (audioComplete && videoComplete && !merged) {
-      setTimeout(() => {
-        setMerged(true)
-        setTimeout(() => {
-          setFinalVideoUrl('/sample-video.mp4')
-          onComplete('/sample-video.mp4')
-        }, 1500)
-      }, 500)
+    run().catch((err) => {
+      if (!cancelled) setError(err instanceof Error ? err.message : String(err))
+    })
+
+    return () => {
+      cancelled = true
+      controller.abort()
+      unsubscribe?.()
     }
-  }, [audioComplete, videoComplete, merged, onComplete])
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [files, attempt])
 
   return (
     <div className="min-h-screen bg-gradient-to-b from-background via-background-light to-background py-12 px-6 lg:px-12">
@@ -133,10 +186,23 @@ export default function Processing({ files, onComplete, onBack }: ProcessingProp
             Processing Your Content
           </h2>
           <p className="text-base text-foreground-muted">
-            Our AI is working its magic...
+            {files.length > 1 ? `File ${fileIndex + 1} of ${files.length}: ` : ''}
+            {statusText ?? 'Our AI is working its magic...'}
           </p>
         </motion.div>
 
+        {error && (
+          <div className="mb-6 bg-background-light rounded-2xl p-5 border border-red-400/40 text-center">
+            <p className="text-sm text-foreground mb-3">Processing failed: {error}</p>
+            <button
+              onClick={() => setAttempt((n) => n + 1)}
+              className="px-5 py-2 bg-accent-green text-background rounded-lg font-semibold hover:bg-accent-green-dark transition-all"
+            >
+              Retry
+            </button>
+          </div>
+        )}
+
         {/* Chameleon */}
         <motion.div
           initial={{ opacity: 0, scale: 0.8 }}
@@ -361,22 +427,21 @@ export default function Processing({ files, onComplete, onBack }: ProcessingProp
                 <p className="text-sm text-foreground-muted">Your localized content is ready</p>
               </div>
 
-              {/* Video Preview Placeholder */}
+              {/* Video Preview (streamed with Range requests) */}
               <div className="bg-background rounded-xl p-4 mb-4 border border-accent-green/20">
-                <div className="aspect-video bg-background-light rounded-lg flex items-center justify-center">
-                  <div className="text-center">
-                    <svg className="w-12 h-12 mx-auto mb-3 text-accent-green/50" fill="none" stroke="currentColor" viewBox="0 0 24 24">
-                      <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M14.752 11.168l-3.197-2.132A1 1 0 0010 9.87v4.263a1 1 0 001.555.832l3.197-2.132a1 1 0 000-1.664z" />
-                      <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M21 12a9 9 0 11-18 0 9 9 0 0118 0z" />
-                    </svg>
-                    <p className="text-foreground-muted text-sm">Video Preview</p>
-                  </div>
-                </div>
+                <video
+                  src={finalVideoUrl}
+                  controls
+                  preload="metadata"
+                  className="aspect-video w-full bg-background-light rounded-lg"
+                />
               </div>
 
               {/* Download Button */}
               <div className="flex gap-4">
-                <motion.button
+                <motion.a
+                  href={finalVideoUrl}
+                  download
                   whileHover={{ scale: 1.05 }}
                   whileTap={{ scale: 0.95 }}
                   className="flex-1 px-6 py-3 bg-accent-green text-background rounded-lg font-semibold hover:bg-accent-green-dark transition-all shadow-lg hover:shadow-xl hover:shadow-accent-green/50 flex items-center justify-center gap-2"
@@ -385,7 +450,7 @@ export default function Processing({ files, onComplete, onBack }: ProcessingProp
                     <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M4 16v1a3 3 0 003 3h10a3 3 0 003-3v-1m-4-4l-4 4m0 0l-4-4m4 4V4" />
                   </svg>
                   Download Video
-                </motion.button>
+                </motion.a>
                 <motion.button
                   whileHover={{ scale: 1.05 }}
                   whileTap={{ scale: 0.95 }}
@@ -0,0 +1,168 @@
+// Client for the Python processing API (api.py at the repository root)
+
+export const API_URL = (process.env.NEXT_PUBLIC_API_URL ?? 'http://localhost:8000').replace(/\/$/, '')
+// Keep in sync with API_MAX_UPLOAD_MB on the server
+export const MAX_UPLOAD_MB = Number(process.env.NEXT_PUBLIC_MAX_UPLOAD_MB ?? 2048)
+
+export interface JobStatus {
+  job_id: string
+  status: 'uploading' | 'running' | 'interrupted' | 'failed' | 'done'
+  filename: string
+  size: number
+  offset: number
+  chunk_size: number
+  stages: Record<string, 'running' | 'done' | null>
+  error: string | null
+  has_result: boolean
+}
+
+export interface JobOptions {
+  sourceLang?: string
+  targetLang?: string
+  lipSync?: boolean
+}
+
+export interface JobHandlers {
+  onStatus?: (status: JobStatus) => void
+  onStage?: (stage: string, status: 'running' | 'done') => void
+  onProgress?: (info: { stage: string; done: number; total: number; fps?: number; eta?: number }) => void
+  // position 0 means the wait is over
+  onQueue?: (position: number) => void
+  onDone?: () => void
+  onError?: (message: string) => void
+}
+
+// The browser authenticates with the dashboard's signed session cookie; API_TOKEN
+// is for server-side clients and must never be shipped in the bundle
+async function request(path: string, init: RequestInit = {}) {
+  const res = await fetch(`${API_URL}${path}`, { ...init, credentials: 'include' })
+  const body = await res.json().catch(() => ({}))
+  return { res, body }
+}
+
+// Uploads are resumed across reloads: the job id is remembered per file
+function resumeKey(file: File) {
+  return `upload:${file.name}:${file.size}:${file.lastModified}`
+}
+
+export async function createJob(file: File, options: JobOptions = {}): Promise<JobStatus> {
+  const saved = typeof window !== 'undefined' ? window.localStorage.getItem(resumeKey(file)) : null
+  if (saved) {
+    const { res, body } = await request(`/api/jobs/${saved}`)
+    if (res.ok && body.status === 'failed') {
+      // Rerun on the server; stages that already finished are skipped
+      await restartJob(saved)
+      return { ...body, status: 'running' } as JobStatus
+    }
+    if (res.ok) return body as JobStatus
+    window.localStorage.removeItem(resumeKey(file))
+  }
+  const { res, body } = await request('/api/jobs', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({
+      filename: file.name,
+      size: file.size,
+      source_lang: options.sourceLang,
+      target_lang: options.targetLang,
+      lip_sync: options.lipSync ?? true,
+    }),
+  })
+  if (!res.ok) throw new Error(body.error ?? `Could not create job (HTTP ${res.status})`)
+  window.localStorage.setItem(resumeKey(file), body.job_id)
+  return body as JobStatus
+}
+
+/**
+ * Send `file` in chunks from the server's current offset. A failed chunk is
+ * retried with backoff after re-reading the offset, so flaky connections and
+ * page reloads only cost the chunk in flight (the job id is remembered
+ * until `forgetUpload`).
+ */
+export async function uploadFile(
+  file: File,
+  job: JobStatus,
+  onProgress: (sent: number, total: number) => void,
+  signal?: AbortSignal,
+) {
+  let offset = job.offset
+  let failures = 0
+  onProgress(offset, file.size)
+  while (offset < file.size) {
+    if (signal?.aborted) throw new DOMException('Upload aborted', 'AbortError')
+    const chunk = file.slice(offset, offset + job.chunk_size)
+    try {
+      const { res, body } = await request(`/api/jobs/${job.job_id}/upload`, {
+        method: 'PATCH',
+        headers: { 'Upload-Offset': String(offset), 'Content-Type': 'application/offset+octet-stream' },
+        body: chunk,
+        signal,
+      })
+      if (res.ok || res.status === 409) {
+        // 409: offsets disagreed (e.g. a retried chunk had landed); continue from the server's
+        if (typeof body.offset !== 'number') throw new Error(body.error ?? `HTTP ${res.status}`)
+        offset = body.offset
+        failures = 0
+        onProgress(offset, file.size)
+        continue
+      }
+      throw new Error(body.error ?? `HTTP ${res.status}`)
+    } catch (err) {
+      if (signal?.aborted || ++failures > 5) throw err
+      await new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** failures))
+      const { res, body } = await request(`/api/jobs/${job.job_id}`)
+      if (res.ok) offset = body.offset
+    }
+  }
+}
+
+/** Forget the remembered job for `file` once its result has been delivered. */
+export function forgetUpload(file: File) {
+  window.localStorage.removeItem(resumeKey(file))
+}
+
+export async function restartJob(jobId: string) {
+  const { res, body } = await request(`/api/jobs/${jobId}/start`, { method: 'POST' })
+  if (!res.ok) throw new Error(body.error ?? `Could not restart job (HTTP ${res.status})`)
+}
+
+/** Follow a job's Server-Sent Events; returns a function that closes the stream. */
+export function subscribeJob(jobId: string, handlers: JobHandlers) {
+  const source = new EventSource(`${API_URL}/api/jobs/${jobId}/events`, { withCredentials: true })
+  const parse = (e: Event) => JSON.parse((e as MessageEvent).data)
+  source.addEventListener('status', (e) => {
+    const status: JobStatus = parse(e)
+    handlers.onStatus?.(status)
+    // Sent first on every (re)connect; a finished job has nothing more to stream
+    if (status.status === 'done') {
+      source.close()
+      handlers.onDone?.()
+    } else if (status.status === 'failed') {
+      source.close()
+      handlers.onError?.(status.error ?? 'Processing failed')
+    }
+  })
+  source.addEventListener('stage', (e) => {
+    const data = parse(e)
+    handlers.onStage?.(data.stage, data.status)
+  })
+  source.addEventListener('progress', (e) => handlers.onProgress?.(parse(e)))
+  source.addEventListener('queue', (e) => handlers.onQueue?.(parse(e).position))
+  source.addEventListener('done', () => {
+    source.close()
+    handlers.onDone?.()
+  })
+  // Named "error" events come from the server; plain errors are dropped
+  // connections, which EventSource retries on its own (with Last-Event-ID)
+  source.addEventListener('error', (e) => {
+    if (e instanceof MessageEvent && e.data) {
+      source.close()
+      handlers.onError?.(JSON.parse(e.data).message)
+    }
+  })
+  return () => source.close()
+}
+
+export function resultUrl(jobId: string) {
+  return `${API_URL}/api/jobs/${jobId}/result`
+}
@@ -0,0 +1,66 @@
+"""
+Measure cold-start import time of the app's entry modules.
+
+Each target is imported in a fresh interpreter with `python -X importtime`,
+and the slowest modules (by cumulative time) are printed. Pass `--budget-ms`
+to exit non-zero when a target exceeds its budget, e.g. in CI:
+
+    python scripts/bench_startup.py --budget-ms 1500 app
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_TARGETS = ["utils.settings", "utils.firebase_utils", "app", "views.dashboard"]
+
+
+def import_times(module):
+    """Return [(cumulative_us, self_us, name)] for a cold import of `module`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=PROJECT_DIR,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("targets", nargs="*", default=DEFAULT_TARGETS)
+    parser.add_argument("--top", type=int, default=15, help="modules to list per target")
+    parser.add_argument("--budget-ms", type=float, default=0, help="fail above this total")
+    args = parser.parse_args()
+
+    over_budget = []
+    for target in args.targets:
+        rows = import_times(target)
+        # The target itself is the last top-level entry; its cumulative time is the total
+        total_ms = next(
+            (cum for cum, _, name in reversed(rows) if name.strip() == target), 0
+        ) / 1000.0
+        print(f"\n{target}: {total_ms:.0f} ms")
+        print(f"  {'cumulative':>10}  {'self':>8}  module")
+        top = sorted(rows, key=lambda r: r[0], reverse=True)[: args.top]
+        for cum, own, name in top:
+            print(f"  {cum / 1000.0:>8.1f}ms  {own / 1000.0:>6.1f}ms  {name}")
+        if args.budget_ms and total_ms > args.budget_ms:
+            over_budget.append(f"{target} ({total_ms:.0f} ms)")
+
+    if over_budget:
+        print(f"\nOver the {args.budget_ms:.0f} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -66,6 +66,7 @@ if (Test-Path -Path ".gitmodules") {
 
 # Run the model downloader
 Write-Info "Downloading Wav2Lip models (this may take a while)"
-python download_models.py
+# --pin records the checksums of models the manifest does not pin yet
+python download_models.py --pin
 
 Write-Info "Setup complete. To run the app: 'streamlit run app.py'"
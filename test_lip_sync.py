@@ -54,6 +54,17 @@ def test_wav2lip_inference():
 
         model.eval()
         print("✅ Model ready for inference")
+
+        # Report which optimized variant the lip-sync runner would pick
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        import utils.lipsync_models as lipsync_models
+
+        variant = lipsync_models.best_variant(checkpoint_path, device)
+        print(f"✅ Selected generator variant: {variant}")
+        if variant == "fp32" and device == "cpu":
+            print(
+                "ℹ️ Run 'python utils/lipsync_models.py export' and 'validate' for faster CPU inference"
+            )
     except Exception as e:
         print(f"❌ Model loading failed: {e}")
         return False
@@ -0,0 +1,404 @@
+"""
+Content-addressed store for pipeline artifacts.
+
+Every file is kept once under its SHA-256 (`put()` returns a ref such as
+"sha256:ab12..."), so storing or referencing the same bytes again is free.
+Refs are handed to other services as expiring HMAC-signed URLs served by a
+small threaded HTTP server with Range support:
+
+    python utils/artifact_store.py serve
+    python utils/artifact_store.py gc [--days N]
+
+Objects not stored or read for ARTIFACT_RETENTION_DAYS are removed by `gc()`
+(run hourly by `serve`), except those still referenced by a saved job.
+"""
+import argparse
+import functools
+import hashlib
+import hmac
+import json
+import mimetypes
+import os
+import re
+import secrets
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Run as a script, only utils/ is on the path
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from utils.settings import get_settings  # noqa: E402
+
+_settings = get_settings()
+
+STORE_DIR = _settings.artifact_store_dir or os.path.join(PROJECT_DIR, "artifacts")
+HOST = _settings.artifact_store_host
+PORT = _settings.artifact_store_port
+# Base URL other services use to reach the server (e.g. behind a reverse proxy)
+PUBLIC_URL = (_settings.artifact_public_url or f"http://{HOST}:{PORT}").rstrip("/")
+URL_TTL = _settings.artifact_url_ttl
+# Unused objects and scratch state older than this are garbage-collected (0 = keep forever)
+RETENTION_DAYS = _settings.artifact_retention_days
+
+CHUNK_SIZE = 1 << 20
+_REF_RE = re.compile(r"^sha256:([0-9a-f]{64})$")
+
+
+@functools.lru_cache(maxsize=None)
+def _secret():
+    secret = _settings.artifact_secret
+    if secret:
+        return secret.encode("utf-8")
+    # Shared by every process using this store (web app, workers, server)
+    path = os.path.join(STORE_DIR, ".secret")
+    os.makedirs(STORE_DIR, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(secrets.token_hex(32))
+    except FileExistsError:
+        pass
+    with open(path, "r") as f:
+        return f.read().strip().encode("utf-8")
+
+
+def _digest_of(ref):
+    m = _REF_RE.match(ref or "")
+    if not m:
+        raise ValueError(f"Not an artifact ref: {ref!r}")
+    return m.group(1)
+
+
+def _object_path(digest):
+    return os.path.join(STORE_DIR, "objects", digest[:2], digest)
+
+
+@functools.lru_cache(maxsize=1024)
+def _hash_file(path, size, mtime):
+    # Keyed by (path, size, mtime) so an unchanged file is hashed once per process
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _touch(path):
+    # Object mtime doubles as "last used" for garbage collection
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def put(path, name=None):
+    """Store a copy of `path` (once per distinct content) and return its ref."""
+    st = os.stat(path)
+    digest = _hash_file(os.path.abspath(path), st.st_size, st.st_mtime)
+    dest = _object_path(digest)
+    meta = {
+        "size": st.st_size,
+        "name": name or os.path.basename(path),
+        "created": time.time(),
+    }
+    if not os.path.exists(dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        # Metadata lands first, so a published object always has it
+        _write_json(dest + ".json", meta)
+        # A copy, not a hard link: pipeline steps overwrite their outputs in place
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, dest)
+    else:
+        if not os.path.exists(dest + ".json"):
+            # Left behind by an older writer that crashed between the two files
+            _write_json(dest + ".json", meta)
+        _touch(dest)
+    return f"sha256:{digest}"
+
+
+def path_for(ref):
+    """Local filesystem path of a stored artifact."""
+    path = _object_path(_digest_of(ref))
+    if not os.path.exists(path):
+        raise ValueError(f"Artifact {ref} is not in the store")
+    _touch(path)
+    return path
+
+
+def metadata(ref):
+    path = path_for(ref)
+    try:
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        st = os.stat(path)
+        return {"size": st.st_size, "name": _digest_of(ref), "created": st.st_mtime}
+
+
+def fetch(ref, dest):
+    """Copy an artifact to `dest` and return dest."""
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    shutil.copyfile(path_for(ref), dest)
+    return dest
+
+
+def scratch_dir(name):
+    """Directory on the store volume for state shared by every worker (e.g. resume checkpoints)."""
+    path = os.path.join(STORE_DIR, "scratch", name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _newest_mtime(path):
+    newest = os.path.getmtime(path)
+    for root, dirs, files in os.walk(path):
+        for n in dirs + files:
+            try:
+                newest = max(newest, os.path.getmtime(os.path.join(root, n)))
+            except OSError:
+                pass
+    return newest
+
+
+def gc(max_age_days=None, keep=()):
+    """
+    Remove objects unused for `max_age_days` (default ARTIFACT_RETENTION_DAYS)
+    unless their ref is in `keep`, plus scratch state untouched for as long.
+    Returns (objects removed, bytes freed).
+    """
+    max_age_days = RETENTION_DAYS if max_age_days is None else max_age_days
+    if max_age_days <= 0:
+        return 0, 0
+    cutoff = time.time() - max_age_days * 86400
+    keep = {_digest_of(ref) for ref in keep if _REF_RE.match(ref or "")}
+    removed = freed = 0
+    objects_dir = os.path.join(STORE_DIR, "objects")
+    for root, _dirs, files in os.walk(objects_dir):
+        for n in files:
+            path = os.path.join(root, n)
+            try:
+                if n.endswith(".tmp"):
+                    # Abandoned half-written copy
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                    continue
+                if not re.fullmatch(r"[0-9a-f]{64}", n) or n in keep:
+                    continue
+                st = os.stat(path)
+                if st.st_mtime >= cutoff:
+                    continue
+                os.unlink(path)
+                removed += 1
+                freed += st.st_size
+                if os.path.exists(path + ".json"):
+                    os.unlink(path + ".json")
+            except OSError:
+                continue  # raced with another writer or collector
+    scratch = os.path.join(STORE_DIR, "scratch")
+    for name in os.listdir(scratch) if os.path.isdir(scratch) else []:
+        for entry in os.listdir(os.path.join(scratch, name)):
+            path = os.path.join(scratch, name, entry)
+            try:
+                if _newest_mtime(path) < cutoff:
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    else:
+                        os.unlink(path)
+            except OSError:
+                continue
+    return removed, freed
+
+
+def referenced_refs():
+    """Every artifact ref mentioned in a saved job manifest, which gc() must keep."""
+    from utils.jobs import JOBS_DIR, MANIFEST_NAME
+
+    refs = set()
+    for job_id in os.listdir(JOBS_DIR) if os.path.isdir(JOBS_DIR) else []:
+        try:
+            with open(os.path.join(JOBS_DIR, job_id, MANIFEST_NAME), "r", encoding="utf-8") as f:
+                refs.update(re.findall(r"sha256:[0-9a-f]{64}", f.read()))
+        except OSError:
+            continue
+    return refs
+
+
+def _gc_loop(interval=3600):
+    while True:
+        removed, freed = gc(keep=referenced_refs())
+        if removed:
+            print(f"[artifacts] gc removed {removed} object(s), {freed / 1e6:.1f} MB")
+        time.sleep(interval)
+
+
+def _sign(digest, expires):
+    return hmac.new(_secret(), f"{digest}:{expires}".encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def signed_url(ref, ttl=None):
+    """Expiring URL for `ref` on the artifact server (started on demand)."""
+    digest = _digest_of(ref)
+    name = metadata(ref)["name"]
+    expires = int(time.time() + (URL_TTL if ttl is None else ttl))
+    ensure_server()
+    return f"{PUBLIC_URL}/a/{digest}/{quote(name)}?exp={expires}&sig={_sign(digest, expires)}"
+
+
+def _parse_range(header, size):
+    """(start, end) inclusive for a single "bytes=" range, None if absent, or raise ValueError."""
+    if not header:
+        return None
+    m = re.match(r"^bytes=(\d*)-(\d*)$", header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        raise ValueError(header)
+    if m.group(1):
+        start = int(m.group(1))
+        end = int(m.group(2)) if m.group(2) else size - 1
+    else:
+        start = max(0, size - int(m.group(2)))
+        end = size - 1
+    end = min(end, size - 1)
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def send_file(handler, path, name, body=True, headers=None):
+    """
+    Answer a GET/HEAD on `handler` (a BaseHTTPRequestHandler) with the file at
+    `path`, honouring a single-range "Range" header (206 / 416). `headers`
+    are added to the response (e.g. CORS).
+    """
+    extra = list((headers or {}).items())
+    size = os.path.getsize(path)
+    try:
+        byte_range = _parse_range(handler.headers.get("Range"), size)
+    except ValueError:
+        handler.send_response(416)
+        for key, value in extra:
+            handler.send_header(key, value)
+        handler.send_header("Content-Range", f"bytes */{size}")
+        handler.send_header("Content-Length", "0")
+        handler.end_headers()
+        return
+    start, end = byte_range or (0, size - 1)
+    handler.send_response(206 if byte_range else 200)
+    for key, value in extra:
+        handler.send_header(key, value)
+    handler.send_header("Content-Type", mimetypes.guess_type(name)[0] or "application/octet-stream")
+    handler.send_header("Accept-Ranges", "bytes")
+    handler.send_header("Content-Length", str(end - start + 1))
+    if byte_range:
+        handler.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+    handler.send_header("Cache-Control", "private, max-age=3600, immutable")
+    handler.end_headers()
+    if not body:
+        return
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            handler.wfile.write(chunk)
+            remaining -= len(chunk)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _error(self, code):
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _serve(self, body):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        query = parse_qs(url.query)
+        if len(parts) < 2 or parts[0] != "a" or not re.fullmatch(r"[0-9a-f]{64}", parts[1]):
+            return self._error(404)
+        digest = parts[1]
+        try:
+            expires = int(query["exp"][0])
+            sig = query["sig"][0]
+        except (KeyError, ValueError):
+            return self._error(403)
+        if not hmac.compare_digest(sig, _sign(digest, expires)):
+            return self._error(403)
+        if expires < time.time():
+            return self._error(410)
+        path = _object_path(digest)
+        if not os.path.exists(path):
+            return self._error(404)
+
+        send_file(self, path, parts[2] if len(parts) > 2 else digest, body)
+
+    def do_GET(self):
+        self._serve(body=True)
+
+    def do_HEAD(self):
+        self._serve(body=False)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def ensure_server():
+    """Start the artifact server in a background thread once per process."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer((HOST, PORT), _Handler)
+        except OSError:
+            # Already served by another process sharing this store
+            _server = False
+            return
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, daemon=True, name="artifacts").start()
+        print(f"[artifacts] serving {STORE_DIR} on {HOST}:{PORT}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Content-addressed artifact store")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("serve", help="serve signed artifact URLs (and collect garbage hourly)")
+    collect = sub.add_parser("gc", help="remove artifacts unused for --days")
+    collect.add_argument("--days", type=float, default=RETENTION_DAYS)
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        removed, freed = gc(args.days, keep=referenced_refs())
+        print(f"[artifacts] removed {removed} object(s), {freed / 1e6:.1f} MB")
+        return
+    print(f"[artifacts] serving {STORE_DIR} on {HOST}:{PORT}")
+    server = ThreadingHTTPServer((HOST, PORT), _Handler)
+    server.daemon_threads = True
+    if RETENTION_DAYS > 0:
+        threading.Thread(target=_gc_loop, daemon=True, name="artifacts-gc").start()
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
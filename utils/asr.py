@@ -0,0 +1,241 @@
+import glob
+import os
+import threading
+import time
+
+import ffmpeg
+
+import utils.model_registry as model_registry
+import utils.scheduler as scheduler
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+# Local ASR (faster-whisper / CTranslate2) configuration
+whisper_model_size = _settings.whisper_model_size
+whisper_device = _settings.whisper_device
+whisper_compute_type = _settings.whisper_compute_type
+whisper_batch_size = _settings.whisper_batch_size
+whisper_beam_size = _settings.whisper_beam_size
+
+# Latency budget used by automatic model selection: the job should finish
+# within ASR_MAX_RTF x audio length, and (if set) within ASR_LATENCY_BUDGET seconds
+asr_max_rtf = _settings.asr_max_rtf
+asr_latency_budget = _settings.asr_latency_budget
+
+# Rough single-thread real-time factors for int8 CTranslate2 on x86 CPUs,
+# largest model first. Refined at runtime from measured jobs.
+MODEL_RTF_1T = {
+    "large-v3": 9.0,
+    "medium": 4.0,
+    "small": 1.4,
+    "base": 0.5,
+    "tiny": 0.25,
+}
+
+# Remote ASR uploads: speech is re-encoded to 16 kHz mono Opus and split into
+# parts that stay under each provider's request size limit
+asr_upload_bitrate = _settings.asr_upload_bitrate
+UPLOAD_LIMITS_MB = {
+    "groq": _settings.groq_max_upload_mb,
+    "hf": _settings.hf_max_upload_mb,
+}
+
+_models = {}
+_models_lock = threading.Lock()
+_observed_rtf = {}
+
+
+def audio_duration(path):
+    """Return the audio duration in seconds."""
+    return float(ffmpeg.probe(path)["format"]["duration"])
+
+
+def estimated_rtf(size, threads):
+    """Estimated real-time factor of `size` on `threads` CPU threads."""
+    if size in _observed_rtf:
+        return _observed_rtf[size] / threads
+    # Thread scaling is sub-linear for CTranslate2 on CPU
+    return MODEL_RTF_1T[size] / (threads**0.8)
+
+
+def choose_model_size(duration, threads, max_rtf=None, budget_seconds=None):
+    """
+    Pick the largest model expected to finish inside the latency budget.
+    Falls back to the smallest model if none fits.
+    """
+    max_rtf = asr_max_rtf if max_rtf is None else max_rtf
+    budget_seconds = asr_latency_budget if budget_seconds is None else budget_seconds
+    allowed = duration * max_rtf
+    if budget_seconds > 0:
+        allowed = min(allowed, budget_seconds)
+    for size in MODEL_RTF_1T:
+        if duration * estimated_rtf(size, threads) <= allowed:
+            return size
+    return list(MODEL_RTF_1T)[-1]
+
+
+def _load_model(size, threads):
+    """Return a cached WhisperModel for (size, device, compute type, threads)."""
+    try:
+        from faster_whisper import WhisperModel  # type: ignore
+    except Exception as e:
+        raise ValueError(f"Local ASR requested but faster-whisper is not available: {e}")
+    key = (size, whisper_device, whisper_compute_type, threads)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            # Weights installed by download_models.py (e.g. from a mirror)
+            # take precedence over a Hugging Face download
+            model = WhisperModel(
+                model_registry.model_path(f"whisper-{size}") or size,
+                device=whisper_device,
+                compute_type=whisper_compute_type,
+                cpu_threads=threads,
+                # One worker per heavy slot: concurrent jobs sharing this cached
+                # model transcribe in parallel instead of queueing on it
+                num_workers=scheduler.HEAVY_JOB_SLOTS,
+            )
+            _models[key] = model
+    return model
+
+
+def transcribe_local(file_path, threads, model_size=None, language=None):
+    """
+    Transcribe with local faster-whisper, batching VAD-split chunks.
+
+    Returns a dict with the transcript and timing stats, including the
+    real-time factor (processing seconds per audio second).
+    """
+    duration = audio_duration(file_path)
+    size = model_size or whisper_model_size
+    if size == "auto":
+        size = choose_model_size(duration, threads)
+    model = _load_model(size, threads)
+
+    started = time.time()
+    try:
+        from faster_whisper import BatchedInferencePipeline  # type: ignore
+    except ImportError:
+        BatchedInferencePipeline = None
+    if BatchedInferencePipeline is not None and whisper_batch_size > 1:
+        # VAD splits speech into chunks that are decoded together in batches
+        pipeline = BatchedInferencePipeline(model=model)
+        segments, _info = pipeline.transcribe(
+            file_path,
+            batch_size=whisper_batch_size,
+            beam_size=whisper_beam_size,
+            language=language,
+        )
+    else:
+        segments, _info = model.transcribe(
+            file_path,
+            beam_size=whisper_beam_size,
+            vad_filter=True,
+            language=language,
+        )
+    text = " ".join(seg.text.strip() for seg in segments if seg.text).strip()
+    elapsed = time.time() - started
+
+    rtf = elapsed / duration if duration > 0 else 0.0
+    if duration > 0 and size in MODEL_RTF_1T:
+        # Keep a running single-thread estimate for future model selection
+        measured = rtf * threads
+        prev = _observed_rtf.get(size)
+        _observed_rtf[size] = measured if prev is None else 0.7 * prev + 0.3 * measured
+
+    stats = {
+        "engine": "local",
+        "model_size": size,
+        "threads": threads,
+        "audio_seconds": round(duration, 2),
+        "elapsed_seconds": round(elapsed, 2),
+        "rtf": round(rtf, 3),
+    }
+    print(
+        f"[ASR] local {size} on {threads} threads: {duration:.1f}s audio in "
+        f"{elapsed:.1f}s (RTF {rtf:.2f})"
+    )
+    return {"text": text, **stats}
+
+
+def compress_for_upload(file_path):
+    """
+    Re-encode `file_path` as 16 kHz mono Opus next to the source and return
+    the new path. Reuses a previous encode if it is newer than the source.
+    """
+    out_path = os.path.splitext(file_path)[0] + ".asr.ogg"
+    if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(file_path):
+        return out_path
+    tmp = out_path + ".partial.ogg"
+    (
+        ffmpeg.input(file_path)
+        .output(
+            tmp,
+            vn=None,
+            ac=1,
+            ar=16000,
+            acodec="libopus",
+            audio_bitrate=asr_upload_bitrate,
+            application="voip",
+        )
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def split_for_upload(file_path, max_bytes):
+    """
+    Split `file_path` into stream-copied parts no larger than `max_bytes`
+    (with a 10% margin for container overhead). Returns the ordered part paths;
+    a file already under the limit is returned as is.
+    """
+    size = os.path.getsize(file_path)
+    if size <= max_bytes:
+        return [file_path]
+    duration = audio_duration(file_path)
+    part_seconds = max(1.0, duration * (max_bytes * 0.9) / size)
+    base, ext = os.path.splitext(file_path)
+    for old in glob.glob(f"{base}.part*{ext}"):
+        os.unlink(old)
+    (
+        ffmpeg.input(file_path)
+        .output(
+            f"{base}.part%03d{ext}",
+            f="segment",
+            segment_time=part_seconds,
+            acodec="copy",
+        )
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    parts = sorted(glob.glob(f"{base}.part*{ext}"))
+    too_big = [p for p in parts if os.path.getsize(p) > max_bytes]
+    if too_big:
+        raise ValueError(
+            f"Could not split {os.path.basename(file_path)} under "
+            f"{max_bytes / 1e6:.0f} MB per request"
+        )
+    return parts
+
+
+def prepare_upload(file_path, provider):
+    """
+    Compress and split `file_path` for a remote ASR `provider` ("groq" or
+    "hf"). Returns (part paths, stats with source/upload byte counts).
+    """
+    compressed = compress_for_upload(file_path)
+    parts = split_for_upload(compressed, int(UPLOAD_LIMITS_MB[provider] * 1e6))
+    stats = {
+        "engine": provider,
+        "source_bytes": os.path.getsize(file_path),
+        "upload_bytes": sum(os.path.getsize(p) for p in parts),
+        "parts": len(parts),
+    }
+    print(
+        f"[ASR] {provider} upload: {stats['source_bytes'] / 1e6:.1f} MB -> "
+        f"{stats['upload_bytes'] / 1e6:.1f} MB in {len(parts)} part(s)"
+    )
+    return parts, stats
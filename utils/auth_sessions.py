@@ -0,0 +1,238 @@
+"""
+Auth session layer in front of Firebase Admin.
+
+- User lookups (email -> uid) are cached in memory with a TTL, so repeat
+  logins skip the Firebase round trip.
+- Custom tokens are minted locally by the Admin SDK and reused until close
+  to their one-hour expiry.
+- Browser sessions are HMAC-signed cookies validated locally on every
+  rerun; no network call and no trust in a bare email cookie. Logging out
+  revokes the cookie's session id server-side (an append-only file shared
+  by the dashboard and the API), so a copied cookie stops working too.
+
+`AuthSessions(backend)` takes any object with the `utils.firebase_utils`
+functions it uses, so it can run against the Firebase Auth emulator
+(FIREBASE_AUTH_EMULATOR_HOST) or a local stub.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USER_CACHE_TTL = _settings.auth_user_cache_ttl
+CACHE_MAX_ENTRIES = _settings.auth_cache_max_entries
+SESSION_DAYS = _settings.auth_session_days
+# Custom tokens live one hour; reuse them for a bit less than that
+CUSTOM_TOKEN_TTL = 50 * 60
+SESSION_SECRET_FILE = os.path.join(PROJECT_DIR, ".session_secret")
+REVOKED_SESSIONS_FILE = os.path.join(PROJECT_DIR, ".revoked_sessions")
+
+
+class TTLCache:
+    """Small thread-safe dict whose entries expire after `ttl` seconds."""
+
+    def __init__(self, ttl, max_entries=CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            if len(self._data) >= self.max_entries:
+                now = time.time()
+                self._data = {k: v for k, v in self._data.items() if v[1] >= now}
+                if len(self._data) >= self.max_entries:
+                    # Still full: drop the entry closest to expiry
+                    self._data.pop(min(self._data, key=lambda k: self._data[k][1]))
+            self._data[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+def _load_secret():
+    """AUTH_SESSION_SECRET, or a random secret persisted next to the project."""
+    secret = _settings.auth_session_secret
+    if secret:
+        return secret.encode("utf-8")
+    if not os.path.exists(SESSION_SECRET_FILE):
+        # Write the whole secret to a temp file and link it into place: a
+        # concurrent process either wins the link or reads a complete file
+        fd, tmp = tempfile.mkstemp(dir=PROJECT_DIR, prefix=".session_secret.")
+        try:
+            with os.fdopen(fd, "w") as f:
+                f.write(secrets.token_hex(32))
+            try:
+                os.link(tmp, SESSION_SECRET_FILE)
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(tmp)
+    with open(SESSION_SECRET_FILE, "r") as f:
+        return f.read().strip().encode("utf-8")
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class AuthSessions:
+    def __init__(self, backend, secret=None):
+        self.backend = backend
+        self._secret = secret
+        self.users = TTLCache(USER_CACHE_TTL)
+        self.custom_tokens = TTLCache(CUSTOM_TOKEN_TTL)
+        self._revoked = {}  # session id -> expiry
+        self._revoked_size = -1
+        self._revoked_lock = threading.Lock()
+
+    @property
+    def secret(self):
+        if self._secret is None:
+            self._secret = _load_secret()
+        return self._secret
+
+    # -- users ---------------------------------------------------------------
+
+    def get_uid(self, email):
+        """uid for `email`, creating the Firebase user if needed (cached)."""
+        email = email.strip().lower()
+        uid = self.users.get(email)
+        if uid is None:
+            uid = self.backend.get_or_create_user(email).uid
+            self.users.set(email, uid)
+        return uid
+
+    def bulk_onboard(self, emails):
+        """Create users for all `emails` in batches and warm the user cache."""
+        created = self.backend.bulk_create_users(emails)
+        for email, uid in created.items():
+            self.users.set(email, uid)
+        return created
+
+    def custom_token(self, uid):
+        """Custom token for client sign-in; reused while still valid."""
+        token = self.custom_tokens.get(uid)
+        if token is None:
+            token = self.backend.mint_custom_token(uid)
+            if token:
+                self.custom_tokens.set(uid, token)
+        return token
+
+    # -- browser sessions ------------------------------------------------------
+
+    def issue_session(self, email, uid, days=SESSION_DAYS):
+        """Signed session cookie value for a verified login."""
+        payload = _b64(
+            json.dumps(
+                {
+                    "email": email,
+                    "uid": uid,
+                    "sid": secrets.token_urlsafe(12),
+                    "exp": int(time.time() + days * 86400),
+                },
+                separators=(",", ":"),
+            ).encode("utf-8")
+        )
+        sig = _b64(hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest())
+        return f"{payload}.{sig}"
+
+    def validate_session(self, token):
+        """Return {"email", "uid", "sid", "exp"} for a valid, unexpired, unrevoked cookie, else None."""
+        if not token or not isinstance(token, str) or token.count(".") != 1:
+            return None
+        payload, sig = token.split(".")
+        expected = _b64(
+            hmac.new(self.secret, payload.encode("ascii"), hashlib.sha256).digest()
+        )
+        if not hmac.compare_digest(sig, expected):
+            return None
+        try:
+            session = json.loads(_unb64(payload))
+        except ValueError:
+            return None
+        if session.get("exp", 0) < time.time() or not session.get("sid"):
+            return None
+        if session["sid"] in self._revoked_ids():
+            return None
+        return session
+
+    def revoke_session(self, token):
+        """Log a session cookie out everywhere; returns False if it was not valid."""
+        session = self.validate_session(token)
+        if session is None:
+            return False
+        # One short O_APPEND write per logout, so concurrent processes never
+        # lose each other's entries
+        line = f"{session['sid']} {session['exp']}\n".encode("ascii")
+        fd = os.open(REVOKED_SESSIONS_FILE, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        with self._revoked_lock:
+            self._revoked[session["sid"]] = session["exp"]
+        return True
+
+    def _revoked_ids(self):
+        """Revoked, not yet expired session ids; re-read when the file grows."""
+        with self._revoked_lock:
+            try:
+                size = os.path.getsize(REVOKED_SESSIONS_FILE)
+            except OSError:
+                size = 0
+            if size != self._revoked_size:
+                revoked = {}
+                if size:
+                    with open(REVOKED_SESSIONS_FILE, "r", encoding="ascii", errors="ignore") as f:
+                        for line in f:
+                            sid, _, exp = line.strip().partition(" ")
+                            if sid and exp.isdigit():
+                                revoked[sid] = int(exp)
+                self._revoked = revoked
+                self._revoked_size = size
+            now = time.time()
+            return {sid for sid, exp in self._revoked.items() if exp >= now}
+
+
+_sessions = None
+_sessions_lock = threading.Lock()
+
+
+def get_sessions():
+    """Process-wide AuthSessions backed by utils.firebase_utils."""
+    global _sessions
+    with _sessions_lock:
+        if _sessions is None:
+            import utils.firebase_utils as firebase
+
+            _sessions = AuthSessions(firebase)
+    return _sessions
@@ -1,9 +1,27 @@
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+import itertools
+import queue
 import random
 import string
-import os
+import threading
+import time
+
+from utils.auth_sessions import TTLCache
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+# Background dispatch: EMAIL_WORKERS threads, each holding one persistent,
+# authenticated SMTP connection that is health-checked with NOOP before reuse
+email_workers = _settings.email_workers
+email_max_retries = _settings.email_max_retries
+email_retry_backoff = _settings.email_retry_backoff
+# Connections idle for longer than this are dropped (providers close them anyway)
+smtp_idle_seconds = _settings.smtp_idle_seconds
+# Delivery states are kept long enough for the login page to read them
+STATUS_TTL = 15 * 60
 
 
 def generate_otp(length=6):
@@ -11,43 +29,229 @@ def generate_otp(length=6):
     return "".join(random.choices(string.digits, k=length))
 
 
+def _smtp_config():
+    return (
+        _settings.smtp_server,
+        _settings.smtp_port,
+        _settings.smtp_email,
+        _settings.smtp_password,
+    )
+
+
+def _build_message(sender, to_email, otp):
+    msg = MIMEMultipart()
+    msg["From"] = sender
+    msg["To"] = to_email
+    msg["Subject"] = "Your Login OTP"
+
+    body = (
+        f"Hello,\n\nYour One-Time Password (OTP) is: {otp}\n\n"
+        "This code expires in 5 minutes.\n\nBest,\nChameleon Stream Team"
+    )
+    msg.attach(MIMEText(body, "plain"))
+    return msg.as_string()
+
+
+class _SmtpConnection:
+    """One authenticated SMTP session, reopened when stale or broken."""
+
+    def __init__(self):
+        self.server = None
+        self.last_used = 0.0
+
+    def _open(self):
+        host, port, user, password = _smtp_config()
+        server = smtplib.SMTP(host, port, timeout=30)
+        server.starttls()
+        server.login(user, password)
+        self.server = server
+
+    def close(self):
+        if self.server is not None:
+            try:
+                self.server.quit()
+            except Exception:
+                pass
+            self.server = None
+
+    def ensure(self):
+        """Return a live session, reconnecting if idle too long or NOOP fails."""
+        if self.server is not None and time.time() - self.last_used > smtp_idle_seconds:
+            self.close()
+        if self.server is not None:
+            try:
+                if self.server.noop()[0] != 250:
+                    self.close()
+            except smtplib.SMTPException:
+                self.close()
+            except OSError:
+                self.close()
+        if self.server is None:
+            self._open()
+        return self.server
+
+    def send(self, to_email, text):
+        sender = _smtp_config()[2]
+        try:
+            self.ensure().sendmail(sender, to_email, text)
+        except (smtplib.SMTPServerDisconnected, OSError):
+            # The server dropped us between NOOP and send: one fresh attempt
+            self.close()
+            self.ensure().sendmail(sender, to_email, text)
+        self.last_used = time.time()
+
+
+def _error_message(e):
+    if isinstance(e, smtplib.SMTPAuthenticationError):
+        return "SMTP Authentication failed. Check your email/password."
+    if isinstance(e, smtplib.SMTPConnectError):
+        return "Could not connect to SMTP server."
+    return f"Failed to send email: {str(e)}"
+
+
+class EmailDispatcher:
+    """
+    Queue of outgoing OTP emails drained by worker threads with retries.
+
+    `submit()` returns immediately with a message id; `status(id)` reports
+    "queued", "sent" or "failed" (with the error) for STATUS_TTL seconds and
+    `stats()` the queue depth and send latency.
+    """
+
+    def __init__(self, workers=email_workers):
+        self._queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._status = TTLCache(STATUS_TTL)
+        self._sent = 0
+        self._failed = 0
+        self._latencies = []  # seconds from submit to delivery, most recent last
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True, name=f"email-{i}")
+            for i in range(workers)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, to_email, otp):
+        message_id = next(self._ids)
+        self._status.set(message_id, {"state": "queued", "error": None})
+        self._queue.put((message_id, to_email, otp, time.time()))
+        return message_id
+
+    def status(self, message_id):
+        return dict(self._status.get(message_id) or {"state": "unknown", "error": None})
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "queue_depth": self._queue.qsize(),
+                "sent": self._sent,
+                "failed": self._failed,
+                "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+                "latency_p95": latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0,
+            }
+
+    def _finish(self, message_id, state, error=None, submitted=None):
+        self._status.set(message_id, {"state": state, "error": error})
+        with self._lock:
+            if state == "sent":
+                self._sent += 1
+                self._latencies = (self._latencies + [time.time() - submitted])[-200:]
+            else:
+                self._failed += 1
+
+    def _run(self):
+        connection = _SmtpConnection()
+        while True:
+            message_id, to_email, otp, submitted = self._queue.get()
+            text = _build_message(_smtp_config()[2], to_email, otp)
+            for attempt in range(email_max_retries + 1):
+                try:
+                    connection.send(to_email, text)
+                    self._finish(message_id, "sent", submitted=submitted)
+                    break
+                except smtplib.SMTPAuthenticationError as e:
+                    # Retrying bad credentials only risks a provider lockout
+                    connection.close()
+                    self._finish(message_id, "failed", _error_message(e))
+                    break
+                except Exception as e:
+                    connection.close()
+                    print(f"Failed to send email (attempt {attempt + 1}): {e}")
+                    if attempt == email_max_retries:
+                        self._finish(message_id, "failed", _error_message(e))
+                    else:
+                        time.sleep(email_retry_backoff * (2**attempt))
+            self._queue.task_done()
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def _get_dispatcher():
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = EmailDispatcher()
+    return _dispatcher
+
+
+def _is_mock():
+    host, _port, user, password = _smtp_config()
+    return not (host and user and password)
+
+
+def _mock_send(to_email, otp):
+    print("f" + "-" * 50)
+    print(f" [MOCK EMAIL] To: {to_email} | OTP: {otp}")
+    print("f" + "-" * 50)
+
+
+def queue_otp_email(to_email, otp):
+    """
+    Queue the OTP email for background delivery and return a message id
+    (None in mock mode, where the OTP is printed immediately).
+    """
+    if _is_mock():
+        _mock_send(to_email, otp)
+        return None
+    return _get_dispatcher().submit(to_email, otp)
+
+
+def delivery_status(message_id):
+    """Return {"state": "queued"|"sent"|"failed"|"unknown", "error": str|None}."""
+    if message_id is None:
+        return {"state": "sent", "error": None}
+    return _get_dispatcher().status(message_id)
+
+
+def email_stats():
+    """Queue depth, delivered/failed counts and send latency, or None before the first email."""
+    with _dispatcher_lock:
+        dispatcher = _dispatcher
+    return dispatcher.stats() if dispatcher is not None else None
+
+
 def send_otp_email(to_email, otp):
     """
     Send OTP to the user via SMTP.
     Returns (bool, message).
     """
-    smtp_server = os.getenv("SMTP_SERVER")
-    smtp_port = os.getenv("SMTP_PORT", 587)
-    smtp_email = os.getenv("SMTP_EMAIL")
-    smtp_password = os.getenv("SMTP_PASSWORD")
-
     # Mock Mode
-    if not (smtp_server and smtp_email and smtp_password):
-        print("f" + "-" * 50)
-        print(f" [MOCK EMAIL] To: {to_email} | OTP: {otp}")
-        print("f" + "-" * 50)
+    if _is_mock():
+        _mock_send(to_email, otp)
         return True, "Mock email sent (check console)"
 
     try:
-        msg = MIMEMultipart()
-        msg["From"] = smtp_email
-        msg["To"] = to_email
-        msg["Subject"] = "Your Login OTP"
-
-        body = f"Hello,\n\nYour One-Time Password (OTP) is: {otp}\n\nThis code expires in 5 minutes.\n\nBest,\nChameleon Stream Team"
-        msg.attach(MIMEText(body, "plain"))
-
-        server = smtplib.SMTP(smtp_server, int(smtp_port))
-        server.starttls()
-        server.login(smtp_email, smtp_password)
-        text = msg.as_string()
-        server.sendmail(smtp_email, to_email, text)
-        server.quit()
+        connection = _SmtpConnection()
+        try:
+            connection.send(to_email, _build_message(_smtp_config()[2], to_email, otp))
+        finally:
+            connection.close()
         return True, "Email sent successfully"
-    except smtplib.SMTPAuthenticationError:
-        return False, "SMTP Authentication failed. Check your email/password."
-    except smtplib.SMTPConnectError:
-        return False, "Could not connect to SMTP server."
     except Exception as e:
         print(f"Failed to send email: {e}")
-        return False, f"Failed to send email: {str(e)}"
+        return False, _error_message(e)
@@ -0,0 +1,158 @@
+"""
+Detect-then-track face boxes for talking-head footage.
+
+The full detector only runs on keyframes (every `keyframe_interval` frames
+and at scene cuts); frames in between are tracked by normalized
+cross-correlation of the last detected face against a small search window.
+When tracking confidence drops, the frame is re-detected. Box smoothing is
+an exponential moving average applied by the tracker itself.
+"""
+import cv2
+import numpy as np
+
+from utils.settings import get_settings
+
+_settings = get_settings()
+KEYFRAME_INTERVAL = _settings.face_track_keyframe_interval
+MIN_CONFIDENCE = _settings.face_track_min_confidence
+SCENE_CUT_THRESHOLD = _settings.face_track_scene_cut
+SMOOTHING = _settings.face_track_smoothing
+
+# Faces are matched at roughly this width (px) to keep correlation cheap
+_TRACK_WIDTH = 64
+
+
+def _histogram(frame):
+    hsv = cv2.cvtColor(cv2.resize(frame, (160, 90)), cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, [16, 16], [0, 180, 0, 256])
+    return cv2.normalize(hist, hist).flatten()
+
+
+def iter_keyframes(frames, keyframe_interval=KEYFRAME_INTERVAL, cut_threshold=SCENE_CUT_THRESHOLD):
+    """
+    Scan `frames` and yield (index, frame, is_scene_cut) for every frame that
+    needs a full detection: the first frame, scene cuts, and one frame per
+    `keyframe_interval` within a shot.
+    """
+    prev_hist = None
+    last_key = 0
+    for i, frame in enumerate(frames):
+        hist = _histogram(frame)
+        is_cut = False
+        if prev_hist is None:
+            is_key = True
+        elif cv2.compareHist(prev_hist, hist, cv2.HISTCMP_CORREL) < cut_threshold:
+            is_key = is_cut = True
+        else:
+            is_key = i - last_key >= keyframe_interval
+        if is_key:
+            last_key = i
+            yield i, frame, is_cut
+        prev_hist = hist
+
+
+class _Tracker:
+    """Correlation tracker anchored on the last detected face."""
+
+    def __init__(self, frame, box):
+        x1, y1, x2, y2 = box
+        self.scale = min(1.0, _TRACK_WIDTH / max(1.0, x2 - x1))
+        self.box = np.array(box, dtype=np.float64)
+        gray = self._gray(frame)
+        sx1, sy1, sx2, sy2 = (self.box * self.scale).astype(int)
+        self.template = gray[sy1:sy2, sx1:sx2].copy()
+
+    def _gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale < 1.0:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def update(self, frame):
+        """Locate the face in `frame`; returns (box, confidence)."""
+        gray = self._gray(frame)
+        th, tw = self.template.shape[:2]
+        if th < 4 or tw < 4:
+            return self.box, 0.0
+        x1, y1, x2, y2 = self.box * self.scale
+        mx, my = 0.5 * tw, 0.5 * th
+        wx1, wy1 = int(max(0, x1 - mx)), int(max(0, y1 - my))
+        wx2 = int(min(gray.shape[1], x2 + mx))
+        wy2 = int(min(gray.shape[0], y2 + my))
+        window = gray[wy1:wy2, wx1:wx2]
+        if window.shape[0] < th or window.shape[1] < tw:
+            return self.box, 0.0
+        scores = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, (bx, by) = cv2.minMaxLoc(scores)
+        nx1, ny1 = (wx1 + bx) / self.scale, (wy1 + by) / self.scale
+        w, h = self.box[2] - self.box[0], self.box[3] - self.box[1]
+        self.box = np.array([nx1, ny1, nx1 + w, ny1 + h])
+        return self.box, float(confidence)
+
+
+def track_boxes(
+    open_frames,
+    detect_fn,
+    keyframe_interval=KEYFRAME_INTERVAL,
+    min_confidence=MIN_CONFIDENCE,
+    cut_threshold=SCENE_CUT_THRESHOLD,
+    smoothing=SMOOTHING,
+    detect_batch_size=16,
+):
+    """
+    Return one (x1, y1, x2, y2) face box per frame plus run statistics.
+
+    `open_frames()` must return a fresh iterator over the video frames; the
+    video is streamed twice (keyframe scan, then tracking) and never held in
+    memory. `detect_fn(images)` runs the full detector over a list of frames
+    and returns one rect (or None) per frame; keyframes are detected in
+    batches of `detect_batch_size`, low-confidence re-detections one at a time.
+    """
+    detected, cuts, pending = {}, set(), []
+
+    def flush():
+        rects = detect_fn([frame for _, frame in pending])
+        for (i, _), rect in zip(pending, rects):
+            detected[i] = rect
+        pending.clear()
+
+    for i, frame, is_cut in iter_keyframes(open_frames(), keyframe_interval, cut_threshold):
+        pending.append((i, frame))
+        if is_cut:
+            cuts.add(i)
+        if len(pending) >= detect_batch_size:
+            flush()
+    if pending:
+        flush()
+    stats = {"keyframes": len(detected), "redetections": 0}
+
+    boxes = []
+    tracker = None
+    smoothed = None
+    for i, frame in enumerate(open_frames()):
+        rect = detected.get(i)
+        if rect is not None:
+            box = np.array(rect[:4], dtype=np.float64)
+            tracker = _Tracker(frame, box)
+        elif tracker is not None:
+            box, confidence = tracker.update(frame)
+            if confidence < min_confidence:
+                stats["redetections"] += 1
+                rect = detect_fn([frame])[0]
+                if rect is not None:
+                    box = np.array(rect[:4], dtype=np.float64)
+                    tracker = _Tracker(frame, box)
+        else:
+            raise ValueError(
+                f"Face not detected in frame {i}! Ensure the video contains a face in all the frames."
+            )
+
+        if smoothed is None or i in cuts:
+            smoothed = box
+        else:
+            smoothed = smoothing * smoothed + (1.0 - smoothing) * box
+        boxes.append(smoothed.copy())
+
+    stats["frames"] = len(boxes)
+    stats["detections"] = stats["keyframes"] + stats["redetections"]
+    return boxes, stats
@@ -1,8 +1,18 @@
 import firebase_admin
 from firebase_admin import credentials, auth
 import os
+import uuid
 import streamlit as st
 
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+# When set (e.g. "localhost:9099"), the Admin SDK talks to the Firebase Auth
+# emulator instead of production and no service account is needed
+auth_emulator_host = _settings.firebase_auth_emulator_host
+firebase_project_id = _settings.firebase_project_id
+
 
 def init_firebase():
     """
@@ -16,6 +26,12 @@ def init_firebase():
     except ValueError:
         # Not initialized, try to init
         try:
+            # 0. Auth emulator (local development / tests)
+            if auth_emulator_host:
+                firebase_admin.initialize_app(options={"projectId": firebase_project_id})
+                print(f"Using Firebase Auth emulator at {auth_emulator_host}")
+                return True
+
             # 1. Try local file (development)
             cred_path = "serviceAccountKey.json"
             if os.path.exists(cred_path):
@@ -84,3 +100,35 @@ def mint_custom_token(uid):
     except Exception as e:
         print(f"Minting custom token failed: {e}")
         return None
+
+
+def bulk_create_users(emails, batch_size=1000):
+    """
+    Create Firebase users for every email that doesn't have one yet.
+
+    Existing accounts are looked up 100 at a time and new ones are imported
+    in batches of up to `batch_size` (auth.import_users' limit is 1000), so
+    onboarding N users costs about N/100 round trips instead of 2N.
+    Returns {email: uid} for every email that exists or was created.
+    """
+    emails = list(dict.fromkeys(e.strip().lower() for e in emails if e and e.strip()))
+    found = {}
+    for i in range(0, len(emails), 100):
+        chunk = emails[i : i + 100]
+        result = auth.get_users([auth.EmailIdentifier(e) for e in chunk])
+        for user in result.users:
+            found[user.email.lower()] = user.uid
+    missing = [e for e in emails if e not in found]
+    for i in range(0, len(missing), batch_size):
+        records = [
+            auth.ImportUserRecord(uid=uuid.uuid4().hex[:28], email=e)
+            for e in missing[i : i + batch_size]
+        ]
+        result = auth.import_users(records)
+        failed = {err.index for err in result.errors}
+        for index, record in enumerate(records):
+            if index in failed:
+                print(f"Bulk import failed for {record.email}")
+            else:
+                found[record.email] = record.uid
+    return found
@@ -0,0 +1,121 @@
+import json
+import os
+import time
+import uuid
+
+from utils.settings import get_settings
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOBS_DIR = get_settings().jobs_dir or os.path.join(PROJECT_DIR, "jobs")
+
+# Pipeline stages in execution order; each records its artifacts in the manifest
+STAGES = ["upload", "extract", "transcribe", "translate", "tts", "video"]
+
+MANIFEST_NAME = "manifest.json"
+
+
+def job_dir(job_id):
+    """Return the directory holding a job's artifacts and manifest."""
+    return os.path.join(JOBS_DIR, job_id)
+
+
+def create_job(source_name=""):
+    """Create a new job directory with an empty manifest."""
+    job_id = uuid.uuid4().hex[:12]
+    os.makedirs(job_dir(job_id), exist_ok=True)
+    job = {
+        "id": job_id,
+        "source_name": source_name,
+        "created_at": time.time(),
+        "stages": {},
+        "state": {},
+    }
+    save_job(job)
+    return job
+
+
+def load_job(job_id):
+    """Load a job manifest, or return None if the job does not exist."""
+    # Job ids come from the URL, so never let them escape JOBS_DIR
+    if not job_id or os.path.basename(job_id) != job_id:
+        return None
+    path = os.path.join(job_dir(job_id), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Failed to read job manifest {path}: {e}")
+        return None
+
+
+def save_job(job):
+    """Atomically write the job manifest so a crash never leaves it half-written."""
+    path = os.path.join(job_dir(job["id"]), MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def job_path(job, *parts):
+    """Return a path inside the job directory, creating parent folders."""
+    path = os.path.join(job_dir(job["id"]), *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def stage_dir(job, stage):
+    """Return (and create) the working directory for one stage's artifacts."""
+    path = os.path.join(job_dir(job["id"]), stage)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def start_stage(job, stage, **info):
+    """Mark a stage as running (so an interrupted run is visible after restart)."""
+    job["stages"][stage] = {"status": "running", "started_at": time.time(), **info}
+    save_job(job)
+
+
+def complete_stage(job, stage, artifacts=None, **state):
+    """
+    Mark a stage complete, recording artifact paths and any session state
+    needed to restore the pipeline after a restart.
+    """
+    entry = job["stages"].get(stage, {})
+    entry.update(
+        {"status": "done", "finished_at": time.time(), "artifacts": artifacts or {}}
+    )
+    job["stages"][stage] = entry
+    job["state"].update(state)
+    save_job(job)
+
+
+def stage_done(job, stage):
+    """True if the stage completed and all of its artifacts are still on disk."""
+    entry = job["stages"].get(stage)
+    if not entry or entry.get("status") != "done":
+        return False
+    return all(os.path.exists(p) for p in entry.get("artifacts", {}).values() if p)
+
+
+def last_completed_stage(job):
+    """Return the latest stage (in pipeline order) that finished intact, or None."""
+    done = None
+    for stage in STAGES:
+        if stage_done(job, stage):
+            done = stage
+    return done
+
+
+def interrupted_stages(job):
+    """Return stages that were started but never finished (e.g. killed by a restart)."""
+    return [
+        stage
+        for stage in STAGES
+        if job["stages"].get(stage, {}).get("status") == "running"
+    ]
@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+"""
+Optimized Wav2Lip model variants for CPU inference.
+
+    python utils/lipsync_models.py export     # build all variants
+    python utils/lipsync_models.py validate   # compare against fp32, benchmark, record
+
+Variants of the generator:
+  fp32        original state_dict model (reference)
+  ts_fused    TorchScript, frozen, conv+bn folded by optimize_for_inference
+  onnx_fp32   ONNX Runtime with full graph fusion
+  onnx_int8   ONNX Runtime with dynamic int8 quantization (Conv/MatMul weights)
+
+The S3FD face detector is exported as a frozen, fused TorchScript module.
+Validation runs every variant on real (mel, face) batches cut from a sample
+clip by the runner's own preprocessing (`LIPSYNC_SAMPLE_VIDEO`, or
+`--sample_video`) and compares the generated frames with fp32. It writes
+`variants.json`; the lip-sync runner only ever loads a variant that was
+validated against the current checkpoint.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WAV2LIP_DIR = os.path.join(PROJECT_DIR, "wav2lip")
+
+# Run as a script, only utils/ is on the path: add the wav2lip modules and
+# the project root (for utils.settings and utils.wav2lip_inference)
+for _path in (WAV2LIP_DIR, PROJECT_DIR):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
+
+from utils.settings import get_settings  # noqa: E402
+
+_settings = get_settings()
+
+DEFAULT_CHECKPOINT = os.path.join(WAV2LIP_DIR, "checkpoints", "wav2lip_gan.pth")
+S3FD_CHECKPOINT = os.path.join(
+    WAV2LIP_DIR, "face_detection", "detection", "sfd", "s3fd.pth"
+)
+VARIANTS_DIR = _settings.lipsync_variants_dir or os.path.join(
+    WAV2LIP_DIR, "checkpoints", "optimized"
+)
+REPORT_PATH = os.path.join(VARIANTS_DIR, "variants.json")
+
+GENERATOR_VARIANTS = ["fp32", "ts_fused", "onnx_fp32", "onnx_int8"]
+
+# Clip whose frames and audio drive validation; audio defaults to the clip's own track
+SAMPLE_VIDEO = _settings.lipsync_sample_video
+SAMPLE_AUDIO = _settings.lipsync_sample_audio
+
+# A variant is accepted if its output frames stay this close to fp32
+MIN_PSNR = _settings.lipsync_variant_min_psnr
+
+IMG_SIZE = 96
+
+
+def _fingerprint(path):
+    st_ = os.stat(path)
+    return f"{os.path.basename(path)}:{st_.st_size}:{int(st_.st_mtime)}"
+
+
+def variant_path(checkpoint_path, variant):
+    stem = os.path.splitext(os.path.basename(checkpoint_path))[0]
+    ext = ".pt" if variant == "ts_fused" else ".onnx"
+    return os.path.join(VARIANTS_DIR, f"{stem}_{variant}{ext}")
+
+
+def detector_path():
+    return os.path.join(VARIANTS_DIR, "s3fd_ts_fused.pt")
+
+
+def load_fp32(checkpoint_path, device="cpu"):
+    """Load the reference Wav2Lip generator from its state_dict checkpoint."""
+    from models import Wav2Lip
+
+    model = Wav2Lip()
+    checkpoint = torch.load(checkpoint_path, map_location=device, weights_only=False)
+    state = {k.replace("module.", ""): v for k, v in checkpoint["state_dict"].items()}
+    model.load_state_dict(state)
+    return model.to(device).eval()
+
+
+def example_inputs(batch=4, seed=0):
+    """Deterministic (mel, face) inputs shaped like the runner's batches, for tracing."""
+    rng = np.random.default_rng(seed)
+    mel = torch.from_numpy(rng.standard_normal((batch, 1, 80, 16)).astype(np.float32))
+    face = torch.from_numpy(
+        rng.random((batch, 6, IMG_SIZE, IMG_SIZE)).astype(np.float32)
+    )
+    face[:, :3, IMG_SIZE // 2 :] = 0  # masked lower half, as in inference
+    return mel, face
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+
+def export_torchscript(checkpoint_path):
+    model = load_fp32(checkpoint_path)
+    mel, face = example_inputs()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, (mel, face))
+    fused = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    out = variant_path(checkpoint_path, "ts_fused")
+    torch.jit.save(fused, out)
+    return out
+
+
+def export_onnx(checkpoint_path):
+    model = load_fp32(checkpoint_path)
+    mel, face = example_inputs()
+    out = variant_path(checkpoint_path, "onnx_fp32")
+    torch.onnx.export(
+        model,
+        (mel, face),
+        out,
+        input_names=["mel", "face"],
+        output_names=["frames"],
+        dynamic_axes={"mel": {0: "batch"}, "face": {0: "batch"}, "frames": {0: "batch"}},
+        opset_version=17,
+        do_constant_folding=True,
+    )
+    return out
+
+
+def export_onnx_int8(checkpoint_path):
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    src = variant_path(checkpoint_path, "onnx_fp32")
+    if not os.path.exists(src):
+        export_onnx(checkpoint_path)
+    out = variant_path(checkpoint_path, "onnx_int8")
+    quantize_dynamic(src, out, weight_type=QuantType.QUInt8)
+    return out
+
+
+def export_detector():
+    from face_detection.detection.sfd.net_s3fd import s3fd
+
+    net = s3fd()
+    net.load_state_dict(torch.load(S3FD_CHECKPOINT, map_location="cpu"))
+    net.eval()
+    example = torch.rand(1, 3, 360, 640) * 255
+    with torch.no_grad():
+        traced = torch.jit.trace(net, example, strict=False)
+    fused = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    out = detector_path()
+    torch.jit.save(fused, out)
+    return out
+
+
+EXPORTERS = {
+    "ts_fused": export_torchscript,
+    "onnx_fp32": export_onnx,
+    "onnx_int8": export_onnx_int8,
+}
+
+
+# ---------------------------------------------------------------------------
+# Loading
+# ---------------------------------------------------------------------------
+
+
+class OnnxGenerator:
+    """Callable with the same (mel, face) -> frames signature as the torch model."""
+
+    def __init__(self, path, threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, mel, face):
+        out = self.session.run(
+            None, {"mel": mel.cpu().numpy(), "face": face.cpu().numpy()}
+        )[0]
+        return torch.from_numpy(out)
+
+    def eval(self):
+        return self
+
+
+def load_variant(checkpoint_path, variant, device="cpu", threads=0):
+    if variant == "fp32":
+        return load_fp32(checkpoint_path, device)
+    path = variant_path(checkpoint_path, variant)
+    if variant == "ts_fused":
+        return torch.jit.load(path, map_location=device).eval()
+    return OnnxGenerator(path, threads)
+
+
+def read_report():
+    if not os.path.exists(REPORT_PATH):
+        return {}
+    try:
+        with open(REPORT_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def best_variant(checkpoint_path, device="cpu"):
+    """
+    Fastest variant validated against this exact checkpoint, or "fp32".
+    Exported variants are CPU-only; on GPU the original model is used.
+    """
+    if device != "cpu":
+        return "fp32"
+    entry = read_report().get(os.path.abspath(checkpoint_path))
+    if not entry or entry.get("checkpoint") != _fingerprint(checkpoint_path):
+        return "fp32"
+    verified = [
+        (info["ms_per_frame"], name)
+        for name, info in entry.get("variants", {}).items()
+        if info.get("verified") and (name == "fp32" or os.path.exists(info["path"]))
+    ]
+    return min(verified)[1] if verified else "fp32"
+
+
+def load_best_generator(checkpoint_path, device="cpu", threads=0, variant="auto"):
+    """Load the requested (or fastest verified) generator variant; returns (model, name)."""
+    if variant == "auto":
+        variant = best_variant(checkpoint_path, device)
+    try:
+        return load_variant(checkpoint_path, variant, device, threads), variant
+    except Exception as e:
+        print(f"Loading {variant} variant failed ({e}); falling back to fp32")
+        return load_fp32(checkpoint_path, device), "fp32"
+
+
+def use_fast_detector(face_alignment, device="cpu"):
+    """Swap the S3FD network inside a FaceAlignment for the fused export, if verified."""
+    path = detector_path()
+    entry = read_report().get("s3fd")
+    if device != "cpu" or not entry or not entry.get("verified"):
+        return False
+    if not os.path.exists(path) or entry.get("checkpoint") != _fingerprint(S3FD_CHECKPOINT):
+        return False
+    face_alignment.face_detector.face_detector = torch.jit.load(path, map_location=device)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Validation
+# ---------------------------------------------------------------------------
+
+
+def _psnr(reference, candidate):
+    mse = float(np.mean((reference - candidate) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(1.0 / mse)
+
+
+def sample_inputs(video_path, audio_path=None, batch=16):
+    """
+    Real (mel, face) batch from the first `batch` frames of a clip, built by
+    the lip-sync runner's own face detection, cropping and mel windowing.
+    """
+    import utils.wav2lip_inference as runner
+
+    if not os.path.exists(video_path):
+        raise ValueError(f"Sample video not found: {video_path}")
+    fps, count, width, height = runner.video_info(video_path, 1)
+    count = min(batch, count or batch)
+    with tempfile.TemporaryDirectory() as tmp:
+        if not audio_path:
+            audio_path = os.path.join(tmp, "sample.wav")
+            subprocess.run(
+                ["ffmpeg", "-y", "-loglevel", "error", "-i", video_path,
+                 "-t", str(count / fps + 1), "-ac", "1", "-ar", "16000", audio_path],
+                check=True,
+            )
+        mels = runner.mel_chunks_for(audio_path, fps)
+    boxes = runner.detect_faces(
+        video_path, 1, [0, 10, 0, 0], 16, False, "every_frame", 480, (width, height),
+        start=0, count=count,
+    )
+    indices = list(range(min(count, len(boxes))))
+    mels = [mels[min(i, len(mels) - 1)] for i in indices]
+    frames = runner.iter_sources(video_path, 1, len(boxes), indices)
+    (img_batch, mel_batch), _, _ = next(runner.datagen(frames, boxes, mels, indices, len(indices)))
+    mel, face = runner.to_tensors(img_batch, mel_batch)
+    return mel.cpu(), face.cpu()
+
+
+def sample_frame(video_path, height=480):
+    """First frame of the clip at detection resolution, as the S3FD network takes it."""
+    import cv2
+
+    stream = cv2.VideoCapture(video_path)
+    ok, frame = stream.read()
+    stream.release()
+    if not ok:
+        raise ValueError(f"Could not read a frame from {video_path}")
+    scale = min(1.0, height / float(frame.shape[0]))
+    frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    image = frame.astype(np.float32) - np.array([104, 117, 123], dtype=np.float32)
+    return torch.from_numpy(image.transpose(2, 0, 1)).unsqueeze(0)
+
+
+def _run(model, mel, face, repeats=3):
+    with torch.no_grad():
+        out = model(mel, face)  # warm-up
+        started = time.perf_counter()
+        for _ in range(repeats):
+            out = model(mel, face)
+        elapsed = (time.perf_counter() - started) / repeats
+    return out.cpu().numpy(), elapsed * 1000.0 / mel.shape[0]
+
+
+def validate(
+    checkpoint_path, sample_video=SAMPLE_VIDEO, sample_audio=SAMPLE_AUDIO, threads=0, batch=16,
+    min_psnr=MIN_PSNR,
+):
+    """
+    Compare every exported variant's generated frames against fp32 on a real
+    batch from `sample_video`, benchmark it and record the results.
+    """
+    if not sample_video:
+        raise ValueError(
+            "Validation needs a sample clip with a face: pass --sample_video or set LIPSYNC_SAMPLE_VIDEO"
+        )
+    if threads:
+        torch.set_num_threads(threads)
+    mel, face = sample_inputs(sample_video, sample_audio, batch=batch)
+    reference_model = load_fp32(checkpoint_path)
+    reference, ref_ms = _run(reference_model, mel, face)
+    variants = {
+        "fp32": {"path": checkpoint_path, "verified": True, "psnr": None, "ms_per_frame": ref_ms}
+    }
+    print(f"fp32        {ref_ms:8.2f} ms/frame (reference)")
+    for name in GENERATOR_VARIANTS[1:]:
+        path = variant_path(checkpoint_path, name)
+        if not os.path.exists(path):
+            print(f"{name:<11} missing (run export)")
+            continue
+        try:
+            model = load_variant(checkpoint_path, name, threads=threads)
+            out, ms = _run(model, mel, face)
+        except Exception as e:
+            print(f"{name:<11} failed to run: {e}")
+            variants[name] = {"path": path, "verified": False, "error": str(e)}
+            continue
+        psnr = _psnr(reference, out)
+        ok = psnr >= min_psnr
+        variants[name] = {"path": path, "verified": ok, "psnr": psnr, "ms_per_frame": ms}
+        print(
+            f"{name:<11} {ms:8.2f} ms/frame  PSNR {psnr:6.2f} dB  "
+            f"{'OK' if ok else f'REJECTED (< {min_psnr} dB)'}"
+        )
+
+    report = read_report()
+    report[os.path.abspath(checkpoint_path)] = {
+        "checkpoint": _fingerprint(checkpoint_path),
+        "validated_at": time.time(),
+        "threads": threads or torch.get_num_threads(),
+        "sample": os.path.basename(sample_video),
+        "variants": variants,
+    }
+    if os.path.exists(detector_path()):
+        report["s3fd"] = validate_detector(sample_video, min_psnr)
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    with open(REPORT_PATH, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Selected for CPU: {best_variant(checkpoint_path)}")
+    return report
+
+
+def validate_detector(sample_video, min_psnr=MIN_PSNR):
+    """Detection confidence maps of the fused S3FD must match the original on a real frame."""
+    from face_detection.detection.sfd.net_s3fd import s3fd
+
+    net = s3fd()
+    net.load_state_dict(torch.load(S3FD_CHECKPOINT, map_location="cpu"))
+    net.eval()
+    fused = torch.jit.load(detector_path(), map_location="cpu")
+    image = sample_frame(sample_video)
+    with torch.no_grad():
+        ref = net(image)
+        out = fused(image)
+    # Compare the softmaxed classification maps (every other output)
+    worst = min(
+        _psnr(
+            torch.softmax(r, dim=1).numpy(), torch.softmax(o, dim=1).numpy()
+        )
+        for r, o in zip(ref[0::2], out[0::2])
+    )
+    ok = worst >= min_psnr
+    print(f"s3fd fused  PSNR {worst:6.2f} dB  {'OK' if ok else 'REJECTED'}")
+    return {"checkpoint": _fingerprint(S3FD_CHECKPOINT), "verified": ok, "psnr": worst}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export and validate optimized Wav2Lip variants")
+    parser.add_argument("command", choices=["export", "validate"])
+    parser.add_argument("--checkpoint_path", default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--sample_video", default=SAMPLE_VIDEO, help="Clip with a face to validate on")
+    parser.add_argument("--sample_audio", default=SAMPLE_AUDIO, help="Driving audio (default: the clip's)")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--min_psnr", type=float, default=MIN_PSNR)
+    args = parser.parse_args()
+
+    os.makedirs(VARIANTS_DIR, exist_ok=True)
+    if args.command == "export":
+        for name, exporter in EXPORTERS.items():
+            try:
+                print(f"Exported {name}: {exporter(args.checkpoint_path)}")
+            except Exception as e:
+                print(f"Export of {name} failed: {e}")
+        try:
+            print(f"Exported s3fd: {export_detector()}")
+        except Exception as e:
+            print(f"Export of s3fd failed: {e}")
+    else:
+        if not args.sample_video:
+            parser.error("validate needs --sample_video (or LIPSYNC_SAMPLE_VIDEO)")
+        validate(
+            args.checkpoint_path, args.sample_video, args.sample_audio,
+            threads=args.threads, min_psnr=args.min_psnr,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Registry of installed model weights.
+
+`download_models.py` installs the models listed in `model_manifest.json`
+and records each one here (path, SHA-256, size, mtime, source). Pipeline
+stages call `model_path(name)` at startup: a registered model whose size or
+mtime changed since install is re-hashed, and a checksum mismatch raises
+instead of letting corrupted weights reach inference.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.settings import get_settings
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MANIFEST_PATH = os.path.join(PROJECT_DIR, "model_manifest.json")
+REGISTRY_PATH = get_settings().model_registry or os.path.join(
+    PROJECT_DIR, "models", "registry.json"
+)
+
+_lock = threading.Lock()
+
+
+def load_manifest():
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)["models"]
+
+
+def load_registry():
+    if not os.path.exists(REGISTRY_PATH):
+        return {}
+    with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
+        return json.load(f).get("models", {})
+
+
+def save_registry(models):
+    os.makedirs(os.path.dirname(REGISTRY_PATH), exist_ok=True)
+    tmp = REGISTRY_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"models": models}, f, indent=2, sort_keys=True)
+    os.replace(tmp, REGISTRY_PATH)
+
+
+def abs_path(path):
+    return path if os.path.isabs(path) else os.path.join(PROJECT_DIR, path)
+
+
+def _files(path):
+    if os.path.isfile(path):
+        return [path]
+    found = []
+    for root, _dirs, names in os.walk(path):
+        found.extend(os.path.join(root, n) for n in names)
+    return sorted(found)
+
+
+def stat_key(path):
+    """(total size, latest mtime) of a file or model directory."""
+    files = _files(path)
+    return (
+        sum(os.path.getsize(p) for p in files),
+        max((os.path.getmtime(p) for p in files), default=0.0),
+    )
+
+
+def sha256_path(path, chunk_size=1 << 20):
+    """SHA-256 of a file, or of a directory's relative file names and contents."""
+    digest = hashlib.sha256()
+    is_dir = os.path.isdir(path)
+    for p in _files(path):
+        if is_dir:
+            digest.update(os.path.relpath(p, path).replace(os.sep, "/").encode("utf-8"))
+        with open(p, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record(name, path, sha256, source):
+    """Register an installed, verified model."""
+    size, mtime = stat_key(path)
+    stored = os.path.relpath(path, PROJECT_DIR) if path.startswith(PROJECT_DIR) else path
+    with _lock:
+        models = load_registry()
+        models[name] = {
+            "path": stored,
+            "sha256": sha256,
+            "size": size,
+            "mtime": mtime,
+            "source": source,
+            "installed_at": time.time(),
+        }
+        save_registry(models)
+
+
+@functools.lru_cache(maxsize=None)
+def _verified(path, sha256, size, mtime):
+    # Cached per (path, size, mtime): each process hashes a changed file once
+    return sha256_path(path) == sha256
+
+
+def model_path(name, default=None):
+    """
+    Verified path of model `name`.
+
+    Returns the registered path after checking it against its recorded
+    checksum (a full re-hash only when size/mtime changed). Unregistered
+    models fall back to `default` if it exists, with a warning; otherwise
+    None. Raises ValueError if the installed weights are corrupted.
+    """
+    entry = load_registry().get(name)
+    if entry is None:
+        if default and os.path.exists(default):
+            print(
+                f"[models] {name} is not in the registry; run "
+                "'python download_models.py' to verify it"
+            )
+            return default
+        return None
+    path = abs_path(entry["path"])
+    if not os.path.exists(path):
+        return None
+    size, mtime = stat_key(path)
+    if (size, mtime) != (entry["size"], entry["mtime"]) and not _verified(
+        path, entry["sha256"], size, mtime
+    ):
+        raise ValueError(
+            f"Model '{name}' at {path} failed its SHA-256 check (corrupted or modified). "
+            f"Run 'python download_models.py --only {name} --force' to reinstall."
+        )
+    return path
@@ -0,0 +1,648 @@
+"""
+Pipeline stage functions shared by the dashboard, the API and workers.
+
+Nothing here depends on Streamlit: progress and queue position are reported
+through `on_progress` / `on_wait` callbacks.
+"""
+import collections
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import utils.artifact_store as artifact_store
+import utils.asr as asr
+import utils.model_registry as model_registry
+import utils.redub as redub
+import utils.scheduler as scheduler
+import utils.translation as translation
+import utils.tts as tts
+from utils.settings import get_settings
+
+settings = get_settings()
+
+
+def extract_audio(video_path):
+    """Extracts audio from video and saves as MP3"""
+    # MoviePy import with fallback to avoid missing editor module
+    try:
+        from moviepy.editor import VideoFileClip  # preferred path
+    except ImportError:
+        from moviepy.video.io.VideoFileClip import VideoFileClip
+
+    video = VideoFileClip(video_path)
+    audio_path = video_path.replace(".mp4", ".mp3").replace(".mov", ".mp3")
+    video.audio.write_audiofile(audio_path, logger=None)
+    return audio_path
+
+
+def _transcribe_local(file_path, on_wait=None, stats=None):
+    """Run the local faster-whisper engine inside a heavy-job slot."""
+    with scheduler.heavy_slot("asr", on_wait=on_wait) as threads:
+        result = asr.transcribe_local(file_path, threads)
+    if stats is not None:
+        stats.update({k: v for k, v in result.items() if k != "text"})
+    return result["text"]
+
+
+def transcribe_audio(file_path, on_wait=None, stats=None):
+    """
+    Transcribes audio using priority: local Faster-Whisper (if USE_LOCAL_ASR) →
+    Groq Whisper → HF Whisper → local Faster-Whisper.
+    Remote engines receive compact Opus audio streamed from disk, split to
+    stay under the provider's size limit.
+    Timing/upload stats (engine, model size, real-time factor, bytes sent)
+    are written into `stats`.
+    """
+    # Local-first when requested (air-gapped hosts): never touch the network
+    if settings.use_local_asr:
+        return _transcribe_local(file_path, on_wait=on_wait, stats=stats)
+
+    # Groq ASR first if available
+    if settings.groq_api_key:
+        from groq import Groq
+
+        client = Groq(api_key=settings.groq_api_key)
+        parts, upload_stats = asr.prepare_upload(file_path, "groq")
+        texts = []
+        for part in parts:
+            with open(part, "rb") as f:
+                resp = client.audio.transcriptions.create(
+                    file=(os.path.basename(part), f),
+                    model="whisper-large-v3",
+                    response_format="text",
+                    temperature=0,
+                )
+            texts.append(resp.strip())
+        if stats is not None:
+            stats.update(upload_stats)
+        return " ".join(t for t in texts if t)
+
+    # Local ASR path
+    if not settings.hf_token:
+        return _transcribe_local(file_path, on_wait=on_wait, stats=stats)
+
+    from huggingface_hub import InferenceClient
+
+    client = InferenceClient(
+        model="openai/whisper-large-v3", token=settings.hf_token, provider="hf-inference"
+    )
+    parts, upload_stats = asr.prepare_upload(file_path, "hf")
+    texts = [client.automatic_speech_recognition(part).text.strip() for part in parts]
+    if stats is not None:
+        stats.update(upload_stats)
+    return " ".join(t for t in texts if t)
+
+
+def translate_text(text: str, source_lang: str = "en", target_lang: str = "hi") -> str:
+    """Translate text with the configured backend (see utils.translation)."""
+    return translation.translate_batch([text], source_lang, target_lang)[0]
+
+
+def synthesize_speech(
+    text: str,
+    voice_id: str = "21m00Tcm4TlvDq8ikWAM",
+    model_id: str = "eleven_multilingual_v2",
+) -> str:
+    """Synthesize one text with the configured TTS backend; returns a 16 kHz wav path."""
+    return tts.synthesize_batch([text], voice_id, model_id)[0]
+
+
+def synthesize_clips(texts, voice_id=None, model_id=None, backend=None, work_dir=None, on_wait=None, stats=None):
+    """
+    Synthesize many segments in one batch (in-process, or with PIPELINE_QUEUE
+    on an `api` worker for ElevenLabs and a `tts-local` one for MMS-TTS). Returns 16 kHz mono wav paths in order and
+    writes the backend's timing / real-time factor into `stats`.
+    """
+    result = dispatch(
+        "tts",
+        params={"texts": list(texts), "voice_id": voice_id, "model_id": model_id, "backend": backend},
+        work_dir=work_dir,
+        on_wait=on_wait,
+    )
+    if stats is not None:
+        stats.update(result["data"]["stats"])
+    files = result["files"]
+    return [files[f"clip{i}"] for i in range(len(files))]
+
+
+def replace_audio_track(video_path: str, audio_path: str, work_dir: str = None) -> str:
+    """
+    Replace the audio track of `video_path` with `audio_path` using ffmpeg.
+    This avoids MoviePy set_audio issues on some installs.
+    Returns path to the new video file.
+    """
+    import ffmpeg
+
+    out_path = tempfile.NamedTemporaryFile(
+        delete=False, suffix=".mp4", dir=work_dir
+    ).name
+    try:
+        video_in = ffmpeg.input(video_path)
+        audio_in = ffmpeg.input(audio_path)
+        (
+            ffmpeg.output(
+                video_in.video,
+                audio_in.audio,
+                out_path,
+                vcodec="copy",
+                acodec="aac",
+                shortest=None,
+            )
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        # Clean up on error
+        if os.path.exists(out_path):
+            os.unlink(out_path)
+        raise ValueError(
+            f"FFmpeg failed to mux audio: {e.stderr.decode('utf-8', errors='ignore') if hasattr(e, 'stderr') else e}"
+        )
+    return out_path
+
+
+def _file_fingerprint(path: str) -> str:
+    """Cheap identity for a media file: path, size and mtime."""
+    st_ = os.stat(path)
+    return redub.text_key(os.path.abspath(path), st_.st_size, int(st_.st_mtime))
+
+
+@functools.lru_cache(maxsize=None)
+def _lipsync_logger():
+    """Logger writing Wav2Lip output to a size-capped, rotating file."""
+    log_dir = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "wav2lip", "results"
+    )
+    os.makedirs(log_dir, exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(
+        os.path.join(log_dir, "inference.log"),
+        maxBytes=settings.lipsync_log_max_mb * 1024 * 1024,
+        backupCount=settings.lipsync_log_backups,
+        encoding="utf-8",
+    )
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger = logging.getLogger("wav2lip")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler)
+    return logger
+
+
+class LipSyncError(RuntimeError):
+    """Wav2Lip stalled or failed; running it again resumes from its last checkpoint."""
+
+
+def _run_streaming(cmd, cwd, env, run_id, on_progress=None):
+    """
+    Run the lip-sync runner, streaming its output line by line into the
+    rotating log and parsing PROGRESS lines for `on_progress`. The process is
+    killed if its progress stalls for LIPSYNC_STALL_SECONDS.
+    Returns (exit code, last output lines).
+    """
+    logger = _lipsync_logger()
+    stall_seconds = settings.lipsync_stall_seconds
+    proc = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+    )
+    lines = queue.Queue()
+
+    def pump():
+        for line in proc.stdout:
+            lines.put(line.rstrip("\n"))
+        lines.put(None)
+
+    threading.Thread(target=pump, daemon=True).start()
+    tail = collections.deque(maxlen=200)
+    last_advance = time.time()
+    last_progress = None
+    stage_start = {}  # stage -> (time, done) when first seen
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=1.0)
+            except queue.Empty:
+                line = ""
+            if line is None:
+                break
+            info = None
+            if line.startswith("PROGRESS "):
+                try:
+                    info = json.loads(line[len("PROGRESS "):])
+                    info = {
+                        **info,
+                        "stage": str(info["stage"]),
+                        "done": int(info["done"]),
+                        "total": int(info["total"]),
+                    }
+                except (ValueError, TypeError, KeyError):
+                    info = None  # garbled progress is just logged
+            if info is not None:
+                key = (info["stage"], info["done"])
+                if key != last_progress:
+                    last_progress = key
+                    last_advance = time.time()
+                t0, d0 = stage_start.setdefault(info["stage"], (time.time(), info["done"]))
+                elapsed = time.time() - t0
+                if elapsed > 1.0 and info["done"] > d0:
+                    info["fps"] = (info["done"] - d0) / elapsed
+                    info["eta"] = (info["total"] - info["done"]) / info["fps"]
+                if on_progress is not None:
+                    on_progress(info)
+            elif line:
+                tail.append(line)
+                logger.info(f"[{run_id}] {line}")
+            if time.time() - last_advance > stall_seconds:
+                logger.info(f"[{run_id}] killed: no progress for {stall_seconds}s")
+                raise LipSyncError(
+                    f"Wav2Lip stalled: no progress for {stall_seconds}s. "
+                    "Run it again to resume from the last checkpoint."
+                )
+    finally:
+        # Never leave Wav2Lip running after its heavy slot is released (stall,
+        # a raising callback, a Streamlit rerun or an abandoned worker task)
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    code = proc.wait()
+    logger.info(f"[{run_id}] exited with code {code}")
+    return code, "\n".join(tail)
+
+
+def apply_lip_sync(
+    video_path: str,
+    audio_path: str,
+    work_dir: str = None,
+    on_wait=None,
+    preview: dict = None,
+    on_progress=None,
+    video_key: str = None,
+    state_dir: str = None,
+) -> str:
+    """
+    Apply lip sync using local Wav2Lip model; returns path to lip-synced video.
+
+    Progress is checkpointed every LIPSYNC_CHECKPOINT_EVERY frames under
+    `state_dir` (default: `work_dir`, a job directory); calling again with the
+    same inputs resumes. `video_key` identifies the source video for the
+    checkpoints and face cache (default: its path, size and mtime); workers
+    pass the artifact ref so every fetched copy shares them.
+    The run waits for a heavy-job slot; `on_wait(position)` reports the queue.
+    `preview` ({"start", "duration", "frame_step", "height"}) renders a quick
+    preview instead; it shares cached face detections with the full render.
+    `on_progress(info)` receives {"stage", "done", "total", "fps", "eta"} updates.
+    """
+    preview = preview or {}
+
+    import ffmpeg
+
+    # Get absolute paths
+    # Assuming this module is in views/dashboard.py, project root is one level up
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    wav2lip_dir = os.path.join(project_dir, "wav2lip")
+    # Resolved through the model registry, which refuses corrupted weights
+    checkpoint_path = model_registry.model_path(
+        "wav2lip_gan", default=os.path.join(wav2lip_dir, "checkpoints", "wav2lip_gan.pth")
+    )
+    detector_path = model_registry.model_path(
+        "s3fd",
+        default=os.path.join(wav2lip_dir, "face_detection", "detection", "sfd", "s3fd.pth"),
+    )
+
+    if checkpoint_path is None:
+        raise ValueError(
+            "Wav2Lip model not found. Run 'python download_models.py' first."
+        )
+    if detector_path is None:
+        raise ValueError(
+            "S3FD face detector not found. Run 'python download_models.py' first."
+        )
+
+    # Create temp directories if needed
+    temp_dir = os.path.join(wav2lip_dir, "temp")
+    results_dir = os.path.join(wav2lip_dir, "results")
+    os.makedirs(temp_dir, exist_ok=True)
+    os.makedirs(results_dir, exist_ok=True)
+
+    # Output file path
+    output_path = tempfile.NamedTemporaryFile(
+        delete=False, suffix=".mp4", dir=work_dir
+    ).name
+
+    # Convert audio to wav if needed (Wav2Lip requires wav)
+    if not audio_path.endswith(".wav"):
+        wav_path = tempfile.NamedTemporaryFile(
+            delete=False, suffix=".wav", dir=work_dir
+        ).name
+        try:
+            (
+                ffmpeg.input(audio_path)
+                .output(wav_path, acodec="pcm_s16le", ar="16000", ac=1)
+                .overwrite_output()
+                .run(quiet=True)
+            )
+            audio_path = wav_path
+        except Exception as e:
+            raise ValueError(f"Failed to convert audio to wav: {e}")
+
+    # Checkpoints are keyed by the exact inputs and chunk size so a rerun only
+    # resumes when the video, dub audio and chunk boundaries are unchanged
+    # Frames stay at native resolution; only the face crop is processed
+    resize_factor = str(settings.lipsync_resize_factor)
+    # Refs look like "sha256:<hex>"; hash them so file names stay portable
+    video_key = redub.text_key(video_key) if video_key else _file_fingerprint(video_path)
+    with open(audio_path, "rb") as f:
+        audio_key = redub.text_key(f.read())
+    run_key = redub.text_key(
+        video_key,
+        audio_key,
+        checkpoint_path,
+        resize_factor,
+        settings.lipsync_paste,
+        settings.lipsync_checkpoint_every,
+        sorted(preview.items()),
+    )
+    lipsync_root = os.path.join(state_dir or work_dir or temp_dir, "lipsync")
+    checkpoint_dir = os.path.join(lipsync_root, run_key[:16])
+    face_cache = os.path.join(
+        lipsync_root,
+        f"faces_{video_key[:16]}_r{resize_factor}_{settings.lipsync_detect_mode}"
+        f"_h{settings.lipsync_detect_height}.npy",
+    )
+    os.makedirs(checkpoint_dir, exist_ok=True)
+
+    # Build the command to run Wav2Lip inference
+    inference_script = os.path.join(project_dir, "utils", "wav2lip_inference.py")
+
+    # Use Python 3.11 explicitly (Python 3.14 has NumPy 2.x incompatibility with OpenCV)
+    # We should try to use the currently running python executable first if it works, or fallback
+    python_exe = sys.executable
+
+    cmd = [
+        python_exe,
+        inference_script,
+        "--checkpoint_path",
+        checkpoint_path,
+        "--detector_path",
+        detector_path,
+        "--face",
+        video_path,
+        "--audio",
+        audio_path,
+        "--outfile",
+        output_path,
+        "--pads",
+        "0",
+        "10",
+        "0",
+        "0",
+        "--checkpoint_dir",
+        checkpoint_dir,
+        "--checkpoint_every",
+        str(settings.lipsync_checkpoint_every),
+        "--face_cache",
+        face_cache,
+        "--detect_mode",
+        settings.lipsync_detect_mode,
+        "--resize_factor",
+        resize_factor,
+        "--detect_height",
+        str(settings.lipsync_detect_height),
+        "--paste",
+        settings.lipsync_paste,
+        "--start",
+        str(preview.get("start", 0.0)),
+        "--duration",
+        str(preview.get("duration", 0.0)),
+        "--frame_step",
+        str(preview.get("frame_step", 1)),
+        "--preview_height",
+        str(preview.get("height", 0)),
+        # Memory now scales with face crops, not frames, so batches can be larger
+        "--wav2lip_batch_size",
+        str(settings.lipsync_batch_size),
+        "--face_det_batch_size",
+        str(settings.lipsync_face_det_batch_size),
+    ]
+
+    # Run the inference
+    try:
+        # Queue for a CPU slot; stall detection only starts once we hold it
+        with scheduler.heavy_slot("lipsync", on_wait=on_wait) as threads:
+            code, output = _run_streaming(
+                cmd + ["--threads", str(threads)],
+                cwd=wav2lip_dir,
+                env=scheduler.thread_env(threads),
+                run_id=run_key[:8],
+                on_progress=on_progress,
+            )
+        log_path = os.path.join(results_dir, "inference.log")
+
+        if code != 0:
+            # If the process returned non-zero but produced a valid output file, accept it and warn
+            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+                print(
+                    f"Wav2Lip returned non-zero exit code but produced an output file; see {log_path} for details"
+                )
+            else:
+                raise LipSyncError(
+                    f"Wav2Lip inference failed:\n{output or 'Unknown error'}\nLogs: {log_path}"
+                )
+
+        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+            raise LipSyncError(f"Wav2Lip produced no output or empty file. See logs: {log_path}")
+
+    except (ValueError, LipSyncError):
+        raise
+    except Exception as e:
+        # Subprocess and IO failures are transient: workers retry the task
+        raise LipSyncError(f"Wav2Lip inference error: {e}") from e
+
+    # Finished: checkpoint chunks are no longer needed (face cache is kept)
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+    return output_path
+
+
+# ---------------------------------------------------------------------------
+# Tasks: the same stage code runs in-process or on a worker (see worker.py)
+# ---------------------------------------------------------------------------
+
+TASK_HANDLERS = {}
+
+
+def task_handler(kind):
+    """
+    Register the handler for a task kind.
+
+    A handler is `(inputs, params, work_dir, on_wait, on_progress) ->
+    (files, data)`: `inputs` and `files` map names to local file paths,
+    `params` and `data` are JSON-serializable.
+    """
+
+    def decorator(fn):
+        TASK_HANDLERS[kind] = fn
+        return fn
+
+    return decorator
+
+
+@task_handler("extract")
+def _extract_task(inputs, params, work_dir, on_wait, on_progress):
+    return {"audio": extract_audio(inputs["video"])}, {}
+
+
+@task_handler("transcribe")
+def _transcribe_task(inputs, params, work_dir, on_wait, on_progress):
+    stats = {}
+    text = transcribe_audio(inputs["audio"], on_wait=on_wait, stats=stats)
+    return {}, {"text": text, "stats": stats}
+
+
+@task_handler("translate")
+def _translate_task(inputs, params, work_dir, on_wait, on_progress):
+    texts = translation.translate_batch(
+        params["texts"], params.get("source_lang", "en"), params.get("target_lang", "hi")
+    )
+    return {}, {"texts": texts}
+
+
+@task_handler("tts")
+def _tts_task(inputs, params, work_dir, on_wait, on_progress):
+    stats = {}
+    paths = tts.synthesize_batch(
+        params["texts"],
+        params.get("voice_id"),
+        params.get("model_id"),
+        backend=params.get("backend"),
+        work_dir=work_dir,
+        on_wait=on_wait,
+        stats=stats,
+    )
+    return {f"clip{i}": path for i, path in enumerate(paths)}, {"stats": stats}
+
+
+@task_handler("lipsync")
+def _lipsync_task(inputs, params, work_dir, on_wait, on_progress):
+    video_ref = params.get("input_refs", {}).get("video")
+    path = apply_lip_sync(
+        inputs["video"],
+        inputs["audio"],
+        work_dir=work_dir,
+        on_wait=on_wait,
+        preview=params.get("preview"),
+        on_progress=on_progress,
+        # On a worker, resume state lives on the shared store volume keyed by
+        # the input ref, so a retried task resumes on any machine
+        video_key=video_ref,
+        state_dir=artifact_store.scratch_dir("lipsync-state") if video_ref else None,
+    )
+    return {"video": path}, {}
+
+
+@task_handler("mux")
+def _mux_task(inputs, params, work_dir, on_wait, on_progress):
+    return {"video": replace_audio_track(inputs["video"], inputs["audio"], work_dir=work_dir)}, {}
+
+
+def execute_task(task, work_dir, on_progress=None):
+    """
+    Run a queued task on this machine: fetch its input artifacts from the
+    shared store into `work_dir`, run the handler and store its outputs.
+    Handlers see the input refs as `params["input_refs"]`.
+    Returns the task result ({"outputs": {name: ref}, "data": {...}}).
+    """
+    payload = task["payload"]
+    inputs = {}
+    for name, ref in payload.get("inputs", {}).items():
+        meta = artifact_store.metadata(ref)
+        inputs[name] = artifact_store.fetch(
+            ref, os.path.join(work_dir, f"{name}_{meta['name']}")
+        )
+    params = dict(payload.get("params", {}), input_refs=payload.get("inputs", {}))
+    files, data = TASK_HANDLERS[task["kind"]](inputs, params, work_dir, None, on_progress)
+    outputs = {name: artifact_store.put(path) for name, path in files.items()}
+    return {"outputs": outputs, "data": data}
+
+
+def tts_stats():
+    """Per-backend TTS totals: fleet-wide from the queue in queue mode, else this process's."""
+    if not settings.pipeline_queue:
+        return tts.backend_stats()
+    import utils.work_queue as work_queue
+
+    try:
+        return work_queue.connect(settings.pipeline_queue).tts_stats()
+    except (OSError, RuntimeError) as e:
+        print(f"[pipeline] could not read TTS stats from the queue: {e}")
+        return {}
+
+
+def dispatch(kind, inputs=None, params=None, work_dir=None, on_wait=None, on_progress=None):
+    """
+    Run a pipeline task and return {"files": {name: local path}, "data": {...}}.
+
+    Without PIPELINE_QUEUE the handler runs in this process. With it, inputs
+    are put in the artifact store, the task is queued for a worker with the
+    right capability, and outputs are fetched back into `work_dir` by
+    reference. `on_wait(position)` reports the queue position (0 once a
+    worker has picked the task up) and `on_progress(info)` the worker's
+    progress.
+    """
+    inputs, params = inputs or {}, params or {}
+    if not settings.pipeline_queue:
+        files, data = TASK_HANDLERS[kind](inputs, params, work_dir, on_wait, on_progress)
+        return {"files": files, "data": data}
+
+    import utils.work_queue as work_queue
+
+    queue_ = work_queue.connect(settings.pipeline_queue)
+    if kind == "tts":
+        # Pin "auto" here so the task is routed to a machine that can run it
+        params = dict(params, backend=tts.resolve_backend(params.get("backend")))
+    refs = {name: artifact_store.put(path) for name, path in inputs.items()}
+    task_id = queue_.enqueue(kind, {"inputs": refs, "params": params})
+    last_progress = None
+    waited = False
+    while True:
+        task = queue_.get(task_id)
+        if task["status"] == "queued" and on_wait is not None:
+            waited = True
+            on_wait(task["position"])
+        elif waited:
+            # A worker picked the task up: let the caller clear its notice
+            waited = False
+            on_wait(0)
+        if task["status"] == "leased" and task["progress"] != last_progress:
+            last_progress = task["progress"]
+            if on_progress is not None and last_progress:
+                on_progress(last_progress)
+        elif task["status"] == "done":
+            if kind == "tts" and task["result"]["data"].get("stats"):
+                queue_.record_tts(task["result"]["data"]["stats"])
+            break
+        elif task["status"] == "failed":
+            raise ValueError(f"{kind} task {task_id} failed: {task['error']}")
+        time.sleep(1.0)
+
+    out_dir = work_dir or tempfile.mkdtemp()
+    files = {}
+    for name, ref in task["result"]["outputs"].items():
+        meta = artifact_store.metadata(ref)
+        files[name] = artifact_store.fetch(
+            ref, os.path.join(out_dir, f"{task_id}_{name}_{meta['name']}")
+        )
+    return {"files": files, "data": task["result"]["data"]}
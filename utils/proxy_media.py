@@ -0,0 +1,101 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ffmpeg
+
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+# Small, low-bitrate renditions used by every in-browser preview widget.
+# Generated once per artifact in the background and cached by file identity.
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROXY_DIR = _settings.proxy_dir or os.path.join(PROJECT_DIR, "proxies")
+PROXY_HEIGHT = _settings.proxy_height
+PROXY_VIDEO_CRF = _settings.proxy_video_crf
+PROXY_AUDIO_BITRATE = _settings.proxy_audio_bitrate
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv", ".webm")
+
+_executor = ThreadPoolExecutor(
+    max_workers=_settings.proxy_workers, thread_name_prefix="proxy"
+)
+_lock = threading.Lock()
+_pending = {}  # proxy path -> Future
+
+
+def proxy_path(path):
+    """Where the proxy of `path` lives (keyed by path, size and mtime)."""
+    st_ = os.stat(path)
+    key = hashlib.sha1(
+        f"{os.path.abspath(path)}:{st_.st_size}:{int(st_.st_mtime)}".encode("utf-8")
+    ).hexdigest()[:20]
+    ext = ".mp4" if path.lower().endswith(VIDEO_EXTENSIONS) else ".m4a"
+    return os.path.join(PROXY_DIR, key + ext)
+
+
+def _render(src, dest):
+    tmp = dest + ".partial" + os.path.splitext(dest)[1]
+    inp = ffmpeg.input(src)
+    if dest.endswith(".mp4"):
+        probe = ffmpeg.probe(src)
+        has_audio = any(s.get("codec_type") == "audio" for s in probe["streams"])
+        streams = [inp.video.filter("scale", -2, f"min({PROXY_HEIGHT},ih)")]
+        if has_audio:
+            streams.append(inp.audio)
+        out = ffmpeg.output(
+            *streams,
+            tmp,
+            vcodec="libx264",
+            preset="veryfast",
+            crf=PROXY_VIDEO_CRF,
+            pix_fmt="yuv420p",
+            acodec="aac",
+            audio_bitrate=PROXY_AUDIO_BITRATE,
+            ac=1,
+            movflags="+faststart",
+        )
+    else:
+        out = ffmpeg.output(
+            inp.audio, tmp, acodec="aac", audio_bitrate=PROXY_AUDIO_BITRATE, ac=1
+        )
+    try:
+        out.overwrite_output().run(quiet=True)
+    except ffmpeg.Error as e:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        print(
+            f"Proxy generation failed for {src}: "
+            f"{e.stderr.decode('utf-8', errors='ignore') if e.stderr else e}"
+        )
+        raise
+    os.replace(tmp, dest)
+    return dest
+
+
+def request_proxy(path):
+    """
+    Return the proxy path for `path` if it is ready; otherwise make sure it is
+    being generated in the background and return None.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    dest = proxy_path(path)
+    if os.path.exists(dest):
+        return dest
+    with _lock:
+        fut = _pending.get(dest)
+        if fut is None or (fut.done() and fut.exception() is None):
+            os.makedirs(PROXY_DIR, exist_ok=True)
+            _pending[dest] = _executor.submit(_render, path, dest)
+    return None
+
+
+def proxy_failed(path):
+    """True if background generation of the proxy for `path` failed."""
+    if not path or not os.path.exists(path):
+        return False
+    fut = _pending.get(proxy_path(path))
+    return bool(fut is not None and fut.done() and fut.exception() is not None)
@@ -0,0 +1,328 @@
+import hashlib
+import os
+import re
+import tempfile
+
+import ffmpeg
+
+# Sentence boundaries for English and Devanagari (danda) punctuation
+_SENTENCE_END = re.compile(r"(?<=[.!?।])\s+")
+
+# How far a re-synthesized clip may be time-stretched to fit its old slot
+MIN_TEMPO = 0.5
+MAX_TEMPO = 2.0
+
+
+def split_sentences(text):
+    """Split text into sentence-sized segments, dropping empty pieces."""
+    parts = _SENTENCE_END.split((text or "").strip())
+    return [p.strip() for p in parts if p.strip()]
+
+
+def text_key(*parts):
+    """Stable hash of the inputs a segment artifact was generated from."""
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def build_segments(transcript, translate_batch_fn, previous=None):
+    """
+    Build segment records for `transcript`, translating each sentence.
+
+    New sentences are translated in a single `translate_batch_fn(list)` call.
+    Segments from `previous` whose source sentence is unchanged keep their
+    translation (including reviewer edits) and their generated artifacts.
+    """
+    # Repeated sentences ("Yes.") each get back their own previous segment, in order
+    reusable = {}
+    for seg in previous or []:
+        reusable.setdefault(seg["source_key"], []).append(seg)
+
+    segments = []
+    for i, source in enumerate(split_sentences(transcript)):
+        key = text_key(source)
+        candidates = reusable.get(key)
+        old = candidates.pop(0) if candidates else None
+        if old is not None:
+            seg = dict(old)
+        else:
+            seg = {
+                "source": source,
+                "source_key": key,
+                "text": None,
+                "clip": None,
+                "clip_key": None,
+                "start": None,
+                "duration": None,
+                "synced_key": None,
+            }
+        seg["id"] = i
+        segments.append(seg)
+
+    fresh = [seg for seg in segments if seg["text"] is None]
+    if fresh:
+        translated = translate_batch_fn([seg["source"] for seg in fresh])
+        for seg, text in zip(fresh, translated):
+            seg["text"] = text
+    return segments
+
+
+def probe_duration(path):
+    """Return media duration in seconds."""
+    return float(ffmpeg.probe(path)["format"]["duration"])
+
+
+def _to_pcm_wav(src_path, tempo=None, duration=None, work_dir=None):
+    """Convert a clip to 16 kHz mono wav, optionally stretched/padded to `duration`."""
+    out_path = tempfile.NamedTemporaryFile(
+        delete=False, suffix=".wav", dir=work_dir
+    ).name
+    stream = ffmpeg.input(src_path).audio
+    if tempo is not None and abs(tempo - 1.0) > 1e-3:
+        stream = stream.filter("atempo", tempo)
+    if duration is not None:
+        stream = stream.filter("apad").filter("atrim", duration=duration)
+    try:
+        (
+            ffmpeg.output(stream, out_path, acodec="pcm_s16le", ar="16000", ac=1)
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        if os.path.exists(out_path):
+            os.unlink(out_path)
+        raise ValueError(
+            f"FFmpeg failed to prepare clip: {e.stderr.decode('utf-8', errors='ignore') if e.stderr else e}"
+        )
+    return out_path
+
+
+def dirty_segments(segments, voice_id, model_id):
+    """Return ids of segments whose TTS clip no longer matches their text/voice."""
+    return [
+        seg["id"]
+        for seg in segments
+        if seg["clip"] is None
+        or not os.path.exists(seg["clip"])
+        or seg["clip_key"] != text_key(seg["text"], voice_id, model_id)
+    ]
+
+
+def synthesize_segments(
+    segments, synth_fn, voice_id, model_id, work_dir=None, on_segment=None, batch_size=16
+):
+    """
+    Re-synthesize only the segments whose translation (or voice) changed.
+
+    Dirty segments are sent to `synth_fn(texts, voice_id=, model_id=)` in
+    batches of `batch_size`; it returns one 16 kHz mono wav per text.
+    A segment that already has a slot on the timeline is fitted back into it
+    (time-stretch within MIN_TEMPO..MAX_TEMPO, then pad/trim) so the rest of
+    the dub and its lip-synced video stay valid. If it cannot fit, every
+    following segment is re-laid out and must be lip-synced again.
+    `on_segment(seg)` is called after each clip so callers can checkpoint.
+    Returns the ids of segments whose audio changed.
+    """
+    changed = []
+    relayout_from = None
+    dirty = dirty_segments(segments, voice_id, model_id)
+    for start in range(0, len(dirty), max(1, batch_size)):
+        batch = dirty[start:start + max(1, batch_size)]
+        raws = synth_fn(
+            [segments[i]["text"] for i in batch], voice_id=voice_id, model_id=model_id
+        )
+        for seg_id, raw in zip(batch, raws):
+            seg = segments[seg_id]
+            # Backends already emit 16 kHz PCM; only a slot fit needs re-encoding
+            clip = raw
+            try:
+                natural = probe_duration(raw)
+                slot = seg["duration"]
+                if slot and seg["synced_key"] and relayout_from is None:
+                    tempo = natural / slot
+                    if MIN_TEMPO <= tempo <= MAX_TEMPO:
+                        clip = _to_pcm_wav(
+                            raw, tempo=tempo, duration=slot, work_dir=work_dir
+                        )
+                    else:
+                        seg["duration"] = natural
+                        relayout_from = seg_id
+                else:
+                    seg["duration"] = natural
+            except Exception:
+                os.unlink(raw)
+                raise
+            if clip != raw:
+                os.unlink(raw)
+            if seg["clip"] and seg["clip"] != clip and os.path.exists(seg["clip"]):
+                os.unlink(seg["clip"])
+            seg["clip"] = clip
+            seg["clip_key"] = text_key(seg["text"], voice_id, model_id)
+            changed.append(seg_id)
+            if on_segment is not None:
+                on_segment(seg)
+
+    layout_segments(segments)
+    if relayout_from is not None:
+        for seg in segments[relayout_from:]:
+            seg["synced_key"] = None
+            if seg["id"] not in changed:
+                changed.append(seg["id"])
+    return sorted(changed)
+
+
+def layout_segments(segments):
+    """Assign each segment its start time on the dubbed timeline."""
+    t = 0.0
+    for seg in segments:
+        seg["start"] = t
+        t += seg["duration"] or 0.0
+    return t
+
+
+def build_dub_audio(segments, work_dir=None):
+    """Concatenate segment clips into one 16 kHz mono wav for the whole dub."""
+    clips = [seg["clip"] for seg in segments if seg["clip"]]
+    if not clips:
+        raise ValueError("No synthesized segments to assemble.")
+    out_path = tempfile.NamedTemporaryFile(
+        delete=False, suffix=".wav", dir=work_dir
+    ).name
+    streams = [ffmpeg.input(c).audio for c in clips]
+    try:
+        (
+            ffmpeg.concat(*streams, v=0, a=1)
+            .output(out_path, acodec="pcm_s16le", ar="16000", ac=1)
+            .overwrite_output()
+            .run(quiet=True)
+        )
+    except ffmpeg.Error as e:
+        if os.path.exists(out_path):
+            os.unlink(out_path)
+        raise ValueError(
+            f"FFmpeg failed to assemble dub audio: {e.stderr.decode('utf-8', errors='ignore') if e.stderr else e}"
+        )
+    return out_path
+
+
+def needs_lip_sync(segments):
+    """Return segments that are not yet reflected in the lip-synced video."""
+    return [seg for seg in segments if seg["synced_key"] != seg["clip_key"]]
+
+
+def _cut(path, start, duration=None, audio=True, loop=False, work_dir=None):
+    """
+    Re-encode [start, start+duration) of `path` into a temp mp4.
+    With `loop`, the input repeats like Wav2Lip does when the dub outlasts the video.
+    """
+    out_path = tempfile.NamedTemporaryFile(
+        delete=False, suffix=".mp4", dir=work_dir
+    ).name
+    kwargs = {"ss": start}
+    if loop:
+        kwargs["stream_loop"] = -1
+    if duration is not None:
+        kwargs["t"] = duration
+    src = ffmpeg.input(path, **kwargs)
+    streams = [src.video, src.audio] if audio else [src.video]
+    (
+        ffmpeg.output(*streams, out_path, vcodec="libx264", acodec="aac", preset="veryfast")
+        .overwrite_output()
+        .run(quiet=True)
+    )
+    return out_path
+
+
+def mark_synced(segments):
+    """Record that the current clips are baked into the lip-synced video."""
+    for seg in segments:
+        seg["synced_key"] = seg["clip_key"]
+
+
+def splice_lip_sync(
+    source_video, previous_video, segments, dub_audio, lip_sync_fn, work_dir=None
+):
+    """
+    Lip-sync only the segments that changed and splice them into `previous_video`.
+
+    Each stale segment's window of the source video is lip-synced against its
+    own clip via `lip_sync_fn(video, audio)`; untouched windows are copied from
+    the previous render. The full dub audio is muxed over the result.
+    Returns the path of the new video.
+    """
+    stale = {seg["id"] for seg in needs_lip_sync(segments)}
+    if not stale:
+        return previous_video
+
+    temp_paths = []
+    pieces = []
+    try:
+        # Group consecutive unchanged segments into one copied run
+        run_start = None
+        for seg in segments + [None]:
+            if seg is not None and seg["id"] not in stale:
+                if run_start is None:
+                    run_start = seg["start"]
+                continue
+            if run_start is not None:
+                end = seg["start"] if seg is not None else None
+                piece = _cut(
+                    previous_video,
+                    run_start,
+                    None if end is None else end - run_start,
+                    audio=False,
+                    work_dir=work_dir,
+                )
+                temp_paths.append(piece)
+                pieces.append(piece)
+                run_start = None
+            if seg is None:
+                break
+            window = _cut(
+                source_video,
+                seg["start"],
+                seg["duration"],
+                audio=False,
+                loop=True,
+                work_dir=work_dir,
+            )
+            temp_paths.append(window)
+            synced = lip_sync_fn(window, seg["clip"])
+            temp_paths.append(synced)
+            pieces.append(synced)
+
+        out_path = tempfile.NamedTemporaryFile(
+            delete=False, suffix=".mp4", dir=work_dir
+        ).name
+        videos = [ffmpeg.input(p).video for p in pieces]
+        audio_in = ffmpeg.input(dub_audio)
+        try:
+            (
+                ffmpeg.output(
+                    ffmpeg.concat(*videos, v=1, a=0),
+                    audio_in.audio,
+                    out_path,
+                    vcodec="libx264",
+                    acodec="aac",
+                    preset="veryfast",
+                    shortest=None,
+                )
+                .overwrite_output()
+                .run(quiet=True)
+            )
+        except ffmpeg.Error as e:
+            if os.path.exists(out_path):
+                os.unlink(out_path)
+            raise ValueError(
+                f"FFmpeg failed to splice segments: {e.stderr.decode('utf-8', errors='ignore') if e.stderr else e}"
+            )
+    finally:
+        for p in temp_paths:
+            if os.path.exists(p):
+                os.unlink(p)
+
+    mark_synced(segments)
+    return out_path
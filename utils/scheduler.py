@@ -0,0 +1,93 @@
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from utils.settings import get_settings
+
+# Heavy CPU stages (Wav2Lip, local Whisper) share a fixed number of slots so
+# concurrent users queue instead of oversubscribing the same cores and RAM.
+# API-bound stages never go through the scheduler.
+_settings = get_settings()
+CPU_COUNT = os.cpu_count() or 1
+HEAVY_JOB_SLOTS = max(1, _settings.heavy_job_slots or CPU_COUNT // 4)
+THREADS_PER_JOB = max(1, _settings.heavy_job_threads or CPU_COUNT // HEAVY_JOB_SLOTS)
+
+_cond = threading.Condition()
+_ids = itertools.count(1)
+_waiting = deque()  # tickets in FIFO order
+_running = {}  # ticket -> {"kind", "owner", "started_at"}
+
+
+def thread_env(threads=THREADS_PER_JOB, base=None):
+    """Environment for a heavy subprocess with BLAS/OpenMP pools pinned to `threads`."""
+    env = dict(os.environ if base is None else base)
+    for var in (
+        "OMP_NUM_THREADS",
+        "MKL_NUM_THREADS",
+        "OPENBLAS_NUM_THREADS",
+        "NUMEXPR_NUM_THREADS",
+        "VECLIB_MAXIMUM_THREADS",
+    ):
+        env[var] = str(threads)
+    return env
+
+
+def status():
+    """Snapshot of scheduler load for display."""
+    with _cond:
+        return {
+            "slots": HEAVY_JOB_SLOTS,
+            "threads_per_job": THREADS_PER_JOB,
+            "running": len(_running),
+            "waiting": len(_waiting),
+        }
+
+
+@contextmanager
+def heavy_slot(kind, owner="", on_wait=None, poll_seconds=1.0):
+    """
+    Block until a heavy-job slot is free, then hold it for the `with` body.
+
+    `on_wait(position)` is called roughly every `poll_seconds` while queued
+    (position 1 = next to run), and once with 0 when a wait is over. Yields
+    the number of CPU threads the job should use.
+    """
+    ticket = next(_ids)
+    waited = False
+    with _cond:
+        _waiting.append(ticket)
+    try:
+        while True:
+            with _cond:
+                if _waiting[0] == ticket and len(_running) < HEAVY_JOB_SLOTS:
+                    _waiting.popleft()
+                    _running[ticket] = {
+                        "kind": kind,
+                        "owner": owner,
+                        "started_at": time.time(),
+                    }
+                    break
+                position = _waiting.index(ticket) + 1
+                _cond.wait(poll_seconds)
+            if on_wait is not None:
+                waited = True
+                on_wait(position)
+    except BaseException:
+        # Caller gave up while queued (e.g. Streamlit rerun): free our place
+        with _cond:
+            if ticket in _waiting:
+                _waiting.remove(ticket)
+            _cond.notify_all()
+        raise
+
+    try:
+        if waited:
+            on_wait(0)
+        yield THREADS_PER_JOB
+    finally:
+        with _cond:
+            _running.pop(ticket, None)
+            _cond.notify_all()
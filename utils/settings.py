@@ -0,0 +1,301 @@
+import functools
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+
+def _flag(name, default=""):
+    return os.getenv(name, default).lower() == "true"
+
+
+def _int_or_none(name):
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+@dataclass(frozen=True)
+class Settings:
+    """App, pipeline and worker configuration, read once from the environment (and .env)."""
+
+    hf_token: Optional[str] = None
+    eleven_api_key: Optional[str] = None
+    groq_api_key: Optional[str] = None
+    sync_api_key: Optional[str] = None
+    default_voice_id: str = "21m00Tcm4TlvDq8ikWAM"  # common default voice
+    default_tts_model: str = "eleven_multilingual_v2"
+
+    # Local ASR (faster-whisper); model/device settings live in utils.asr
+    use_local_asr: bool = False
+
+    # Wav2Lip writes a resumable checkpoint every N output frames
+    lipsync_checkpoint_every: int = 250
+    # "track": S3FD on keyframes + correlation tracking; "every_frame": S3FD on all frames
+    lipsync_detect_mode: str = "track"
+    # Crop-centric processing: detect on a downscaled copy, generate on the
+    # native-resolution face crop and blend the mouth back ("replace" pastes the box)
+    lipsync_resize_factor: int = 1
+    lipsync_detect_height: int = 480
+    lipsync_paste: str = "blend"
+    lipsync_batch_size: int = 16
+    lipsync_face_det_batch_size: int = 4
+    # Quick previews: output height and frame step of the whole-clip proxy
+    lipsync_preview_height: int = 360
+    lipsync_preview_frame_step: int = 3
+    # Shared work queue ("tcp://host:port" broker or SQLite path); when set,
+    # heavy stages run on workers (worker.py) instead of in the web process
+    pipeline_queue: Optional[str] = None
+
+    # Wav2Lip output goes to a rotating log; runs without progress are killed
+    lipsync_log_max_mb: int = 10
+    lipsync_log_backups: int = 5
+    lipsync_stall_seconds: int = 300
+
+    # utils.asr: local Whisper, automatic model selection and remote uploads
+    whisper_model_size: str = "auto"
+    whisper_device: str = "cpu"
+    whisper_compute_type: str = "int8"
+    whisper_batch_size: int = 8
+    whisper_beam_size: int = 5
+    asr_max_rtf: float = 0.5
+    asr_latency_budget: float = 0.0
+    asr_upload_bitrate: str = "24k"
+    groq_max_upload_mb: float = 25.0
+    hf_max_upload_mb: float = 10.0
+
+    # utils.translation
+    translation_backend: str = "auto"
+    groq_batch_tokens: int = 1500
+    libretranslate_url: str = "https://libretranslate.com"
+    libretranslate_api_key: str = ""
+    local_mt_model: str = "Helsinki-NLP/opus-mt-{src}-{tgt}"
+    local_mt_dir: Optional[str] = None  # default: models/mt
+    local_mt_compute_type: str = "int8"
+    local_mt_threads: int = 4
+    local_mt_max_batch: int = 32
+    local_mt_batch_wait_ms: int = 20
+    local_mt_beam_size: int = 2
+
+    # utils.tts
+    tts_backend: str = "auto"
+    elevenlabs_concurrency: int = 4
+    local_tts_model: str = "facebook/mms-tts-hin"
+    local_tts_max_batch: int = 16
+    local_tts_seed: int = 0
+
+    # utils.scheduler (None: derived from the CPU count)
+    heavy_job_slots: Optional[int] = None
+    heavy_job_threads: Optional[int] = None
+
+    # utils.proxy_media
+    proxy_dir: Optional[str] = None  # default: proxies/
+    proxy_height: int = 360
+    proxy_video_crf: int = 32
+    proxy_audio_bitrate: str = "64k"
+    proxy_workers: int = 2
+
+    # utils.face_tracking
+    face_track_keyframe_interval: int = 25
+    face_track_min_confidence: float = 0.6
+    face_track_scene_cut: float = 0.5
+    face_track_smoothing: float = 0.6
+
+    # utils.email_otp
+    smtp_server: Optional[str] = None
+    smtp_port: int = 587
+    smtp_email: Optional[str] = None
+    smtp_password: Optional[str] = None
+    email_workers: int = 2
+    email_max_retries: int = 3
+    email_retry_backoff: float = 2.0
+    smtp_idle_seconds: float = 240.0
+
+    # utils.auth_sessions
+    auth_session_secret: Optional[str] = None
+    auth_user_cache_ttl: float = 600.0
+    auth_cache_max_entries: int = 10000
+    auth_session_days: int = 30
+
+    # utils.artifact_store
+    artifact_store_dir: Optional[str] = None  # default: artifacts/
+    artifact_store_host: str = "127.0.0.1"
+    artifact_store_port: int = 8765
+    artifact_public_url: Optional[str] = None  # default: http://host:port
+    artifact_url_ttl: int = 3600
+    artifact_retention_days: float = 14.0
+    artifact_secret: Optional[str] = None
+
+    # utils.work_queue
+    work_lease_seconds: float = 60.0
+    work_broker_token: str = ""
+
+    # worker.py
+    worker_poll_seconds: float = 2.0
+    worker_capabilities: str = "media,asr,api,tts-local,lipsync"
+
+    # api.py
+    api_host: str = "127.0.0.1"
+    api_port: int = 8000
+    api_cors_origins: str = "http://localhost:3000"  # comma-separated
+    api_token: Optional[str] = None
+    api_chunk_mb: float = 8.0
+    api_max_upload_mb: float = 2048.0
+    api_job_workers: int = 4
+
+    # utils.jobs and utils.model_registry
+    jobs_dir: Optional[str] = None  # default: jobs/
+    model_registry: Optional[str] = None  # default: models/registry.json
+
+    # utils.lipsync_models and the Wav2Lip runner
+    lipsync_variants_dir: Optional[str] = None  # default: wav2lip/checkpoints/optimized
+    lipsync_sample_video: str = ""
+    lipsync_sample_audio: str = ""
+    lipsync_variant_min_psnr: float = 35.0
+    lipsync_model_variant: str = "auto"
+
+    # utils.firebase_utils
+    firebase_auth_emulator_host: Optional[str] = None
+    firebase_project_id: str = "demo-chameleon"
+
+    @classmethod
+    def from_env(cls):
+        d = cls()
+        return cls(
+            hf_token=os.getenv("HF_TOKEN"),
+            eleven_api_key=os.getenv("ELEVENLABS_API_KEY"),
+            groq_api_key=os.getenv("GROQ_API_KEY"),
+            sync_api_key=os.getenv("SYNC_API_KEY"),
+            default_voice_id=os.getenv("ELEVENLABS_VOICE_ID", d.default_voice_id),
+            default_tts_model=os.getenv("ELEVENLABS_TTS_MODEL", d.default_tts_model),
+            use_local_asr=_flag("USE_LOCAL_ASR"),
+            lipsync_checkpoint_every=int(
+                os.getenv("LIPSYNC_CHECKPOINT_EVERY", d.lipsync_checkpoint_every)
+            ),
+            lipsync_detect_mode=os.getenv("LIPSYNC_DETECT_MODE", d.lipsync_detect_mode),
+            lipsync_resize_factor=int(
+                os.getenv("LIPSYNC_RESIZE_FACTOR", d.lipsync_resize_factor)
+            ),
+            lipsync_detect_height=int(
+                os.getenv("LIPSYNC_DETECT_HEIGHT", d.lipsync_detect_height)
+            ),
+            lipsync_paste=os.getenv("LIPSYNC_PASTE", d.lipsync_paste),
+            lipsync_batch_size=int(os.getenv("LIPSYNC_BATCH_SIZE", d.lipsync_batch_size)),
+            lipsync_face_det_batch_size=int(
+                os.getenv("LIPSYNC_FACE_DET_BATCH_SIZE", d.lipsync_face_det_batch_size)
+            ),
+            lipsync_preview_height=int(
+                os.getenv("LIPSYNC_PREVIEW_HEIGHT", d.lipsync_preview_height)
+            ),
+            lipsync_preview_frame_step=int(
+                os.getenv("LIPSYNC_PREVIEW_FRAME_STEP", d.lipsync_preview_frame_step)
+            ),
+            pipeline_queue=os.getenv("PIPELINE_QUEUE") or None,
+            lipsync_log_max_mb=int(os.getenv("LIPSYNC_LOG_MAX_MB", d.lipsync_log_max_mb)),
+            lipsync_log_backups=int(os.getenv("LIPSYNC_LOG_BACKUPS", d.lipsync_log_backups)),
+            lipsync_stall_seconds=int(
+                os.getenv("LIPSYNC_STALL_SECONDS", d.lipsync_stall_seconds)
+            ),
+            whisper_model_size=os.getenv("WHISPER_MODEL_SIZE", d.whisper_model_size),
+            whisper_device=os.getenv("WHISPER_DEVICE", d.whisper_device),
+            whisper_compute_type=os.getenv("WHISPER_COMPUTE_TYPE", d.whisper_compute_type),
+            whisper_batch_size=int(os.getenv("WHISPER_BATCH_SIZE", d.whisper_batch_size)),
+            whisper_beam_size=int(os.getenv("WHISPER_BEAM_SIZE", d.whisper_beam_size)),
+            asr_max_rtf=float(os.getenv("ASR_MAX_RTF", d.asr_max_rtf)),
+            asr_latency_budget=float(os.getenv("ASR_LATENCY_BUDGET", d.asr_latency_budget)),
+            asr_upload_bitrate=os.getenv("ASR_UPLOAD_BITRATE", d.asr_upload_bitrate),
+            groq_max_upload_mb=float(os.getenv("GROQ_MAX_UPLOAD_MB", d.groq_max_upload_mb)),
+            hf_max_upload_mb=float(os.getenv("HF_MAX_UPLOAD_MB", d.hf_max_upload_mb)),
+            translation_backend=os.getenv("TRANSLATION_BACKEND", d.translation_backend).lower(),
+            groq_batch_tokens=int(os.getenv("GROQ_BATCH_TOKENS", d.groq_batch_tokens)),
+            libretranslate_url=os.getenv("LIBRETRANSLATE_URL", d.libretranslate_url),
+            libretranslate_api_key=os.getenv("LIBRETRANSLATE_API_KEY", d.libretranslate_api_key),
+            local_mt_model=os.getenv("LOCAL_MT_MODEL", d.local_mt_model),
+            local_mt_dir=os.getenv("LOCAL_MT_DIR") or None,
+            local_mt_compute_type=os.getenv("LOCAL_MT_COMPUTE_TYPE", d.local_mt_compute_type),
+            local_mt_threads=int(os.getenv("LOCAL_MT_THREADS", d.local_mt_threads)),
+            local_mt_max_batch=int(os.getenv("LOCAL_MT_MAX_BATCH", d.local_mt_max_batch)),
+            local_mt_batch_wait_ms=int(
+                os.getenv("LOCAL_MT_BATCH_WAIT_MS", d.local_mt_batch_wait_ms)
+            ),
+            local_mt_beam_size=int(os.getenv("LOCAL_MT_BEAM_SIZE", d.local_mt_beam_size)),
+            tts_backend=os.getenv("TTS_BACKEND", d.tts_backend).lower(),
+            elevenlabs_concurrency=int(
+                os.getenv("ELEVENLABS_CONCURRENCY", d.elevenlabs_concurrency)
+            ),
+            local_tts_model=os.getenv("LOCAL_TTS_MODEL", d.local_tts_model),
+            local_tts_max_batch=int(os.getenv("LOCAL_TTS_MAX_BATCH", d.local_tts_max_batch)),
+            local_tts_seed=int(os.getenv("LOCAL_TTS_SEED", d.local_tts_seed)),
+            heavy_job_slots=_int_or_none("HEAVY_JOB_SLOTS"),
+            heavy_job_threads=_int_or_none("HEAVY_JOB_THREADS"),
+            proxy_dir=os.getenv("PROXY_DIR") or None,
+            proxy_height=int(os.getenv("PROXY_HEIGHT", d.proxy_height)),
+            proxy_video_crf=int(os.getenv("PROXY_VIDEO_CRF", d.proxy_video_crf)),
+            proxy_audio_bitrate=os.getenv("PROXY_AUDIO_BITRATE", d.proxy_audio_bitrate),
+            proxy_workers=int(os.getenv("PROXY_WORKERS", d.proxy_workers)),
+            face_track_keyframe_interval=int(
+                os.getenv("FACE_TRACK_KEYFRAME_INTERVAL", d.face_track_keyframe_interval)
+            ),
+            face_track_min_confidence=float(
+                os.getenv("FACE_TRACK_MIN_CONFIDENCE", d.face_track_min_confidence)
+            ),
+            face_track_scene_cut=float(os.getenv("FACE_TRACK_SCENE_CUT", d.face_track_scene_cut)),
+            face_track_smoothing=float(os.getenv("FACE_TRACK_SMOOTHING", d.face_track_smoothing)),
+            smtp_server=os.getenv("SMTP_SERVER"),
+            smtp_port=int(os.getenv("SMTP_PORT", d.smtp_port)),
+            smtp_email=os.getenv("SMTP_EMAIL"),
+            smtp_password=os.getenv("SMTP_PASSWORD"),
+            email_workers=int(os.getenv("EMAIL_WORKERS", d.email_workers)),
+            email_max_retries=int(os.getenv("EMAIL_MAX_RETRIES", d.email_max_retries)),
+            email_retry_backoff=float(os.getenv("EMAIL_RETRY_BACKOFF", d.email_retry_backoff)),
+            smtp_idle_seconds=float(os.getenv("SMTP_IDLE_SECONDS", d.smtp_idle_seconds)),
+            auth_session_secret=os.getenv("AUTH_SESSION_SECRET") or None,
+            auth_user_cache_ttl=float(os.getenv("AUTH_USER_CACHE_TTL", d.auth_user_cache_ttl)),
+            auth_cache_max_entries=int(
+                os.getenv("AUTH_CACHE_MAX_ENTRIES", d.auth_cache_max_entries)
+            ),
+            auth_session_days=int(os.getenv("AUTH_SESSION_DAYS", d.auth_session_days)),
+            artifact_store_dir=os.getenv("ARTIFACT_STORE_DIR") or None,
+            artifact_store_host=os.getenv("ARTIFACT_STORE_HOST", d.artifact_store_host),
+            artifact_store_port=int(os.getenv("ARTIFACT_STORE_PORT", d.artifact_store_port)),
+            artifact_public_url=os.getenv("ARTIFACT_PUBLIC_URL") or None,
+            artifact_url_ttl=int(os.getenv("ARTIFACT_URL_TTL", d.artifact_url_ttl)),
+            artifact_retention_days=float(
+                os.getenv("ARTIFACT_RETENTION_DAYS", d.artifact_retention_days)
+            ),
+            artifact_secret=os.getenv("ARTIFACT_SECRET") or None,
+            work_lease_seconds=float(os.getenv("WORK_LEASE_SECONDS", d.work_lease_seconds)),
+            work_broker_token=os.getenv("WORK_BROKER_TOKEN", d.work_broker_token),
+            worker_poll_seconds=float(os.getenv("WORKER_POLL_SECONDS", d.worker_poll_seconds)),
+            worker_capabilities=os.getenv("WORKER_CAPABILITIES", d.worker_capabilities),
+            api_host=os.getenv("API_HOST", d.api_host),
+            api_port=int(os.getenv("API_PORT", d.api_port)),
+            api_cors_origins=os.getenv("API_CORS_ORIGINS", d.api_cors_origins),
+            api_token=os.getenv("API_TOKEN") or None,
+            api_chunk_mb=float(os.getenv("API_CHUNK_MB", d.api_chunk_mb)),
+            api_max_upload_mb=float(os.getenv("API_MAX_UPLOAD_MB", d.api_max_upload_mb)),
+            api_job_workers=int(os.getenv("API_JOB_WORKERS", d.api_job_workers)),
+            jobs_dir=os.getenv("JOBS_DIR") or None,
+            model_registry=os.getenv("MODEL_REGISTRY") or None,
+            lipsync_variants_dir=os.getenv("LIPSYNC_VARIANTS_DIR") or None,
+            lipsync_sample_video=os.getenv("LIPSYNC_SAMPLE_VIDEO", d.lipsync_sample_video),
+            lipsync_sample_audio=os.getenv("LIPSYNC_SAMPLE_AUDIO", d.lipsync_sample_audio),
+            lipsync_variant_min_psnr=float(
+                os.getenv("LIPSYNC_VARIANT_MIN_PSNR", d.lipsync_variant_min_psnr)
+            ),
+            lipsync_model_variant=os.getenv("LIPSYNC_MODEL_VARIANT", d.lipsync_model_variant),
+            firebase_auth_emulator_host=os.getenv("FIREBASE_AUTH_EMULATOR_HOST") or None,
+            firebase_project_id=os.getenv("FIREBASE_PROJECT_ID", d.firebase_project_id),
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def get_settings():
+    """
+    Load .env once and return the process-wide Settings.
+
+    Every module reads its configuration from here at import, so values in
+    .env apply no matter which module is imported first.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings.from_env()
@@ -0,0 +1,283 @@
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import requests
+
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+# Which backend translates text: "auto" keeps the original priority
+# (Groq LLM if a key is set, else LibreTranslate); "local" runs offline.
+translation_backend = _settings.translation_backend
+
+groq_api_key = _settings.groq_api_key
+groq_model = "llama-3.1-8b-instant"
+# Rough prompt budget per Groq request; sentences are sent as one numbered list
+groq_batch_tokens = _settings.groq_batch_tokens
+
+# Local engine: CTranslate2 model per language pair, converted from a
+# Hugging Face seq2seq checkpoint on first use if not already present
+local_mt_model = _settings.local_mt_model
+local_mt_dir = _settings.local_mt_dir or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models", "mt"
+)
+local_mt_compute_type = _settings.local_mt_compute_type
+local_mt_threads = _settings.local_mt_threads
+local_mt_max_batch = _settings.local_mt_max_batch
+local_mt_batch_wait_ms = _settings.local_mt_batch_wait_ms
+local_mt_beam_size = _settings.local_mt_beam_size
+
+BACKENDS = {}
+
+
+def register_backend(name):
+    """
+    Register a translation backend.
+
+    A backend is a function `(texts, source_lang, target_lang) -> list[str]`
+    that returns one translation per input text, in order.
+    """
+
+    def decorator(fn):
+        BACKENDS[name] = fn
+        return fn
+
+    return decorator
+
+
+def resolve_backend(name=None):
+    """Return the backend name to use for `name` (or TRANSLATION_BACKEND)."""
+    name = (name or translation_backend).lower()
+    if name == "auto":
+        return "groq" if groq_api_key else "libretranslate"
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown translation backend '{name}'. Available: {', '.join(sorted(BACKENDS))}"
+        )
+    return name
+
+
+def translate_batch(texts, source_lang="en", target_lang="hi", backend=None):
+    """Translate a list of texts with the configured backend."""
+    texts = list(texts)
+    if not texts:
+        return []
+    return BACKENDS[resolve_backend(backend)](texts, source_lang, target_lang)
+
+
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)[.)]\s*(.*\S)\s*$")
+
+
+def _groq_chunks(texts):
+    """Split texts into runs that fit GROQ_BATCH_TOKENS (about 4 chars per token)."""
+    chunk, used = [], 0
+    for i, text in enumerate(texts):
+        cost = len(text) // 4 + 8
+        if chunk and used + cost > groq_batch_tokens:
+            yield chunk
+            chunk, used = [], 0
+        chunk.append(i)
+        used += cost
+    if chunk:
+        yield chunk
+
+
+def _groq_complete(client, system, prompt):
+    chat = client.chat.completions.create(
+        model=groq_model,
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
+    )
+    return chat.choices[0].message.content.strip()
+
+
+@register_backend("groq")
+def _translate_groq(texts, source_lang, target_lang):
+    from groq import Groq
+
+    client = Groq(api_key=groq_api_key)
+    results = [None] * len(texts)
+    for chunk in _groq_chunks(texts):
+        if len(chunk) > 1:
+            # One request per chunk: the sentences go out as a numbered list and
+            # come back matched by number
+            listing = "\n".join(
+                f"{n}. {' '.join(texts[i].split())}" for n, i in enumerate(chunk, 1)
+            )
+            reply = _groq_complete(
+                client,
+                "You are a translation engine. Output only the numbered translations.",
+                f"Translate each numbered line from {source_lang} to {target_lang}.\n"
+                f"Return exactly {len(chunk)} lines in the same \"N. translation\" "
+                f"format, one per input line, nothing else.\n\n{listing}",
+            )
+            for line in reply.splitlines():
+                match = _NUMBERED_LINE.match(line)
+                if match and 1 <= int(match.group(1)) <= len(chunk):
+                    results[chunk[int(match.group(1)) - 1]] = match.group(2)
+        # Anything the batch reply didn't cover is translated on its own
+        for i in chunk:
+            if results[i] is None:
+                results[i] = _groq_complete(
+                    client,
+                    "You are a translation engine. Output only the translated text.",
+                    f"Translate the following text from {source_lang} to {target_lang}.\n"
+                    f"Only return the translated text, nothing else.\n\n{texts[i]}",
+                )
+    return results
+
+
+@register_backend("libretranslate")
+def _translate_libretranslate(texts, source_lang, target_lang):
+    # LibreTranslate public API - free, no key needed; accepts a list for `q`
+    api_key = _settings.libretranslate_api_key
+    base_url = _settings.libretranslate_url
+    url = f"{base_url}/translate"
+    payload = {
+        "q": texts,
+        "source": source_lang,
+        "target": target_lang,
+        "format": "text",
+    }
+    headers = {"Content-Type": "application/json"}
+    if api_key:
+        payload["api_key"] = api_key
+    resp = requests.post(url, json=payload, headers=headers, timeout=30)
+    resp.raise_for_status()
+    result = resp.json()
+    translated = result.get("translatedText") if isinstance(result, dict) else None
+    if isinstance(translated, str):
+        translated = [translated]
+    if not isinstance(translated, list) or len(translated) != len(texts):
+        raise ValueError(f"Unexpected LibreTranslate response: {result}")
+    return translated
+
+
+# ---------------------------------------------------------------------------
+# Local engine
+# ---------------------------------------------------------------------------
+
+_engines = {}
+_engines_lock = threading.Lock()
+_pair_locks = {}
+
+
+def _model_dir(source_lang, target_lang):
+    return os.path.join(local_mt_dir, f"{source_lang}-{target_lang}-{local_mt_compute_type}")
+
+
+def _load_engine(source_lang, target_lang):
+    """Load (once per language pair) a quantized CTranslate2 translator and tokenizer."""
+    try:
+        import ctranslate2  # type: ignore
+        from transformers import AutoTokenizer  # type: ignore
+    except Exception as e:
+        raise ValueError(
+            f"Local translation requires ctranslate2 and transformers: {e}"
+        )
+    model_name = local_mt_model.format(src=source_lang, tgt=target_lang)
+    model_dir = _model_dir(source_lang, target_lang)
+    if not os.path.exists(os.path.join(model_dir, "model.bin")):
+        print(f"[MT] Converting {model_name} to CTranslate2 ({local_mt_compute_type})...")
+        converter = ctranslate2.converters.TransformersConverter(model_name)
+        converter.convert(model_dir, quantization=local_mt_compute_type, force=True)
+    translator = ctranslate2.Translator(
+        model_dir,
+        device="cpu",
+        compute_type=local_mt_compute_type,
+        intra_threads=local_mt_threads,
+    )
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return _LocalEngine(translator, tokenizer)
+
+
+def _get_engine(source_lang, target_lang):
+    key = (source_lang, target_lang)
+    # Only callers of the pair being converted/loaded wait for it
+    with _engines_lock:
+        pair_lock = _pair_locks.setdefault(key, threading.Lock())
+    with pair_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = _load_engine(source_lang, target_lang)
+            _engines[key] = engine
+    return engine
+
+
+class _LocalEngine:
+    """
+    Dynamic batcher around one translator: requests from every job for the
+    same language pair are pooled for up to LOCAL_MT_BATCH_WAIT_MS and run
+    through a single translate_batch call.
+    """
+
+    def __init__(self, translator, tokenizer):
+        self.translator = translator
+        self.tokenizer = tokenizer
+        self._pending = []  # (text, future)
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, texts):
+        futures = []
+        with self._cond:
+            for text in texts:
+                fut = Future()
+                self._pending.append((text, fut))
+                futures.append(fut)
+            self._cond.notify()
+        return futures
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                # Give concurrent jobs a moment to join this batch
+                deadline = time.time() + local_mt_batch_wait_ms / 1000.0
+                while len(self._pending) < local_mt_max_batch:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending[:local_mt_max_batch]
+                self._pending = self._pending[local_mt_max_batch:]
+            try:
+                outputs = self._translate([text for text, _ in batch])
+                for (_, fut), out in zip(batch, outputs):
+                    fut.set_result(out)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+
+    def _translate(self, texts):
+        tokens = [
+            self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(text))
+            for text in texts
+        ]
+        results = self.translator.translate_batch(
+            tokens,
+            beam_size=local_mt_beam_size,
+            max_batch_size=local_mt_max_batch,
+        )
+        return [
+            self.tokenizer.decode(
+                self.tokenizer.convert_tokens_to_ids(r.hypotheses[0]),
+                skip_special_tokens=True,
+            ).strip()
+            for r in results
+        ]
+
+
+@register_backend("local")
+def _translate_local(texts, source_lang, target_lang):
+    engine = _get_engine(source_lang, target_lang)
+    return [fut.result() for fut in engine.submit(texts)]
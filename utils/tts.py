@@ -0,0 +1,237 @@
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import utils.model_registry as model_registry
+import utils.scheduler as scheduler
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+# Which backend synthesizes speech: "auto" uses ElevenLabs when a key is set,
+# else the local engine; "elevenlabs" / "mms" force one.
+tts_backend = _settings.tts_backend
+
+# Every backend returns 16 kHz mono 16-bit PCM wav, the lip-sync input format
+SAMPLE_RATE = 16000
+
+elevenlabs_concurrency = _settings.elevenlabs_concurrency
+
+# Local engine: Meta MMS-TTS (VITS) through transformers, kept resident per model
+local_tts_model = _settings.local_tts_model
+local_tts_max_batch = _settings.local_tts_max_batch
+local_tts_seed = _settings.local_tts_seed
+
+BACKENDS = {}
+
+# Cumulative timings per backend: {"calls", "segments", "chars", "audio_seconds", "elapsed_seconds"}
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def register_backend(name):
+    """
+    Register a TTS backend.
+
+    A backend is a function `(texts, voice_id, model_id, work_dir, on_wait)
+    -> list[str]` that returns one 16 kHz mono PCM wav path per input text,
+    in order. Local engines report their heavy-slot queue position to `on_wait`.
+    """
+
+    def decorator(fn):
+        BACKENDS[name] = fn
+        return fn
+
+    return decorator
+
+
+def resolve_backend(name=None):
+    """Return the backend name to use for `name` (or TTS_BACKEND)."""
+    name = (name or tts_backend).lower()
+    if name == "auto":
+        return "elevenlabs" if get_settings().eleven_api_key else "mms"
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown TTS backend '{name}'. Available: {', '.join(sorted(BACKENDS))}"
+        )
+    return name
+
+
+def wav_duration(path):
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / float(w.getframerate())
+
+
+def _write_wav(pcm_bytes, work_dir=None):
+    out_path = tempfile.NamedTemporaryFile(delete=False, suffix=".wav", dir=work_dir).name
+    with wave.open(out_path, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm_bytes)
+    return out_path
+
+
+def synthesize_batch(
+    texts, voice_id=None, model_id=None, backend=None, work_dir=None, on_wait=None, stats=None
+):
+    """
+    Synthesize `texts` with the configured backend; returns wav paths in order.
+
+    Timing stats (backend, segments, audio seconds, real-time factor) are
+    written into `stats` and added to the per-backend totals in
+    `backend_stats()`.
+    """
+    texts = [(t if isinstance(t, str) else str(t)).strip() for t in texts]
+    if not texts:
+        return []
+    if not all(texts):
+        raise ValueError("TTS text is empty after cleaning.")
+    name = resolve_backend(backend)
+    started = time.time()
+    paths = BACKENDS[name](texts, voice_id, model_id, work_dir, on_wait)
+    elapsed = time.time() - started
+    audio = sum(wav_duration(p) for p in paths)
+
+    with _totals_lock:
+        total = _totals.setdefault(
+            name,
+            {"calls": 0, "segments": 0, "chars": 0, "audio_seconds": 0.0, "elapsed_seconds": 0.0},
+        )
+        total["calls"] += 1
+        total["segments"] += len(texts)
+        total["chars"] += sum(len(t) for t in texts)
+        total["audio_seconds"] += audio
+        total["elapsed_seconds"] += elapsed
+    rtf = elapsed / audio if audio > 0 else 0.0
+    print(
+        f"[TTS] {name}: {len(texts)} segment(s), {audio:.1f}s audio in "
+        f"{elapsed:.1f}s (RTF {rtf:.3f})"
+    )
+    if stats is not None:
+        stats.update(
+            {
+                "backend": name,
+                "segments": len(texts),
+                "chars": sum(len(t) for t in texts),
+                "audio_seconds": round(audio, 2),
+                "elapsed_seconds": round(elapsed, 2),
+                "rtf": round(rtf, 3),
+            }
+        )
+    return paths
+
+
+def backend_stats():
+    """Cumulative per-backend timings with their real-time factor, for routing decisions."""
+    with _totals_lock:
+        return {
+            name: {
+                **total,
+                "rtf": round(total["elapsed_seconds"] / total["audio_seconds"], 3)
+                if total["audio_seconds"]
+                else None,
+            }
+            for name, total in _totals.items()
+        }
+
+
+@register_backend("elevenlabs")
+def _synthesize_elevenlabs(texts, voice_id, model_id, work_dir, on_wait):
+    settings = get_settings()
+    api_key = settings.eleven_api_key
+    if not api_key:
+        raise ValueError("ELEVENLABS_API_KEY is missing; cannot synthesize speech.")
+    voice_id = voice_id or settings.default_voice_id
+    model_id = model_id or settings.default_tts_model
+
+    def synthesize(text):
+        # Raw 16 kHz PCM straight from the API: no MP3 decode before lip sync
+        resp = requests.post(
+            f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}",
+            params={"output_format": f"pcm_{SAMPLE_RATE}"},
+            json={
+                "text": text,
+                "model_id": model_id,
+                "voice_settings": {"stability": 0.5, "similarity_boost": 0.7},
+            },
+            headers={"xi-api-key": api_key, "Accept": "audio/pcm"},
+            timeout=120,
+        )
+        if resp.status_code >= 400:
+            raise ValueError(f"TTS request failed ({resp.status_code}): {resp.text[:500]}")
+        return _write_wav(resp.content, work_dir)
+
+    if len(texts) == 1:
+        return [synthesize(texts[0])]
+    with ThreadPoolExecutor(max_workers=max(1, min(elevenlabs_concurrency, len(texts)))) as pool:
+        return list(pool.map(synthesize, texts))
+
+
+_local_models = {}
+_local_lock = threading.Lock()
+
+
+def _load_local(model_name):
+    """Load (once per process) and return (model, tokenizer, lock) for an MMS-TTS checkpoint."""
+    with _local_lock:
+        if model_name not in _local_models:
+            try:
+                import torch  # noqa: F401
+                from transformers import AutoTokenizer, VitsModel
+            except ImportError as e:
+                raise ImportError(
+                    "Local TTS needs torch and transformers. Install with: pip install transformers"
+                ) from e
+            # Prefer a verified copy installed by download_models.py
+            source = model_registry.model_path(model_name.split("/")[-1]) or model_name
+            print(f"[TTS] loading {source}")
+            tokenizer = AutoTokenizer.from_pretrained(source)
+            model = VitsModel.from_pretrained(source).eval()
+            _local_models[model_name] = (model, tokenizer, threading.Lock())
+        return _local_models[model_name]
+
+
+@register_backend("mms")
+def _synthesize_mms(texts, voice_id, model_id, work_dir, on_wait):
+    import torch
+
+    # model_id may name another MMS checkpoint (e.g. "facebook/mms-tts-tam");
+    # ElevenLabs model ids fall back to LOCAL_TTS_MODEL
+    model_name = model_id if model_id and "/" in model_id else local_tts_model
+    model, tokenizer, model_lock = _load_local(model_name)
+    if getattr(tokenizer, "is_uroman", False):
+        raise ValueError(
+            f"{model_name} expects romanized (uroman) input; pick a checkpoint for the "
+            "target script or romanize the text first."
+        )
+
+    # Sort by length so each batch pads as little as possible
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    paths = [None] * len(texts)
+    with scheduler.heavy_slot("tts", on_wait=on_wait) as threads, model_lock:
+        torch.set_num_threads(threads)
+        for start in range(0, len(order), local_tts_max_batch):
+            batch = order[start:start + local_tts_max_batch]
+            inputs = tokenizer([texts[i] for i in batch], return_tensors="pt", padding=True)
+            # VITS samples noise; a fixed seed makes re-synthesis reproducible
+            torch.manual_seed(local_tts_seed)
+            with torch.inference_mode():
+                output = model(**inputs)
+            waveforms = output.waveform
+            rate = model.config.sampling_rate
+            if rate != SAMPLE_RATE:
+                import torchaudio
+
+                waveforms = torchaudio.functional.resample(waveforms, rate, SAMPLE_RATE)
+            for row, i in enumerate(batch):
+                # Drop the padding samples of shorter items in the batch
+                length = int(output.sequence_lengths[row]) * SAMPLE_RATE // rate
+                samples = waveforms[row, :length].clamp(-1.0, 1.0)
+                pcm = (samples * 32767).to(torch.int16).numpy().tobytes()
+                paths[i] = _write_wav(pcm, work_dir)
+    return paths
@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+Checkpointed Wav2Lip inference.
+
+Drop-in replacement for wav2lip/inference.py (same core arguments) that
+writes the result in chunks of `--checkpoint_every` frames inside
+`--checkpoint_dir`. Face detection results and finished chunks survive a
+crash or restart, so re-running the same command resumes where it stopped.
+
+Frames are streamed from disk rather than loaded up front. Face detection
+runs on a downscaled copy (`--detect_height`); generation crops the padded
+face from the full-resolution frame and blends the generated mouth back in,
+so the background passes through untouched and memory scales with face size.
+
+`--start/--duration/--frame_step/--preview_height` render a quick preview
+(a window, or a reduced-fps low-resolution proxy) through the same engine.
+Face boxes are cached per source frame in `--face_cache`, so a preview and
+the later full render share every detection.
+Must be run with the wav2lip checkout as the working directory.
+"""
+import argparse
+import functools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import audio  # noqa: E402  (wav2lip modules)
+import face_detection  # noqa: E402
+
+import utils.face_tracking as face_tracking  # noqa: E402
+import utils.lipsync_models as lipsync_models  # noqa: E402
+from utils.settings import get_settings  # noqa: E402
+
+IMG_SIZE = 96
+MEL_STEP_SIZE = 16
+
+parser = argparse.ArgumentParser(description="Checkpointed Wav2Lip inference")
+parser.add_argument("--checkpoint_path", type=str, required=True)
+parser.add_argument(
+    "--detector_path", type=str, default=None, help="S3FD weights (default: the wav2lip checkout's)"
+)
+parser.add_argument("--face", type=str, required=True)
+parser.add_argument("--audio", type=str, required=True)
+parser.add_argument("--outfile", type=str, required=True)
+parser.add_argument("--checkpoint_dir", type=str, required=True)
+parser.add_argument("--checkpoint_every", type=int, default=250)
+parser.add_argument("--face_cache", type=str, default=None, help="Where to cache face boxes")
+parser.add_argument("--pads", nargs="+", type=int, default=[0, 10, 0, 0])
+parser.add_argument("--resize_factor", default=1, type=int, help="Downscale output frames (legacy)")
+parser.add_argument(
+    "--detect_height", type=int, default=480, help="Run face detection on frames scaled to this height"
+)
+parser.add_argument(
+    "--paste",
+    default="blend",
+    choices=["blend", "replace"],
+    help="Blend only the generated mouth region back (default) or paste the whole face box",
+)
+parser.add_argument("--face_det_batch_size", type=int, default=16)
+parser.add_argument("--wav2lip_batch_size", type=int, default=128)
+parser.add_argument("--nosmooth", default=False, action="store_true")
+parser.add_argument(
+    "--detect_mode",
+    default=get_settings().lipsync_detect_mode,
+    choices=["track", "every_frame"],
+    help="Run S3FD on keyframes and track in between, or on every frame",
+)
+parser.add_argument("--threads", type=int, default=0, help="Torch CPU threads (0 = default)")
+parser.add_argument("--start", type=float, default=0.0, help="Preview window start (seconds)")
+parser.add_argument("--duration", type=float, default=0.0, help="Preview window length (0 = to the end)")
+parser.add_argument("--frame_step", type=int, default=1, help="Render every Nth frame (reduced-fps preview)")
+parser.add_argument("--preview_height", type=int, default=0, help="Scale output to this height (0 = native)")
+parser.add_argument(
+    "--model_variant",
+    default=get_settings().lipsync_model_variant,
+    choices=["auto"] + lipsync_models.GENERATOR_VARIANTS,
+    help="Generator variant; 'auto' picks the fastest one validated for this checkpoint",
+)
+
+device = "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def log(msg):
+    print(msg, flush=True)
+
+
+def progress(stage, done, total):
+    """Emit a machine-readable progress line for the dashboard to parse."""
+    print("PROGRESS " + json.dumps({"stage": stage, "done": done, "total": total}), flush=True)
+
+
+def video_info(path, resize_factor):
+    """Return (fps, frame_count, width, height) of the output frames."""
+    stream = cv2.VideoCapture(path)
+    if not stream.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    fps = stream.get(cv2.CAP_PROP_FPS) or 25.0
+    count = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+    width = int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)) // resize_factor
+    height = int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)) // resize_factor
+    stream.release()
+    return fps, count, width, height
+
+
+def iter_frames(path, resize_factor=1, start=0, scale=1.0, count=None):
+    """Stream up to `count` frames from `start`, downscaled by `resize_factor` and then `scale`."""
+    stream = cv2.VideoCapture(path)
+    if start:
+        stream.set(cv2.CAP_PROP_POS_FRAMES, start)
+    try:
+        read = 0
+        while count is None or read < count:
+            read += 1
+            ok, frame = stream.read()
+            if not ok:
+                break
+            if resize_factor > 1:
+                frame = cv2.resize(
+                    frame,
+                    (frame.shape[1] // resize_factor, frame.shape[0] // resize_factor),
+                )
+            if scale != 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            yield frame
+    finally:
+        stream.release()
+
+
+def count_frames(path):
+    """Exact frame count via ffprobe packet counting, falling back to OpenCV metadata."""
+    try:
+        out = subprocess.run(
+            [
+                "ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+                "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", path,
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        return int(out.stdout.strip().split(",")[0])
+    except Exception:
+        stream = cv2.VideoCapture(path)
+        count = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+        stream.release()
+        return count
+
+
+def iter_sources(path, resize_factor, n_frames, indices, size=None):
+    """
+    Yield the source frame for each output frame index in `indices` (ascending),
+    looping the video like upstream Wav2Lip when the audio outlasts it.
+    Frames are resized to `size` (w, h) when given.
+    """
+    stream, pos, last = None, 0, None
+    try:
+        for i in indices:
+            src = i % n_frames
+            if stream is None or src < pos:
+                if stream is not None:
+                    stream.release()
+                stream = cv2.VideoCapture(path)
+                if src:
+                    stream.set(cv2.CAP_PROP_POS_FRAMES, src)
+                pos = src
+            while pos < src:
+                stream.grab()
+                pos += 1
+            ok, frame = stream.read()
+            pos += 1
+            if not ok:
+                if last is None:
+                    raise ValueError(f"Could not read frame {src} of {path}")
+                frame = last  # container reported more frames than decodable
+            elif resize_factor > 1:
+                frame = cv2.resize(
+                    frame,
+                    (frame.shape[1] // resize_factor, frame.shape[0] // resize_factor),
+                )
+            last = frame
+            if size is not None and (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            yield frame.copy()
+    finally:
+        if stream is not None:
+            stream.release()
+
+
+def mel_chunks_for(audio_path, fps):
+    """Split the audio mel-spectrogram into one window per output frame."""
+    wav = audio.load_wav(audio_path, 16000)
+    mel = audio.melspectrogram(wav)
+    if np.isnan(mel.reshape(-1)).sum() > 0:
+        raise ValueError("Mel contains nan; try adding a small epsilon noise to the wav")
+    chunks = []
+    mel_idx_multiplier = 80.0 / fps
+    i = 0
+    while True:
+        start_idx = int(i * mel_idx_multiplier)
+        if start_idx + MEL_STEP_SIZE > len(mel[0]):
+            chunks.append(mel[:, len(mel[0]) - MEL_STEP_SIZE :])
+            break
+        chunks.append(mel[:, start_idx : start_idx + MEL_STEP_SIZE])
+        i += 1
+    return chunks
+
+
+def smooth_boxes(boxes, window=5):
+    for i in range(len(boxes)):
+        if i + window > len(boxes):
+            win = boxes[len(boxes) - window :]
+        else:
+            win = boxes[i : i + window]
+        boxes[i] = np.mean(win, axis=0)
+    return boxes
+
+
+def detect_faces(
+    path, resize_factor, pads, batch_size, nosmooth, mode, detect_height, frame_size,
+    start=0, count=None, detector_path=None,
+):
+    """
+    Return one (y1, y2, x1, x2) box per source frame in start..start+count-1,
+    in output-frame pixels.
+
+    Detection runs on frames scaled to `detect_height`. In "track" mode S3FD
+    only runs on keyframes/scene cuts and a correlation tracker (with
+    built-in smoothing) fills in the frames between them; in "every_frame"
+    mode S3FD runs on every frame as upstream Wav2Lip does.
+    """
+    width, height = frame_size
+    scale = min(1.0, detect_height / float(height)) if detect_height > 0 else 1.0
+    # Tracking streams the frames twice (keyframe scan, then tracking)
+    passes = 2 if mode == "track" else 1
+    total = (count or count_frames(path) - start) * passes
+    streamed = 0
+
+    def open_frames():
+        nonlocal streamed
+        for frame in iter_frames(path, resize_factor, start=start, scale=scale, count=count):
+            if streamed % 25 == 0:
+                progress("detect", streamed, total)
+            streamed += 1
+            yield frame
+
+    detector = face_detection.FaceAlignment(
+        face_detection.LandmarksType._2D, flip_input=False, device=device
+    )
+    if detector_path and not os.path.samefile(detector_path, lipsync_models.S3FD_CHECKPOINT):
+        from face_detection.detection.sfd.sfd_detector import SFDDetector
+
+        detector.face_detector = SFDDetector(device=device, path_to_detector=detector_path)
+    if lipsync_models.use_fast_detector(detector, device):
+        log("Using fused TorchScript S3FD detector")
+
+    def detect_batch(images):
+        nonlocal batch_size
+        while True:
+            predictions = []
+            try:
+                for i in range(0, len(images), batch_size):
+                    predictions.extend(
+                        detector.get_detections_for_batch(np.array(images[i : i + batch_size]))
+                    )
+            except RuntimeError:
+                if batch_size == 1:
+                    raise RuntimeError("Image too big to run face detection on GPU.")
+                batch_size //= 2
+                log(f"Recovering from OOM error; new face detection batch size: {batch_size}")
+                continue
+            return predictions
+
+    started = time.time()
+    if mode == "track":
+        rects, stats = face_tracking.track_boxes(
+            open_frames, detect_batch, detect_batch_size=batch_size
+        )
+        log(
+            f"Face tracking: {stats['detections']} detections for {stats['frames']} frames "
+            f"({stats['keyframes']} keyframes, {stats['redetections']} re-detections)"
+        )
+    else:
+        rects, batch = [], []
+        for frame in open_frames():
+            batch.append(frame)
+            if len(batch) >= batch_size:
+                rects.extend(detect_batch(batch))
+                batch = []
+        if batch:
+            rects.extend(detect_batch(batch))
+    log(f"Face detection took {time.time() - started:.1f}s")
+
+    pady1, pady2, padx1, padx2 = pads
+    boxes = []
+    for rect in rects:
+        if rect is None:
+            raise ValueError("Face not detected! Ensure the video contains a face in all the frames.")
+        x1, y1, x2, y2 = (float(v) / scale for v in rect[:4])
+        boxes.append(
+            [
+                max(0, int(y1) - pady1),
+                min(height, int(y2) + pady2),
+                max(0, int(x1) - padx1),
+                min(width, int(x2) + padx2),
+            ]
+        )
+    boxes = np.array(boxes, dtype=np.float64)
+    # The tracker already smooths its boxes
+    if not nosmooth and mode != "track":
+        boxes = smooth_boxes(boxes)
+    del detector
+    return boxes.astype(int)
+
+
+def load_model(path, variant, threads):
+    log(f"Load checkpoint from: {path}")
+    model, name = lipsync_models.load_best_generator(path, device, threads, variant)
+    log(f"Using Wav2Lip generator variant: {name}")
+    return model
+
+
+def datagen(frames, boxes, mels, indices, batch_size):
+    """Yield model batches for the output frames listed in `indices`.
+
+    `frames` streams the full-resolution source frame for each index; only
+    the face crops and one batch of frames are held at a time.
+    """
+    img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+    for i, frame in zip(indices, frames):
+        y1, y2, x1, x2 = boxes[i % len(boxes)]
+        face = cv2.resize(frame[y1:y2, x1:x2], (IMG_SIZE, IMG_SIZE), interpolation=cv2.INTER_AREA)
+        img_batch.append(face)
+        mel_batch.append(mels[i])
+        frame_batch.append(frame)
+        coords_batch.append((y1, y2, x1, x2))
+        if len(img_batch) >= batch_size:
+            yield _pack(img_batch, mel_batch), frame_batch, coords_batch
+            img_batch, mel_batch, frame_batch, coords_batch = [], [], [], []
+    if img_batch:
+        yield _pack(img_batch, mel_batch), frame_batch, coords_batch
+
+
+def _pack(img_batch, mel_batch):
+    img_batch, mel_batch = np.asarray(img_batch), np.asarray(mel_batch)
+    img_masked = img_batch.copy()
+    img_masked[:, IMG_SIZE // 2 :] = 0
+    img_batch = np.concatenate((img_masked, img_batch), axis=3) / 255.0
+    mel_batch = np.reshape(mel_batch, [len(mel_batch), mel_batch.shape[1], mel_batch.shape[2], 1])
+    return img_batch, mel_batch
+
+
+def to_tensors(img_batch, mel_batch):
+    """(mel, face) NCHW tensors on `device`, as the generator takes them."""
+    img_t = torch.FloatTensor(np.transpose(img_batch, (0, 3, 1, 2))).to(device)
+    mel_t = torch.FloatTensor(np.transpose(mel_batch, (0, 3, 1, 2))).to(device)
+    return mel_t, img_t
+
+
+@functools.lru_cache(maxsize=64)
+def mouth_mask(height, width):
+    """Feathered mask covering the lower (mouth) part of a face crop."""
+    mask = np.zeros((height, width), dtype=np.float32)
+    top = int(height * 0.5)
+    inset = int(width * 0.12)
+    mask[top : height - max(1, height // 20), inset : width - inset] = 1.0
+    k = max(3, (min(height, width) // 6) | 1)
+    mask = cv2.GaussianBlur(mask, (k, k), 0)
+    return mask[..., None]
+
+
+def paste_face(frame, generated, coords, mode):
+    """Write the generated face back into the full-resolution `frame`."""
+    y1, y2, x1, x2 = coords
+    h, w = y2 - y1, x2 - x1
+    patch = cv2.resize(generated.astype(np.uint8), (w, h), interpolation=cv2.INTER_CUBIC)
+    if mode == "replace":
+        frame[y1:y2, x1:x2] = patch
+        return frame
+    mask = mouth_mask(h, w)
+    region = frame[y1:y2, x1:x2].astype(np.float32)
+    frame[y1:y2, x1:x2] = (mask * patch + (1.0 - mask) * region).astype(np.uint8)
+    return frame
+
+
+def write_progress(checkpoint_dir, **info):
+    path = os.path.join(checkpoint_dir, "progress.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(info, f)
+    os.replace(path + ".tmp", path)
+
+
+def render_chunk(
+    model, frames, boxes, mels, indices, fps, frame_size, batch_size, paste, chunk_path,
+    on_batch=None,
+):
+    """
+    Render the given output frames to `chunk_path` (atomically renamed when
+    done); `on_batch(n)` is called after each batch of n frames.
+    """
+    tmp_path = chunk_path + ".partial.avi"
+    out = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"DIVX"), fps, frame_size)
+    for (img_batch, mel_batch), frame_batch, coords_batch in datagen(
+        frames, boxes, mels, indices, batch_size
+    ):
+        mel_t, img_t = to_tensors(img_batch, mel_batch)
+        with torch.no_grad():
+            pred = model(mel_t, img_t)
+        pred = pred.cpu().numpy().transpose(0, 2, 3, 1) * 255.0
+        for p, f, c in zip(pred, frame_batch, coords_batch):
+            out.write(paste_face(f, p, c, paste))
+        if on_batch is not None:
+            on_batch(len(frame_batch))
+    out.release()
+    os.replace(tmp_path, chunk_path)
+
+
+def ensure_boxes(args, cache_path, n_frames, needed, frame_size):
+    """
+    Load cached face boxes and detect only the source frames in `needed` that
+    are still missing (rows of -1), so previews and full renders share work.
+    """
+    boxes = None
+    if os.path.exists(cache_path):
+        try:
+            boxes = np.load(cache_path)
+        except (OSError, ValueError, EOFError):
+            log(f"Ignoring unreadable face cache {cache_path}")
+    if boxes is None or len(boxes) != n_frames:
+        boxes = np.full((n_frames, 4), -1, dtype=int)
+
+    missing = [i for i in needed if boxes[i][0] < 0]
+    if not missing:
+        log(f"Using cached face boxes from {cache_path}")
+        return boxes
+
+    # Detect contiguous runs of missing frames
+    runs, run_start, prev = [], missing[0], missing[0]
+    for i in missing[1:]:
+        if i != prev + 1:
+            runs.append((run_start, prev - run_start + 1))
+            run_start = i
+        prev = i
+    runs.append((run_start, prev - run_start + 1))
+    for start, count in runs:
+        found = detect_faces(
+            args.face, args.resize_factor, args.pads, args.face_det_batch_size,
+            args.nosmooth, args.detect_mode, args.detect_height, frame_size,
+            start=start, count=count, detector_path=args.detector_path,
+        )
+        boxes[start : start + len(found)] = found
+    # Frames the decoder could not deliver reuse the nearest earlier box
+    for i in needed:
+        if boxes[i][0] < 0 and i > 0:
+            boxes[i] = boxes[i - 1]
+    # Written aside and renamed: a crash mid-save must not leave a truncated cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, boxes)
+    os.replace(tmp_path, cache_path)
+    return boxes
+
+
+def concat_chunks(chunk_paths, audio_path, outfile, checkpoint_dir, start=0.0, duration=0.0, total=0):
+    """
+    Join finished chunks and mux the driving audio (optionally a window of it)
+    into `outfile`. The re-encode reports its frame count as "mux" progress so
+    a long encode is not mistaken for a stall.
+    """
+    list_path = os.path.join(checkpoint_dir, "chunks.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in chunk_paths:
+            f.write(f"file '{os.path.abspath(p)}'\n")
+    cmd = [
+        "ffmpeg", "-y", "-loglevel", "error", "-nostats", "-progress", "pipe:1",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        *(["-ss", f"{start:.3f}"] if start > 0 else []),
+        *(["-t", f"{duration:.3f}"] if duration > 0 else []),
+        "-i", audio_path,
+        "-map", "0:v:0", "-map", "1:a:0",
+        "-c:v", "libx264", "-preset", "veryfast", "-c:a", "aac",
+        "-shortest", outfile,
+    ]
+    total = max(1, total)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    try:
+        for line in proc.stdout:
+            key, _, value = line.strip().partition("=")
+            if key == "frame" and value.isdigit():
+                progress("mux", min(int(value), total), total)
+        proc.wait()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    progress("mux", total, total)
+
+
+def main():
+    args = parser.parse_args()
+    if args.threads > 0:
+        # Pin intra-op threads to the slot size granted by the scheduler
+        torch.set_num_threads(args.threads)
+        torch.set_num_interop_threads(1)
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+
+    fps, _, width, height = video_info(args.face, args.resize_factor)
+    n_frames = count_frames(args.face)
+    log(f"Source: {n_frames} frames of {width}x{height} @ {fps:.2f} fps")
+
+    mels = mel_chunks_for(args.audio, fps)
+    log(f"Length of mel chunks: {len(mels)}")
+
+    # Output frames to render: everything, or a preview window / reduced-fps proxy
+    first = min(len(mels) - 1, int(round(args.start * fps)))
+    end = len(mels)
+    if args.duration > 0:
+        end = min(end, first + max(1, int(round(args.duration * fps))))
+    step = max(1, args.frame_step)
+    indices = list(range(first, end, step))
+    total = len(indices)
+
+    # Face boxes are the expensive, input-only part: computed once per source frame
+    boxes_path = args.face_cache or os.path.join(args.checkpoint_dir, "face_boxes.npy")
+    needed = sorted({i % n_frames for i in indices})
+    boxes = ensure_boxes(args, boxes_path, n_frames, needed, (width, height))
+
+    out_size = (width, height)
+    if args.preview_height and args.preview_height < height:
+        scale = args.preview_height / float(height)
+        out_size = (int(width * scale) // 2 * 2, int(height * scale) // 2 * 2)
+        boxes = (boxes * scale).astype(int)
+        log(f"Preview output size: {out_size[0]}x{out_size[1]}")
+    out_fps = fps / step
+
+    every = max(1, args.checkpoint_every)
+    chunk_paths = []
+    model = None
+    started = time.time()
+    rendered = 0
+
+    def on_batch(n):
+        nonlocal rendered
+        rendered += n
+        progress("render", rendered, total)
+    for chunk_idx, pos in enumerate(range(0, total, every)):
+        chunk_path = os.path.join(args.checkpoint_dir, f"chunk_{chunk_idx:06d}.avi")
+        chunk_paths.append(chunk_path)
+        chunk = indices[pos : pos + every]
+        done = pos + len(chunk)
+        if os.path.exists(chunk_path):
+            log(f"Chunk {chunk_idx} (frames {chunk[0]}-{chunk[-1]}) already rendered, skipping")
+            rendered = done
+            progress("render", rendered, total)
+            continue
+        if model is None:
+            model = load_model(args.checkpoint_path, args.model_variant, args.threads)
+        frames = iter_sources(args.face, args.resize_factor, n_frames, chunk, size=out_size)
+        render_chunk(
+            model, frames, boxes, mels, chunk, out_fps, out_size,
+            args.wav2lip_batch_size, args.paste, chunk_path, on_batch=on_batch,
+        )
+        write_progress(
+            args.checkpoint_dir, done=done, total=total, elapsed=time.time() - started
+        )
+        log(f"Checkpointed frames {done}/{total}")
+
+    progress("mux", 0, total)
+    window = (end - first) / fps if (first > 0 or args.duration > 0) else 0.0
+    concat_chunks(
+        chunk_paths, args.audio, args.outfile, args.checkpoint_dir,
+        start=first / fps, duration=window, total=total,
+    )
+    log(f"Wrote {args.outfile}")
+
+
+if __name__ == "__main__":
+    main()
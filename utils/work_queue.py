@@ -0,0 +1,469 @@
+"""
+Shared task queue for pipeline workers.
+
+Tasks live in a SQLite database. A worker claims a task that matches its
+capabilities and holds it under a lease that it renews with heartbeats.
+When a worker dies, its lease runs out and the task goes back to the queue
+(up to `max_attempts` times). Workers on other machines reach the same
+queue through a small line-delimited JSON broker over TCP:
+
+    WORK_BROKER_TOKEN=... python utils/work_queue.py broker --host 0.0.0.0 --port 7700
+
+The broker binds 127.0.0.1 unless given a token to check.
+
+`connect(url)` returns the queue for "tcp://host:port" (broker client) or a
+SQLite path, both with the same methods.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Run as a script, only utils/ is on the path
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(0, PROJECT_DIR)
+
+from utils.settings import get_settings  # noqa: E402
+
+_settings = get_settings()
+
+DEFAULT_DB = os.path.join(PROJECT_DIR, "jobs", "queue.db")
+LEASE_SECONDS = _settings.work_lease_seconds
+BROKER_TOKEN = _settings.work_broker_token
+
+# Capability a worker must advertise to run each task kind
+TASK_CAPABILITIES = {
+    "extract": "media",
+    "mux": "media",
+    "transcribe": "asr",
+    "translate": "api",
+    "tts": "api",
+    "lipsync": "lipsync",
+}
+# TTS backends that run on the worker's own hardware rather than a remote API
+LOCAL_TTS_BACKENDS = {"mms"}
+CAPABILITIES = sorted(set(TASK_CAPABILITIES.values()) | {"tts-local"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    capability TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (status, capability, id);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    capabilities TEXT NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tts_stats (
+    backend TEXT PRIMARY KEY,
+    calls INTEGER NOT NULL DEFAULT 0,
+    segments INTEGER NOT NULL DEFAULT 0,
+    chars INTEGER NOT NULL DEFAULT 0,
+    audio_seconds REAL NOT NULL DEFAULT 0,
+    elapsed_seconds REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+def capability_for(kind, params=None):
+    """Capability a worker needs for a task; local TTS engines need a `tts-local` box."""
+    if kind == "tts" and (params or {}).get("backend") in LOCAL_TTS_BACKENDS:
+        return "tts-local"
+    return TASK_CAPABILITIES[kind]
+
+
+def _row(cur, row):
+    task = {col[0]: value for col, value in zip(cur.description, row)}
+    for key in ("payload", "progress", "result"):
+        if task.get(key) is not None:
+            task[key] = json.loads(task[key])
+    return task
+
+
+class WorkQueue:
+    """SQLite-backed task queue with leases; safe across threads and processes."""
+
+    def __init__(self, path=DEFAULT_DB):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _conn(self, mode="IMMEDIATE"):
+        return _Transaction(self._connection(), mode)
+
+    def enqueue(self, kind, payload, max_attempts=3):
+        """Add a task and return its id."""
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO tasks (kind, capability, payload, max_attempts, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    kind,
+                    capability_for(kind, payload.get("params")),
+                    json.dumps(payload),
+                    max_attempts,
+                    now,
+                    now,
+                ),
+            )
+            return cur.lastrowid
+
+    def _expire_leases(self, conn, now):
+        # Tasks of dead workers go back to the queue, or fail once out of attempts
+        conn.execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= max_attempts THEN 'failed' "
+            "ELSE 'queued' END, error = 'lease expired on worker ' || worker, "
+            "worker = NULL, lease_until = NULL, updated = ? "
+            "WHERE status = 'leased' AND lease_until < ?",
+            (now, now),
+        )
+
+    def claim(self, worker_id, capabilities, lease_seconds=LEASE_SECONDS):
+        """Lease the oldest queued task this worker can run, or return None."""
+        capabilities = sorted(capabilities)
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (id, capabilities, last_seen) VALUES (?, ?, ?)",
+                (worker_id, json.dumps(capabilities), now),
+            )
+            self._expire_leases(conn, now)
+            marks = ",".join("?" for _ in capabilities)
+            cur = conn.execute(
+                f"SELECT id FROM tasks WHERE status = 'queued' AND capability IN ({marks}) "
+                "ORDER BY id LIMIT 1",
+                capabilities,
+            )
+            row = cur.fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, error = NULL, updated = ? WHERE id = ?",
+                (worker_id, now + lease_seconds, now, row[0]),
+            )
+            cur = conn.execute("SELECT * FROM tasks WHERE id = ?", (row[0],))
+            return _row(cur, cur.fetchone())
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=LEASE_SECONDS, progress=None):
+        """Extend the lease (and record progress); False if the lease was lost."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE workers SET last_seen = ? WHERE id = ?", (now, worker_id)
+            )
+            cur = conn.execute(
+                "UPDATE tasks SET lease_until = ?, updated = ?, "
+                "progress = COALESCE(?, progress) "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (
+                    now + lease_seconds,
+                    now,
+                    json.dumps(progress) if progress is not None else None,
+                    task_id,
+                    worker_id,
+                ),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, task_id, worker_id, result):
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE tasks SET status = 'done', result = ?, lease_until = NULL, "
+                "updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (json.dumps(result), time.time(), task_id, worker_id),
+            )
+            return cur.rowcount == 1
+
+    def fail(self, task_id, worker_id, error, retry=True):
+        """Record a failure; the task is retried while attempts remain."""
+        with self._conn() as conn:
+            cur = conn.execute(
+                "UPDATE tasks SET status = CASE WHEN ? AND attempts < max_attempts "
+                "THEN 'queued' ELSE 'failed' END, error = ?, worker = NULL, "
+                "lease_until = NULL, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (1 if retry else 0, str(error)[-4000:], time.time(), task_id, worker_id),
+            )
+            return cur.rowcount == 1
+
+    def get(self, task_id):
+        """Task dict (with `position` among queued tasks of its capability), or None."""
+        with self._conn("DEFERRED") as conn:
+            cur = conn.execute("SELECT * FROM tasks WHERE id = ?", (task_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            task = _row(cur, row)
+            task["position"] = 0
+            if task["status"] == "queued":
+                task["position"] = conn.execute(
+                    "SELECT COUNT(*) FROM tasks WHERE status = 'queued' "
+                    "AND capability = ? AND id <= ?",
+                    (task["capability"], task_id),
+                ).fetchone()[0]
+            return task
+
+    def record_tts(self, stats):
+        """Add one synthesize_batch() stats dict to the fleet-wide per-backend totals."""
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO tts_stats (backend) VALUES (?)", (stats["backend"],)
+            )
+            conn.execute(
+                "UPDATE tts_stats SET calls = calls + 1, segments = segments + ?, "
+                "chars = chars + ?, audio_seconds = audio_seconds + ?, "
+                "elapsed_seconds = elapsed_seconds + ? WHERE backend = ?",
+                (
+                    stats["segments"],
+                    stats["chars"],
+                    stats["audio_seconds"],
+                    stats["elapsed_seconds"],
+                    stats["backend"],
+                ),
+            )
+
+    def tts_stats(self):
+        """Per-backend TTS totals across every worker, shaped like tts.backend_stats()."""
+        with self._conn("DEFERRED") as conn:
+            cur = conn.execute("SELECT * FROM tts_stats")
+            rows = [_row(cur, row) for row in cur.fetchall()]
+        return {
+            row.pop("backend"): {
+                **row,
+                "rtf": round(row["elapsed_seconds"] / row["audio_seconds"], 3)
+                if row["audio_seconds"]
+                else None,
+            }
+            for row in rows
+        }
+
+    def stats(self, worker_ttl=None):
+        """Task counts per status/capability and the workers seen recently."""
+        worker_ttl = LEASE_SECONDS * 3 if worker_ttl is None else worker_ttl
+        with self._conn("DEFERRED") as conn:
+            counts = {}
+            for status, capability, n in conn.execute(
+                "SELECT status, capability, COUNT(*) FROM tasks GROUP BY status, capability"
+            ):
+                counts.setdefault(status, {})[capability] = n
+            workers = [
+                {"id": wid, "capabilities": json.loads(caps), "last_seen": seen}
+                for wid, caps, seen in conn.execute(
+                    "SELECT id, capabilities, last_seen FROM workers WHERE last_seen > ?",
+                    (time.time() - worker_ttl,),
+                )
+            ]
+        return {"tasks": counts, "workers": workers}
+
+
+class _Transaction:
+    """`with` block running one transaction on an autocommit connection."""
+
+    def __init__(self, conn, mode):
+        self.conn = conn
+        self.mode = mode
+
+    def __enter__(self):
+        self.conn.execute(f"BEGIN {self.mode}")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+# ---------------------------------------------------------------------------
+# TCP broker
+# ---------------------------------------------------------------------------
+
+_BROKER_METHODS = {
+    "enqueue", "claim", "heartbeat", "complete", "fail", "get", "stats", "record_tts", "tts_stats",
+}
+# Safe to send again when the reply was lost
+_IDEMPOTENT_METHODS = {"heartbeat", "get", "stats", "tts_stats"}
+
+
+class _BrokerHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if BROKER_TOKEN and not hmac.compare_digest(
+                    str(request.get("token") or ""), BROKER_TOKEN
+                ):
+                    raise PermissionError("bad broker token")
+                method = request["method"]
+                if method not in _BROKER_METHODS:
+                    raise ValueError(f"unknown method {method}")
+                result = getattr(self.server.queue, method)(
+                    *request.get("args", []), **request.get("kwargs", {})
+                )
+                reply = {"ok": True, "result": result}
+            except Exception as e:
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+def _is_loopback(host):
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, queue):
+        super().__init__(address, _BrokerHandler)
+        self.queue = queue
+
+
+class BrokerClient:
+    """Same interface as WorkQueue, forwarded to a BrokerServer over TCP."""
+
+    def __init__(self, host, port, token=BROKER_TOKEN, timeout=30):
+        self.address = (host, port)
+        self.token = token
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _stream(self):
+        """This thread's connection, reopened if the broker closed the idle one."""
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                # Readable before we've sent anything means EOF (or a reset):
+                # the broker restarted or dropped the idle connection
+                sock.setblocking(False)
+                try:
+                    stale = sock.recv(1, socket.MSG_PEEK) == b""
+                except BlockingIOError:
+                    stale = False
+                finally:
+                    sock.settimeout(self.timeout)
+            except OSError:
+                stale = True
+            if stale:
+                self._close()
+        if getattr(self._local, "sock", None) is None:
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            self._local.sock = sock
+            self._local.stream = sock.makefile("rwb")
+        return self._local.stream
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = self._local.stream = None
+        if sock is not None:
+            sock.close()
+
+    def _call(self, method, *args, **kwargs):
+        request = json.dumps(
+            {"method": method, "args": args, "kwargs": kwargs, "token": self.token}
+        ).encode("utf-8") + b"\n"
+        # Only read-style calls are replayed after a failure: once an enqueue or
+        # claim may have reached the broker, sending it again could run a task
+        # twice or lease one nobody works on. Callers treat OSError as "queue
+        # unavailable" and retry from a known state.
+        for attempt in range(2 if method in _IDEMPOTENT_METHODS else 1):
+            try:
+                stream = self._stream()
+                stream.write(request)
+                stream.flush()
+                line = stream.readline()
+                if not line:
+                    raise ConnectionError("broker closed the connection")
+                break
+            except OSError:
+                self._close()
+                if attempt == 1 or method not in _IDEMPOTENT_METHODS:
+                    raise
+        reply = json.loads(line)
+        if not reply["ok"]:
+            raise RuntimeError(reply["error"])
+        return reply["result"]
+
+    def __getattr__(self, name):
+        if name not in _BROKER_METHODS:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self._call(name, *args, **kwargs)
+
+
+def connect(url=None):
+    """Queue for "tcp://host:port", a SQLite path (or "sqlite:///path"), or the default DB."""
+    url = url or DEFAULT_DB
+    if url.startswith("tcp://"):
+        host, _, port = url[len("tcp://"):].rpartition(":")
+        return BrokerClient(host, int(port))
+    if url.startswith("sqlite://"):
+        url = url[len("sqlite://"):]
+    return WorkQueue(url)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline work queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+    broker = sub.add_parser("broker", help="serve a SQLite queue over TCP")
+    broker.add_argument("--db", default=DEFAULT_DB)
+    broker.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="address to bind; anything but loopback requires WORK_BROKER_TOKEN",
+    )
+    broker.add_argument("--port", type=int, default=7700)
+    stats = sub.add_parser("stats", help="print task counts and live workers")
+    stats.add_argument("--queue", default=_settings.pipeline_queue)
+    args = parser.parse_args()
+
+    if args.command == "broker":
+        if not BROKER_TOKEN and not _is_loopback(args.host):
+            parser.error(
+                f"refusing to serve {args.host} without WORK_BROKER_TOKEN; "
+                "set a token or bind 127.0.0.1"
+            )
+        server = BrokerServer((args.host, args.port), WorkQueue(args.db))
+        print(f"[queue] broker for {args.db} on {args.host}:{args.port}")
+        server.serve_forever()
+    else:
+        json.dump(connect(args.queue).stats(), sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,363 +1,156 @@
 import streamlit as st
-import tempfile
 import os
-import requests
-from huggingface_hub import InferenceClient
-
-# MoviePy import with fallback to avoid missing editor module
-try:
-    from moviepy.editor import VideoFileClip, AudioFileClip  # preferred path
-except ImportError:
-    from moviepy.video.io.VideoFileClip import VideoFileClip
-    from moviepy.audio.io.AudioFileClip import AudioFileClip
-
-import ffmpeg
-
-from dotenv import load_dotenv
-from groq import Groq
-import subprocess
-import sys
-
-# Load environment variables
-load_dotenv()
-hf_token = os.getenv("HF_TOKEN")
-eleven_api_key = os.getenv("ELEVENLABS_API_KEY")
-groq_api_key = os.getenv("GROQ_API_KEY")
-sync_api_key = os.getenv("SYNC_API_KEY")
-default_voice_id = os.getenv(
-    "ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM"
-)  # common default voice
-default_tts_model = os.getenv("ELEVENLABS_TTS_MODEL", "eleven_multilingual_v2")
-
-# Local ASR config (faster-whisper)
-use_local_asr = os.getenv("USE_LOCAL_ASR", "").lower() == "true"
-whisper_model_size = os.getenv("WHISPER_MODEL_SIZE", "medium")
-whisper_device = os.getenv("WHISPER_DEVICE", "cpu")
-whisper_compute_type = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+import functools
+
+import utils.jobs as jobs
+import utils.model_registry as model_registry
+import utils.proxy_media as proxy_media
+import utils.redub as redub
+import utils.scheduler as scheduler
+import utils.pipeline as pipeline
+from utils.pipeline import (
+    extract_audio,
+    replace_audio_track,
+    synthesize_clips,
+)
+from utils.settings import get_settings
+import utils.translation as translation
+import utils.tts as tts
+
+# Configuration is loaded once (app.py loads it before importing this module)
+settings = get_settings()
 
 LANGUAGE_OPTIONS = [
     ("English", "Hindi"),  # Initial focus; extend later
 ]
 
 
-def upload_to_tmpshare(path: str) -> str:
-    """
-    Upload a file to a temp host and return a direct download URL usable by Sync API.
-    Tries file.io first, falls back to tmpfiles.org (with /dl/ direct link).
-    """
-    if not os.path.exists(path):
-        raise ValueError(f"File not found for upload: {path}")
-
-    # Try file.io
-    try:
-        with open(path, "rb") as f:
-            files = {"file": (os.path.basename(path), f)}
-            resp = requests.post("https://file.io", files=files, timeout=120)
-        if resp.status_code == 200:
-            data = resp.json()
-            link = data.get("link")
-            if link:
-                return link
-    except Exception:
-        pass  # fall back
-
-    # Fallback: tmpfiles.org with direct dl link
-    with open(path, "rb") as f:
-        files = {"file": (os.path.basename(path), f)}
-        resp = requests.post(
-            "https://tmpfiles.org/api/v1/upload", files=files, timeout=120
-        )
-    if resp.status_code != 200:
-        raise ValueError(
-            f"Upload failed (status {resp.status_code}): {resp.text[:200]}"
-        )
-    data = resp.json()
-    url = data.get("data", {}).get("url")
-    if not url:
-        raise ValueError(f"Upload response missing URL: {data}")
-    # Convert to direct download link
-    file_id = url.rstrip("/").split("/")[-1]
-    direct_url = f"https://tmpfiles.org/dl/{file_id}"
-    return direct_url
-
-
-def extract_audio(video_path):
-    """Extracts audio from video and saves as MP3"""
-    video = VideoFileClip(video_path)
-    audio_path = video_path.replace(".mp4", ".mp3").replace(".mov", ".mp3")
-    video.audio.write_audiofile(audio_path, logger=None)
-    return audio_path
-
-
-def transcribe_audio(file_path):
-    """Transcribes audio using priority: Groq Whisper → HF Whisper → local Faster-Whisper."""
-    # Groq ASR first if available
-    if groq_api_key:
-        client = Groq(api_key=groq_api_key)
-        with open(file_path, "rb") as f:
-            audio_bytes = f.read()
-        resp = client.audio.transcriptions.create(
-            file=(os.path.basename(file_path), audio_bytes),
-            model="whisper-large-v3",
-            response_format="text",
-            temperature=0,
-        )
-        return resp.strip()
-
-    # Local ASR path
-    if use_local_asr or not hf_token:
-        try:
-            from faster_whisper import WhisperModel  # type: ignore
-        except Exception as e:
-            raise ValueError(
-                f"Local ASR requested but faster-whisper is not available: {e}"
-            )
-        model = WhisperModel(
-            whisper_model_size, device=whisper_device, compute_type=whisper_compute_type
-        )
-        segments, info = model.transcribe(file_path, beam_size=5)
-        transcript = " ".join([seg.text.strip() for seg in segments if seg.text])
-        return transcript.strip()
-
-    client = InferenceClient(
-        model="openai/whisper-large-v3", token=hf_token, provider="hf-inference"
+def _progress_bar(label):
+    """Return an `on_progress` callback that drives a live progress bar."""
+    bar = st.progress(0.0, text=f"{label}: starting...")
+    stage_names = {"detect": "Detecting faces", "render": "Rendering", "mux": "Muxing audio"}
+
+    def on_progress(info):
+        total = max(1, info["total"])
+        text = f"{label}: {stage_names.get(info['stage'], info['stage'])} {info['done']}/{info['total']}"
+        if info.get("fps"):
+            text += f" · {info['fps']:.1f} frames/s"
+        if info.get("eta") is not None:
+            text += f" · ETA {int(info['eta']) // 60}m{int(info['eta']) % 60:02d}s"
+        bar.progress(min(1.0, info["done"] / total), text=text)
+
+    return on_progress
+
+
+def _transcribe(file_path, on_wait=None, stats=None):
+    """Transcribe here, or on an ASR worker when PIPELINE_QUEUE is set."""
+    result = pipeline.dispatch("transcribe", {"audio": file_path}, on_wait=on_wait)
+    if stats is not None:
+        stats.update(result["data"]["stats"])
+    return result["data"]["text"]
+
+
+def _lip_sync(video_path, audio_path, work_dir=None, on_wait=None, preview=None, on_progress=None):
+    """Lip-sync here, or on a GPU worker when PIPELINE_QUEUE is set."""
+    result = pipeline.dispatch(
+        "lipsync",
+        {"video": video_path, "audio": audio_path},
+        {"preview": preview},
+        work_dir=work_dir,
+        on_wait=on_wait,
+        on_progress=on_progress,
     )
-    response = client.automatic_speech_recognition(file_path)
-    return response.text
+    return result["files"]["video"]
+
+
+# Session keys persisted in the job manifest and restored after a restart
+JOB_STATE_KEYS = [
+    "uploaded_path",
+    "transcript",
+    "translation",
+    "segments",
+    "tts_audio",
+    "final_video",
+    "final_lip_synced",
+]
 
 
-def translate_text(text: str, source_lang: str = "en", target_lang: str = "hi") -> str:
-    """Translate text using priority: Groq LLM → LibreTranslate."""
-    if groq_api_key:
-        client = Groq(api_key=groq_api_key)
-        prompt = (
-            f"Translate the following text from {source_lang} to {target_lang}.\n"
-            f"Only return the translated text, nothing else.\n\n{text}"
+def _restore_job(job):
+    """Load a job's persisted pipeline state into the session."""
+    st.session_state.job = job
+    for key in JOB_STATE_KEYS:
+        if key in job["state"]:
+            st.session_state[key] = job["state"][key]
+    # Drop artifacts that vanished from disk so their stages can be redone
+    for key in ("uploaded_path", "tts_audio", "final_video"):
+        path = st.session_state.get(key)
+        if path and not os.path.exists(path):
+            st.session_state[key] = None
+
+
+def _checkpoint_job(stage=None, **artifacts):
+    """Persist current session pipeline state (and optionally complete a stage)."""
+    job = st.session_state.get("job")
+    if job is None:
+        return
+    state = {key: st.session_state.get(key) for key in JOB_STATE_KEYS}
+    if stage is None:
+        job["state"].update(state)
+        jobs.save_job(job)
+    else:
+        jobs.complete_stage(job, stage, artifacts=artifacts, **state)
+
+
+def _queue_notice(label):
+    """Return an `on_wait` callback that shows the user's place in the heavy-job queue."""
+    placeholder = st.empty()
+
+    def on_wait(position):
+        if position == 0:
+            # The wait is over: drop the notice before the stage's own output
+            placeholder.empty()
+            return
+        if settings.pipeline_queue:
+            placeholder.info(f"⏳ Waiting for a {label} worker: position {position} in queue")
+            return
+        load = scheduler.status()
+        placeholder.info(
+            f"⏳ Waiting for a free {label} slot: position {position} in queue "
+            f"({load['running']}/{load['slots']} slots busy)"
         )
-        chat = client.chat.completions.create(
-            model="llama-3.1-8b-instant",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a translation engine. Output only the translated text.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.2,
-        )
-        return chat.choices[0].message.content.strip()
-
-    # Fallback: LibreTranslate public API - free, no key needed
-    api_key = os.getenv("LIBRETRANSLATE_API_KEY", "")
-    base_url = os.getenv("LIBRETRANSLATE_URL", "https://libretranslate.com")
-    url = f"{base_url}/translate"
-    payload = {
-        "q": text,
-        "source": source_lang,
-        "target": target_lang,
-        "format": "text",
-    }
-    headers = {"Content-Type": "application/json"}
-    if api_key:
-        payload["api_key"] = api_key
-    resp = requests.post(url, json=payload, headers=headers, timeout=30)
-    resp.raise_for_status()
-    result = resp.json()
-    if "translatedText" in result:
-        return result["translatedText"]
-    raise ValueError(f"Unexpected LibreTranslate response: {result}")
-
-
-def synthesize_speech(
-    text: str,
-    voice_id: str = "21m00Tcm4TlvDq8ikWAM",
-    model_id: str = "eleven_multilingual_v2",
-) -> str:
-    """Call ElevenLabs TTS, return path to temp wav file."""
-    if not eleven_api_key:
-        raise ValueError("ELEVENLABS_API_KEY is missing; cannot synthesize speech.")
-    safe_text = text if isinstance(text, str) else str(text)
-    safe_text = safe_text.strip()
-    if not safe_text:
-        raise ValueError("TTS text is empty after cleaning.")
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
-    headers = {"xi-api-key": eleven_api_key, "Accept": "audio/mpeg"}
-    payload = {
-        "text": safe_text,
-        "model_id": model_id,
-        "voice_settings": {"stability": 0.5, "similarity_boost": 0.7},
-    }
-    resp = requests.post(url, json=payload, headers=headers, stream=True, timeout=120)
-    if resp.status_code >= 400:
-        raise ValueError(f"TTS request failed ({resp.status_code}): {resp.text[:500]}")
-    tfile = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3")
-    for chunk in resp.iter_content(chunk_size=8192):
-        if chunk:
-            tfile.write(chunk)
-    tfile.close()
-    return tfile.name
-
-
-def replace_audio_track(video_path: str, audio_path: str) -> str:
-    """
-    Replace the audio track of `video_path` with `audio_path` using ffmpeg.
-    This avoids MoviePy set_audio issues on some installs.
-    Returns path to the new video file.
-    """
-    out_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
-    try:
-        video_in = ffmpeg.input(video_path)
-        audio_in = ffmpeg.input(audio_path)
-        (
-            ffmpeg.output(
-                video_in.video,
-                audio_in.audio,
-                out_path,
-                vcodec="copy",
-                acodec="aac",
-                shortest=None,
-            )
-            .overwrite_output()
-            .run(quiet=True)
-        )
-    except ffmpeg.Error as e:
-        # Clean up on error
-        if os.path.exists(out_path):
-            os.unlink(out_path)
-        raise ValueError(
-            f"FFmpeg failed to mux audio: {e.stderr.decode('utf-8', errors='ignore') if hasattr(e, 'stderr') else e}"
-        )
-    return out_path
 
+    return on_wait
 
-def apply_lip_sync(video_path: str, audio_path: str) -> str:
-    """Apply lip sync using local Wav2Lip model; returns path to lip-synced video."""
-    import time as time_module
 
-    # Get absolute paths
-    # Assuming this module is in views/dashboard.py, project root is one level up
-    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    wav2lip_dir = os.path.join(project_dir, "wav2lip")
-    checkpoint_path = os.path.join(wav2lip_dir, "checkpoints", "wav2lip_gan.pth")
+@st.fragment(run_every=2)
+def _await_proxy(path):
+    """Poll until the preview proxy of `path` exists, then rerun the page."""
+    if proxy_media.proxy_failed(path):
+        st.warning("Preview could not be generated; use the download instead.")
+    elif proxy_media.request_proxy(path):
+        st.rerun()
+    else:
+        st.caption("⏳ Preparing a lightweight preview...")
 
-    if not os.path.exists(checkpoint_path):
-        raise ValueError(
-            f"Wav2Lip model not found at {checkpoint_path}. Run 'python download_models.py' first."
-        )
 
-    # Create temp directories if needed
-    temp_dir = os.path.join(wav2lip_dir, "temp")
-    results_dir = os.path.join(wav2lip_dir, "results")
-    os.makedirs(temp_dir, exist_ok=True)
-    os.makedirs(results_dir, exist_ok=True)
-
-    # Output file path
-    output_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
-
-    # Convert audio to wav if needed (Wav2Lip requires wav)
-    if not audio_path.endswith(".wav"):
-        wav_path = tempfile.NamedTemporaryFile(delete=False, suffix=".wav").name
-        try:
-            (
-                ffmpeg.input(audio_path)
-                .output(wav_path, acodec="pcm_s16le", ar="16000", ac=1)
-                .overwrite_output()
-                .run(quiet=True)
-            )
-            audio_path = wav_path
-        except Exception as e:
-            raise ValueError(f"Failed to convert audio to wav: {e}")
-
-    # Build the command to run Wav2Lip inference
-    inference_script = os.path.join(wav2lip_dir, "inference.py")
-
-    # Use Python 3.11 explicitly (Python 3.14 has NumPy 2.x incompatibility with OpenCV)
-    # We should try to use the currently running python executable first if it works, or fallback
-    python_exe = sys.executable
-
-    cmd = [
-        python_exe,
-        inference_script,
-        "--checkpoint_path",
-        checkpoint_path,
-        "--face",
-        video_path,
-        "--audio",
-        audio_path,
-        "--outfile",
-        output_path,
-        "--pads",
-        "0",
-        "10",
-        "0",
-        "0",
-        "--resize_factor",
-        "3",  # Resize to reduce memory for 720p+ videos
-        "--wav2lip_batch_size",
-        "1",  # Minimum batch size for memory efficiency
-        "--face_det_batch_size",
-        "1",  # Minimum face detection batch size
-    ]
-
-    # Run the inference
-    try:
-        # Detect whether CUDA is available in the Python executable we will call
-        gpu_available = False
-        try:
-            check = subprocess.run(
-                [python_exe, "-c", "import torch;print(1 if torch.cuda.is_available() else 0)"],
-                capture_output=True,
-                text=True,
-                cwd=wav2lip_dir,
-                timeout=10,
-            )
-            gpu_available = check.stdout.strip() == "1"
-        except Exception:
-            gpu_available = False
-
-        # Give more time if running on CPU-only systems
-        timeout_seconds = 1800 if gpu_available else 3600
-
-        result = subprocess.run(
-            cmd,
-            cwd=wav2lip_dir,
-            capture_output=True,
-            text=True,
-            timeout=timeout_seconds,
-        )
+def _preview_media(path):
+    """Show the low-bitrate proxy of `path` (built in the background on first use)."""
+    proxy = proxy_media.request_proxy(path)
+    if proxy is None:
+        _await_proxy(path)
+    elif proxy.endswith(".mp4"):
+        st.video(proxy)
+    else:
+        st.audio(proxy)
 
-        # Always save stdout/stderr for later inspection
-        timestamp = int(time_module.time())
-        log_path = os.path.join(results_dir, f"inference_{timestamp}.log")
-        with open(log_path, "w", encoding="utf-8") as f:
-            f.write("=== STDOUT ===\n")
-            f.write(result.stdout or "")
-            f.write("\n=== STDERR ===\n")
-            f.write(result.stderr or "")
-
-        if result.returncode != 0:
-            # If the process returned non-zero but produced a valid output file, accept it and warn
-            if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
-                st.warning(
-                    f"Wav2Lip returned non-zero exit code but produced an output file; see {log_path} for details"
-                )
-            else:
-                error_msg = (
-                    f"STDOUT:\n{result.stdout}\n\nSTDERR:\n{result.stderr}"
-                    if (result.stdout or result.stderr)
-                    else "Unknown error"
-                )
-                raise ValueError(f"Wav2Lip inference failed:\n{error_msg}\nLogs: {log_path}")
-
-        if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
-            raise ValueError(f"Wav2Lip produced no output or empty file. See logs: {log_path}")
-
-    except subprocess.TimeoutExpired:
-        raise ValueError(f"Wav2Lip inference timed out after {timeout_seconds//60} minutes")
-    except Exception as e:
-        raise ValueError(f"Wav2Lip inference error: {e}")
 
-    return output_path
+def _download_on_request(label, path, file_name, mime, key):
+    """Send the full-quality file only after the user asks for it."""
+    if st.button(f"Prepare download: {label}", key=key):
+        with open(path, "rb") as f:
+            st.download_button(
+                f"Download {label}", data=f, file_name=file_name, mime=mime
+            )
 
 
 def show_dashboard():
@@ -400,25 +193,44 @@ def show_dashboard():
         st.session_state.final_video = None
     if "uploaded_path" not in st.session_state:
         st.session_state.uploaded_path = None
+    if "segments" not in st.session_state:
+        st.session_state.segments = []
+    if "final_lip_synced" not in st.session_state:
+        st.session_state.final_lip_synced = False
+    if "lipsync_preview" not in st.session_state:
+        st.session_state.lipsync_preview = None
+    if "job" not in st.session_state:
+        st.session_state.job = None
+        # Resume a job after a restart: its id lives in the URL
+        job = jobs.load_job(st.query_params.get("job"))
+        if job is not None:
+            _restore_job(job)
+            st.toast(
+                f"Resumed job {job['id']} (last completed stage: "
+                f"{jobs.last_completed_stage(job) or 'none'})"
+            )
 
     # Sidebar for controls
     with st.sidebar:
         st.header("Video Processing")
         st.info(
-            "**ASR:** Groq Whisper (if key) → HF Whisper → Local | **Translation:** Groq LLM (if key) → LibreTranslate"
+            "**ASR:** Local (if USE_LOCAL_ASR) → Groq Whisper (if key) → HF Whisper → Local | "
+            f"**Translation:** `{translation.resolve_backend()}` backend"
         )
 
-        if groq_api_key:
+        if settings.groq_api_key:
             st.success("✅ GROQ_API_KEY set (ASR + Translation available)")
-        if hf_token:
+        if settings.hf_token:
             st.success("✅ HF Token Loaded (for Whisper)")
-        elif not groq_api_key and not use_local_asr:
+        elif not settings.groq_api_key and not settings.use_local_asr:
             st.warning(
                 "⚠️ No ASR creds: set GROQ_API_KEY or HF_TOKEN or USE_LOCAL_ASR=true"
             )
 
-        libretranslate_key = os.getenv("LIBRETRANSLATE_API_KEY", "")
-        if libretranslate_key:
+        libretranslate_key = settings.libretranslate_api_key
+        if translation.resolve_backend() == "local":
+            st.success("✅ Offline translation (local CTranslate2 model)")
+        elif libretranslate_key:
             st.success("✅ LibreTranslate API Key (higher limits)")
         else:
             st.info("ℹ️ Using LibreTranslate public API (free, rate-limited)")
@@ -432,8 +244,25 @@ def show_dashboard():
         )
         st.markdown("---")
         st.subheader("TTS Settings")
-        voice_id_input = st.text_input("ElevenLabs voice_id", value=default_voice_id)
-        tts_model_input = st.text_input("ElevenLabs model_id", value=default_tts_model)
+        tts_backend_input = st.selectbox(
+            "TTS engine", ["auto"] + sorted(tts.BACKENDS), help="auto: ElevenLabs if a key is set, else local MMS-TTS"
+        )
+        voice_id_input = st.text_input("ElevenLabs voice_id", value=settings.default_voice_id)
+        tts_model_input = st.text_input(
+            "Model id (ElevenLabs model, or an MMS-TTS checkpoint)",
+            value=settings.default_tts_model,
+        )
+        for name, total in pipeline.tts_stats().items():
+            st.caption(
+                f"TTS {name}: RTF {total['rtf']} over {total['segments']} segments "
+                f"({total['audio_seconds']:.0f}s audio)"
+            )
+
+        load = scheduler.status()
+        st.caption(
+            f"Heavy jobs: {load['running']}/{load['slots']} running, "
+            f"{load['waiting']} queued ({load['threads_per_job']} CPU threads each)"
+        )
 
         st.markdown("---")
         st.subheader("Lip Sync Settings")
@@ -444,10 +273,15 @@ def show_dashboard():
             # Checkpoint path logic based on new project structure
             # Assuming we need to stay consistent with original logic but updated paths
             project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-            checkpoint_path = os.path.join(
-                project_dir, "wav2lip/checkpoints/wav2lip_gan.pth"
-            )
-            if os.path.exists(checkpoint_path):
+            try:
+                checkpoint_path = model_registry.model_path(
+                    "wav2lip_gan",
+                    default=os.path.join(project_dir, "wav2lip/checkpoints/wav2lip_gan.pth"),
+                )
+            except ValueError as e:
+                checkpoint_path = None
+                st.error(f"⚠️ {e}")
+            if checkpoint_path:
                 st.success("✅ Lip sync enabled with local Wav2Lip")
             else:
                 st.warning(
@@ -465,24 +299,37 @@ def show_dashboard():
             "Upload Video or Audio", type=["mp4", "mov", "avi", "mp3", "wav"]
         )
 
-        if uploaded_file is not None:
-            # Save uploaded file to temp
-            tfile = tempfile.NamedTemporaryFile(
-                delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}"
-            )
-            tfile.write(uploaded_file.read())
-            file_path = tfile.name
-            st.session_state.uploaded_path = file_path
-
-            if file_path.endswith((".mp4", ".mov", ".avi")):
-                st.video(file_path)
-            else:
-                st.audio(file_path)
+        job = st.session_state.job
+        if uploaded_file is not None and (
+            job is None or job.get("upload_id") != uploaded_file.file_id
+        ):
+            # New upload: start a job and save the file into its directory once
+            job = jobs.create_job(uploaded_file.name)
+            job["upload_id"] = uploaded_file.file_id
+            ext = uploaded_file.name.split(".")[-1]
+            upload_path = jobs.job_path(job, f"input.{ext}")
+            with open(upload_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
+            for key in JOB_STATE_KEYS:
+                st.session_state[key] = None
+            st.session_state.segments = []
+            st.session_state.final_lip_synced = False
+            st.session_state.lipsync_preview = None
+            st.session_state.uploaded_path = upload_path
+            st.session_state.job = job
+            _checkpoint_job("upload", input=upload_path)
+            st.query_params["job"] = job["id"]
+
+        file_path = st.session_state.uploaded_path
+        if file_path:
+            if job is not None and uploaded_file is None:
+                st.caption(f"Restored input of job `{job['id']}`")
+            _preview_media(file_path)
 
     with col2:
         st.subheader("2. Transcribed Output 📜")
 
-        if uploaded_file is not None:
+        if file_path:
             if st.button("📝 Extract Text", type="primary"):
                 with st.status("Processing...", expanded=True) as status:
                     try:
@@ -491,15 +338,39 @@ def show_dashboard():
                         if file_path.endswith((".mp4", ".mov", ".avi")):
                             st.write("Creating Audio file (MP3)...")
                             process_path = extract_audio(file_path)
+                            _checkpoint_job("extract", audio=process_path)
 
                         # 2. Transcribe
-                        st.write("Sending to Hugging Face API...")
-                        text = transcribe_audio(process_path)
+                        st.write(
+                            "Transcribing locally..."
+                            if settings.use_local_asr
+                            else "Sending to ASR API..."
+                        )
+                        asr_stats = {}
+                        text = _transcribe(
+                            process_path,
+                            on_wait=_queue_notice("local ASR"),
+                            stats=asr_stats,
+                        )
+                        if asr_stats.get("engine") in ("groq", "hf"):
+                            st.caption(
+                                f"Uploaded {asr_stats['upload_bytes'] / 1e6:.1f} MB "
+                                f"of Opus audio in {asr_stats['parts']} part(s) "
+                                f"(source {asr_stats['source_bytes'] / 1e6:.1f} MB)"
+                            )
+                        elif asr_stats:
+                            st.caption(
+                                f"Local ASR: model `{asr_stats['model_size']}`, "
+                                f"{asr_stats['audio_seconds']}s audio in "
+                                f"{asr_stats['elapsed_seconds']}s "
+                                f"(real-time factor {asr_stats['rtf']})"
+                            )
 
                         status.update(label="Done!", state="complete", expanded=False)
 
                         st.success("Transcription Complete!")
                         st.session_state.transcript = text
+                        _checkpoint_job("transcribe")
                         st.text_area("Extracted Speech:", value=text, height=300)
 
                     except Exception as e:
@@ -518,9 +389,17 @@ def show_dashboard():
             if st.button("🌐 Translate Transcript"):
                 with st.status("Translating...", expanded=True) as status:
                     try:
-                        st.write("Calling translation model...")
-                        translated = translate_text(st.session_state.transcript)
+                        st.write("Calling translation model per segment...")
+                        # Unchanged sentences keep their (possibly edited) translation
+                        segments = redub.build_segments(
+                            st.session_state.transcript,
+                            translation.translate_batch,
+                            previous=st.session_state.segments,
+                        )
+                        st.session_state.segments = segments
+                        translated = " ".join(seg["text"] for seg in segments)
                         st.session_state.translation = translated
+                        _checkpoint_job("translate")
                         status.update(
                             label="Translation done", state="complete", expanded=False
                         )
@@ -530,30 +409,70 @@ def show_dashboard():
                         st.error(f"Translation failed: {e}")
         else:
             st.info("Transcription required before translation.")
+        if st.session_state.segments:
+            with st.expander("✏️ Edit translation by segment"):
+                st.caption(
+                    "Only edited segments are re-synthesized and re-lip-synced."
+                )
+                for seg in st.session_state.segments:
+                    edited = st.text_area(
+                        f"Segment {seg['id'] + 1}: {seg['source']}",
+                        value=seg["text"],
+                        key=f"segment_text_{seg['id']}_{seg['source_key']}",
+                    )
+                    if edited.strip() and edited.strip() != seg["text"]:
+                        seg["text"] = edited.strip()
+                        _checkpoint_job()
+                st.session_state.translation = " ".join(
+                    seg["text"] for seg in st.session_state.segments
+                )
         st.markdown("**TTS for translated audio**")
         if st.session_state.translation:
             if st.button("🔊 Synthesize TTS"):
                 with st.status("Synthesizing speech...", expanded=True) as status:
                     try:
-                        st.write("Calling ElevenLabs TTS...")
-                        tts_path = synthesize_speech(
-                            st.session_state.translation,
-                            voice_id=voice_id_input,
-                            model_id=tts_model_input,
+                        work_dir = (
+                            jobs.stage_dir(st.session_state.job, "tts")
+                            if st.session_state.job
+                            else None
+                        )
+                        segments = st.session_state.segments
+                        dirty = redub.dirty_segments(
+                            segments, voice_id_input, tts_model_input
                         )
+                        backend = tts.resolve_backend(tts_backend_input)
+                        st.write(
+                            f"Synthesizing {len(dirty)} of {len(segments)} segments with {backend}..."
+                        )
+                        tts_stats = {}
+                        # Each finished batch is checkpointed so a restart
+                        # only re-synthesizes the remaining segments
+                        redub.synthesize_segments(
+                            segments,
+                            functools.partial(
+                                synthesize_clips,
+                                backend=backend,
+                                work_dir=work_dir,
+                                on_wait=_queue_notice("TTS"),
+                                stats=tts_stats,
+                            ),
+                            voice_id_input,
+                            tts_model_input,
+                            work_dir=work_dir,
+                            on_segment=lambda seg: _checkpoint_job(),
+                        )
+                        if tts_stats:
+                            st.caption(
+                                f"TTS {tts_stats['backend']}: {tts_stats['audio_seconds']}s audio "
+                                f"in {tts_stats['elapsed_seconds']}s (real-time factor {tts_stats['rtf']})"
+                            )
+                        tts_path = redub.build_dub_audio(segments, work_dir=work_dir)
                         st.session_state.tts_audio = tts_path
+                        _checkpoint_job("tts", audio=tts_path)
                         status.update(
                             label="TTS done", state="complete", expanded=False
                         )
-                        st.success("TTS ready")
-                        st.audio(tts_path)
-                        with open(tts_path, "rb") as f:
-                            st.download_button(
-                                "Download translated audio (MP3)",
-                                data=f,
-                                file_name="translated_audio.mp3",
-                                mime="audio/mpeg",
-                            )
+                        st.success("TTS ready (preview under Saved results)")
                     except Exception as e:
                         st.error(f"TTS failed: {e}")
         else:
@@ -565,43 +484,129 @@ def show_dashboard():
         st.info(
             "Placeholder: detect + overlay translated text; later inpaint & style match."
         )
+        if (
+            enable_lip_sync
+            and st.session_state.uploaded_path
+            and st.session_state.tts_audio
+        ):
+            st.markdown("**Preview lip sync before the full render**")
+            preview_mode = st.radio(
+                "Preview",
+                ["Short window", "Whole clip (low-res, reduced fps)"],
+                horizontal=True,
+            )
+            preview = {"height": settings.lipsync_preview_height}
+            if preview_mode == "Short window":
+                dub_length = sum(
+                    seg["duration"] or 0.0 for seg in st.session_state.segments
+                )
+                # A slider needs min < max; a dub this short previews from 0
+                preview["start"] = 0.0
+                if dub_length > 1.0:
+                    preview["start"] = st.slider(
+                        "Window start (s)",
+                        0.0,
+                        dub_length - 1.0,
+                        0.0,
+                        step=0.5,
+                    )
+                preview["duration"] = float(
+                    st.slider("Window length (s)", 2, 20, 5)
+                )
+            else:
+                preview["frame_step"] = settings.lipsync_preview_frame_step
+            if st.button("👀 Preview lip sync"):
+                with st.status("Rendering preview...", expanded=True) as status:
+                    try:
+                        job = st.session_state.job
+                        preview_video = _lip_sync(
+                            st.session_state.uploaded_path,
+                            st.session_state.tts_audio,
+                            work_dir=jobs.stage_dir(job, "video") if job else None,
+                            on_wait=_queue_notice("lip-sync"),
+                            preview=preview,
+                            on_progress=_progress_bar("Preview"),
+                        )
+                        status.update(
+                            label="Preview ready", state="complete", expanded=False
+                        )
+                        st.session_state.lipsync_preview = preview_video
+                    except Exception as e:
+                        st.error(f"Preview failed: {e}")
+            preview_video = st.session_state.lipsync_preview
+            if preview_video and os.path.exists(preview_video):
+                _preview_media(preview_video)
+                st.caption(
+                    "Happy with it? Run the full render below; it reuses "
+                    "this preview's face detections."
+                )
+
         st.markdown("**Replace audio track with synthesized speech**")
         if st.session_state.uploaded_path and st.session_state.tts_audio:
+            job = st.session_state.job
+            if job is not None and "video" in jobs.interrupted_stages(job):
+                st.info(
+                    "A previous lip-sync run was interrupted. Click below to resume "
+                    "from its last checkpoint."
+                )
             if st.button("🎞️ Replace audio in video"):
                 with st.status("Processing video...", expanded=True) as status:
                     try:
+                        work_dir = jobs.stage_dir(job, "video") if job else None
+                        if job is not None:
+                            jobs.start_stage(job, "video", lip_sync=enable_lip_sync)
+                        lip_sync_fn = functools.partial(
+                            _lip_sync,
+                            work_dir=work_dir,
+                            on_wait=_queue_notice("lip-sync"),
+                            on_progress=_progress_bar("Lip sync"),
+                        )
                         # Apply lip sync if enabled (uses ORIGINAL video + TTS audio)
-                        if enable_lip_sync:
+                        segments = st.session_state.segments
+                        if (
+                            enable_lip_sync
+                            and st.session_state.final_lip_synced
+                            and st.session_state.final_video
+                        ):
+                            stale = redub.needs_lip_sync(segments)
+                            st.write(
+                                f"Re-syncing {len(stale)} edited segment(s) with Wav2Lip..."
+                            )
+                            output_video = redub.splice_lip_sync(
+                                st.session_state.uploaded_path,
+                                st.session_state.final_video,
+                                segments,
+                                st.session_state.tts_audio,
+                                lip_sync_fn,
+                                work_dir=work_dir,
+                            )
+                        elif enable_lip_sync:
                             st.write("Applying lip sync with Wav2Lip...")
                             # Lip sync should use the ORIGINAL video, not the audio-replaced one
                             # Wav2Lip will embed the audio into the output video
-                            output_video = apply_lip_sync(
+                            output_video = lip_sync_fn(
                                 st.session_state.uploaded_path,
                                 st.session_state.tts_audio,
                             )
+                            redub.mark_synced(segments)
                         else:
                             # No lip sync, just replace audio track
                             st.write("Combining video + synthesized audio...")
                             output_video = replace_audio_track(
                                 st.session_state.uploaded_path,
                                 st.session_state.tts_audio,
+                                work_dir=work_dir,
                             )
 
                         st.session_state.final_video = output_video
+                        st.session_state.final_lip_synced = enable_lip_sync
+                        _checkpoint_job("video", video=output_video)
                         status.update(
                             label="Processing complete",
                             state="complete",
                             expanded=False,
                         )
-                        st.success("New video ready")
-                        st.video(output_video)
-                        with open(output_video, "rb") as f:
-                            st.download_button(
-                                "Download video with translated audio",
-                                data=f,
-                                file_name="translated_video.mp4",
-                                mime="video/mp4",
-                            )
+                        st.success("New video ready (preview under Saved results)")
                     except Exception as e:
                         st.error(f"Processing failed: {e}")
         else:
@@ -629,3 +634,32 @@ def show_dashboard():
             key="translation_persist",
             disabled=True,
         )
+
+    # Previews use lightweight proxies; full-quality artifacts only leave the
+    # server on an explicit download
+    tts_audio = st.session_state.tts_audio
+    final_video = st.session_state.final_video
+    if tts_audio or final_video:
+        col7, col8 = st.columns(2)
+        with col7:
+            if tts_audio and os.path.exists(tts_audio):
+                st.markdown("**Translated audio**")
+                _preview_media(tts_audio)
+                _download_on_request(
+                    "translated audio (WAV)",
+                    tts_audio,
+                    "translated_audio.wav",
+                    "audio/wav",
+                    key="prepare_audio_download",
+                )
+        with col8:
+            if final_video and os.path.exists(final_video):
+                st.markdown("**Translated video**")
+                _preview_media(final_video)
+                _download_on_request(
+                    "video with translated audio",
+                    final_video,
+                    "translated_video.mp4",
+                    "video/mp4",
+                    key="prepare_video_download",
+                )
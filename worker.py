@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Pipeline worker: claims tasks from the shared work queue and runs them.
+
+Each worker advertises the capabilities its machine has (a GPU box runs
+`lipsync`, a CPU box `asr`/`media`/`tts-local`, anything with network
+access `api`).
+Claimed tasks are leased: the worker heartbeats every lease/3 seconds with
+the task's latest progress, and a worker that dies simply lets its lease
+expire so another worker picks the task up. Inputs and outputs move as
+artifact refs, so workers need the same artifact store volume
+(ARTIFACT_STORE_DIR); lip-sync checkpoints and face caches are kept there
+too, keyed by the input refs, so a retried task resumes on any machine.
+A worker that loses a lease never reports that task: lip sync is cancelled
+at once, other stages get one more lease period to finish before they are
+abandoned. A result the broker can't take is left to the lease as well.
+
+    WORK_BROKER_TOKEN=... python utils/work_queue.py broker --host 0.0.0.0 --port 7700
+    WORK_BROKER_TOKEN=... PIPELINE_QUEUE=tcp://queue-host:7700 python worker.py --capabilities lipsync
+"""
+import argparse
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import traceback
+
+import utils.work_queue as work_queue
+from utils.pipeline import execute_task
+from utils.settings import get_settings
+
+_settings = get_settings()
+
+POLL_SECONDS = _settings.worker_poll_seconds
+
+
+class LeaseLost(Exception):
+    """Raised inside a running stage once this worker no longer owns its task."""
+
+
+def run_task(queue_, task, worker_id, lease_seconds):
+    """Run one claimed task, heartbeating until it finishes."""
+    work_dir = tempfile.mkdtemp(prefix=f"task{task['id']}_")
+    progress = {}
+    outcome = {}
+    lost = threading.Event()
+
+    def on_progress(info):
+        # Raising here makes the lip-sync runner kill its subprocess
+        if lost.is_set():
+            raise LeaseLost(f"lease on task {task['id']} lost")
+        progress.update(info)
+
+    def target():
+        try:
+            outcome["result"] = execute_task(task, work_dir, on_progress=on_progress)
+        except Exception as e:
+            if lost.is_set():
+                return
+            # ValueErrors are user-facing input problems; retrying won't help.
+            # Anything else (a stalled or crashed Wav2Lip, IO errors) is retried.
+            outcome["error"] = f"{type(e).__name__}: {e}"
+            outcome["retry"] = not isinstance(e, ValueError)
+            traceback.print_exc()
+        finally:
+            # The stage may outlive run_task after a lost lease, so it cleans up itself
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    runner = threading.Thread(target=target, daemon=True, name=f"task-{task['id']}")
+    runner.start()
+    while runner.is_alive():
+        runner.join(lease_seconds / 3)
+        if not runner.is_alive():
+            break
+        try:
+            held = queue_.heartbeat(task["id"], worker_id, lease_seconds, dict(progress) or None)
+        except OSError as e:
+            # Broker blip: keep working; the next heartbeat tells us if the lease ran out
+            print(f"[worker] heartbeat for task {task['id']} failed ({e})")
+            continue
+        if not held:
+            # Lease lost (e.g. we were partitioned away); someone else owns it
+            # now. Lip sync is cancelled through on_progress; other stages
+            # can't be interrupted, so give them one lease to stop and then
+            # abandon them. Either way their result is never reported.
+            print(f"[worker] lost lease on task {task['id']}; dropping it")
+            lost.set()
+            runner.join(lease_seconds)
+            if runner.is_alive():
+                print(f"[worker] task {task['id']} still running; abandoning it")
+            return
+    try:
+        if "result" in outcome:
+            queue_.complete(task["id"], worker_id, outcome["result"])
+            print(f"[worker] task {task['id']} ({task['kind']}) done")
+        else:
+            queue_.fail(task["id"], worker_id, outcome["error"], retry=outcome["retry"])
+            print(f"[worker] task {task['id']} ({task['kind']}) failed: {outcome['error']}")
+    except OSError as e:
+        # complete/fail are not replayed; the lease runs out and the task is re-run elsewhere
+        print(f"[worker] could not report task {task['id']} ({e}); leaving it to its lease")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run pipeline tasks from the work queue")
+    parser.add_argument(
+        "--queue",
+        default=_settings.pipeline_queue,
+        help='"tcp://host:port" broker or SQLite path (default: PIPELINE_QUEUE or jobs/queue.db)',
+    )
+    parser.add_argument(
+        "--capabilities",
+        default=_settings.worker_capabilities,
+        help="comma-separated subset of: " + ", ".join(work_queue.CAPABILITIES),
+    )
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--lease-seconds", type=int, default=work_queue.LEASE_SECONDS)
+    args = parser.parse_args()
+
+    capabilities = [c.strip() for c in args.capabilities.split(",") if c.strip()]
+    known = set(work_queue.CAPABILITIES)
+    unknown = [c for c in capabilities if c not in known]
+    if unknown:
+        parser.error(f"unknown capabilities: {', '.join(unknown)}")
+
+    queue_ = work_queue.connect(args.queue)
+    print(f"[worker] {args.worker_id} serving {', '.join(capabilities)}")
+    while True:
+        try:
+            task = queue_.claim(args.worker_id, capabilities, args.lease_seconds)
+        except OSError as e:
+            print(f"[worker] queue unavailable ({e}); retrying")
+            time.sleep(POLL_SECONDS * 5)
+            continue
+        if task is None:
+            time.sleep(POLL_SECONDS)
+            continue
+        print(f"[worker] task {task['id']} ({task['kind']}), attempt {task['attempts']}")
+        run_task(queue_, task, args.worker_id, args.lease_seconds)
+
+
+if __name__ == "__main__":
+    main()